@@ -1,15 +1,54 @@
 # -*- coding: utf-8 -*-
 import streamlit as st
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
-from datetime import datetime, timedelta
-from PIL import Image
-import io
-import re
-import os
-from typing import Optional, Dict, Any
+from datetime import datetime
+from typing import Optional, Dict, Any, List
 from zoneinfo import ZoneInfo
+import re
+import threading
+
+# Settings, naming, Drive, uploads, spool, manifests and catalog live in
+# weed_collector.py; this file only draws the page.
+from weed_collector import (
+    CONF_LEVEL_OPTIONS,
+    GROWTH_STAGE_OPTIONS,
+    HEIGHTS,
+    HEIGHT_MAP,
+    HERBICIDE_30D_OPTIONS,
+    PATCH_SIZE_OPTIONS,
+    PRIORITY_INTERACTIVE,
+    SET_GAP_SEC,
+    THUMB_SETS_PER_PAGE,
+    TURF_OPTIONS,
+    TZ_OPTIONS,
+    USE_UPLOAD_SPOOL,
+    UploadCancelled,
+    UploadProgress,
+    build_batch_jobs,
+    build_set_jobs,
+    format_meta_for_status,
+    get_capture_store,
+    get_catalog,
+    get_drive_service,
+    get_rate_limiter,
+    get_stage_metrics,
+    get_thumbnail_sheet,
+    get_upload_spool,
+    group_sets_by_capture_time,
+    guess_ext,
+    ingest_jobs,
+    make_filename,
+    make_manifest_record,
+    normalize_optional,
+    now_timestamp_str,
+    probe_capture_times,
+    reconcile_duplicate_folders,
+    slugify,
+    sync_catalog,
+    transcode_camera_image,
+    try_get_image_size,
+    unique_set_timestamps,
+    upload_jobs_to_zip_date_folder,
+)
 
 # ------------------------------------------
 # Optional: Rear camera component (iPad-friendly)
@@ -21,11 +60,6 @@ try:
 except Exception:
     BACK_CAM_AVAILABLE = False
 
-# ==========================================
-# Settings
-# ==========================================
-PARENT_FOLDER_ID = "12WeFmWCJ1RJE-kAzZdzeetp6Hqc32IcX"
-
 st.set_page_config(
     page_title="GWU Turfgrass Lab",
     page_icon="🌿",
@@ -170,14 +204,16 @@ def init_session():
         st.session_state.height_captures = {}
     if "drive_service" not in st.session_state:
         st.session_state.drive_service = None
-    if "parent_drive_id" not in st.session_state:
-        st.session_state.parent_drive_id = None
-    if "parent_drive_checked" not in st.session_state:
-        st.session_state.parent_drive_checked = False
-    if "folder_cache" not in st.session_state:
-        st.session_state.folder_cache = {}
     if "rear_cam_nonce" not in st.session_state:
         st.session_state.rear_cam_nonce = 0
+    if "queued_sets" not in st.session_state:
+        st.session_state.queued_sets = []
+    if "capture_time_cache" not in st.session_state:
+        st.session_state.capture_time_cache = {}
+    if "active_upload" not in st.session_state:
+        st.session_state.active_upload = None
+    if "batch_results" not in st.session_state:
+        st.session_state.batch_results = None
 
     if "form_step" not in st.session_state:
         st.session_state.form_step = 0
@@ -194,143 +230,8 @@ def init_session():
 init_session()
 
 # -------------------------
-# Constants
+# Form helpers
 # -------------------------
-FOLDER_MIME = "application/vnd.google-apps.folder"
-
-HEIGHTS = [
-    ("1 m", "H1m"),
-    ("50 cm", "H50cm"),
-    ("20 cm", "H20cm"),
-]
-HEIGHT_MAP = dict(HEIGHTS)
-
-TZ_OPTIONS = {
-    "EST": "America/New_York",
-    "CST": "America/Chicago",
-    "MST": "America/Denver",
-    "PST": "America/Los_Angeles",
-}
-
-TURF_OPTIONS = [
-    ("PG", "Putting Green"),
-    ("Tees", "Tees"),
-    ("Fairway", "Fairway"),
-    ("Rough", "Rough"),
-]
-
-SKIP = "(skip / optional)"
-CONF_LEVEL_OPTIONS = [SKIP, "High", "Medium", "Low"]
-GROWTH_STAGE_OPTIONS = [SKIP, "Seedling", "Vegetative", "Flowering", "Seed set", "Senescent"]
-PATCH_SIZE_OPTIONS = [SKIP, "0-10cm", "10-30cm", "30-100cm", "<1m"]
-HERBICIDE_30D_OPTIONS = [SKIP, "Yes", "No"]
-
-PATCH_CODE_MAP = {
-    "0-10cm": "P0_10cm",
-    "10-30cm": "P10_30cm",
-    "30-100cm": "P30_100cm",
-    "<1m": "Plt1m",
-}
-
-# -------------------------
-# Helpers
-# -------------------------
-def slugify(text: str, max_len: int = 40) -> str:
-    if text is None:
-        return "NA"
-    text = text.strip()
-    if not text:
-        return "NA"
-    text = text.replace(" ", "_")
-    text = re.sub(r"[^A-Za-z0-9_\-]+", "", text)
-    return text[:max_len] if len(text) > max_len else text
-
-def normalize_optional(value: Optional[str]) -> Optional[str]:
-    if value is None:
-        return None
-    v = str(value).strip()
-    if not v or v == SKIP:
-        return None
-    return v
-
-def guess_ext(mimetype: str, original_name: Optional[str] = None) -> str:
-    mt = (mimetype or "").lower()
-    if "jpeg" in mt or "jpg" in mt:
-        return "jpg"
-    if "png" in mt:
-        return "png"
-    if "heic" in mt or "heif" in mt:
-        return "heic"
-    if original_name:
-        _, ext = os.path.splitext(original_name)
-        if ext:
-            return ext.lstrip(".").lower()
-    return "jpg"
-
-def now_timestamp_str(tz_name: str) -> str:
-    return datetime.now(ZoneInfo(tz_name)).strftime("%Y%m%d_%H%M%S")
-
-def try_get_image_size(image_bytes: bytes):
-    try:
-        img = Image.open(io.BytesIO(image_bytes))
-        return img, img.size[0], img.size[1]
-    except Exception:
-        return None, None, None
-
-def format_meta_for_status(meta: Dict[str, Any]) -> str:
-    if not meta:
-        return ""
-    conf = normalize_optional(meta.get("confidence"))
-    stage = normalize_optional(meta.get("growth_stage"))
-    patch = normalize_optional(meta.get("patch_size"))
-    herb = normalize_optional(meta.get("herbicide_30d"))
-    bits = []
-    if conf:
-        bits.append(f"Conf: {conf}")
-    if stage:
-        bits.append(f"Stage: {stage}")
-    if patch:
-        bits.append(f"Patch: {patch}")
-    if herb:
-        bits.append(f"Herb: {herb}")
-    return ", ".join(bits)
-
-def make_filename(
-    turf_setting: str,
-    grass_type: str,
-    weed_name: str,
-    height_tag: str,
-    mimetype: str,
-    set_timestamp: str,
-    original_name: Optional[str] = None,
-    meta: Optional[Dict[str, Any]] = None,
-) -> str:
-    meta = meta or {}
-
-    turf_part = slugify(turf_setting.replace(" ", ""))
-    grass_part = slugify(grass_type)
-    weed_part = slugify(weed_name)
-    ext = guess_ext(mimetype, original_name)
-
-    parts = [turf_part, grass_part, weed_part, height_tag, set_timestamp]
-
-    conf = normalize_optional(meta.get("confidence"))
-    stage = normalize_optional(meta.get("growth_stage"))
-    patch = normalize_optional(meta.get("patch_size"))
-    herb = normalize_optional(meta.get("herbicide_30d"))
-
-    if conf:
-        parts.append(slugify(f"Conf{conf}", max_len=18))
-    if stage:
-        parts.append(slugify(f"Stage{stage}", max_len=22))
-    if patch:
-        patch_code = PATCH_CODE_MAP.get(patch, slugify(f"P{patch}", max_len=18))
-        parts.append(slugify(patch_code, max_len=18))
-    if herb:
-        parts.append(slugify(f"Herb{herb}", max_len=12))
-
-    return f"{'_'.join(parts)}.{ext}"
-
 def go_to_step(step: int):
     st.session_state.form_step = step
     st.rerun()
@@ -394,120 +295,169 @@ def close_step_card():
     st.markdown("</div>", unsafe_allow_html=True)
 
 # -------------------------
-# Drive helpers
+# Panels
 # -------------------------
-def get_drive_service():
-    if st.session_state.drive_service is not None:
-        return st.session_state.drive_service
-
-    gcp_info = st.secrets["gcp_service_account"]
-    creds = service_account.Credentials.from_service_account_info(
-        gcp_info,
-        scopes=["https://www.googleapis.com/auth/drive"]
+def render_upload_queue_status():
+    spool = get_upload_spool()
+    counts = spool.counts()
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Queued", counts["pending"])
+    c2.metric("Uploading", counts["uploading"])
+    c3.metric("Done", counts["done"])
+    c4.metric("Failed", counts["failed"])
+
+    for set_id, label in reversed(st.session_state.queued_sets[-5:]):
+        rows = spool.set_status(set_id)
+        done = sum(1 for row in rows if row["status"] == "done")
+        st.write(f"- {label}: **{done}/{len(rows)}** uploaded")
+        for row in rows:
+            if row["status"] == "failed" or (row["status"] == "pending" and row["last_error"]):
+                st.caption(f"{row['filename']}: {row['status']} ({row['last_error']})")
+
+    if counts["failed"]:
+        if st.button("Retry failed uploads", key="btn_retry_failed_spool", use_container_width=True):
+            spool.retry_failed()
+            st.rerun()
+
+def start_batch_upload(jobs: List[Dict[str, Any]], zipcode: str, tz_name: str):
+    # Uploads in a background thread so the page can show progress and a
+    # Cancel button while it runs; the thread only touches the upload dict.
+    progress = UploadProgress(jobs)
+    upload: Dict[str, Any] = {"progress": progress, "results": [], "error": None}
+
+    def run():
+        try:
+            upload["results"] = ingest_jobs(jobs, zipcode, tz_name, progress=progress)
+        except Exception as e:
+            upload["error"] = e
+
+    upload["thread"] = threading.Thread(target=run, name="batch-upload", daemon=True)
+    upload["thread"].start()
+    st.session_state.active_upload = upload
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "--"
+    minutes, secs = divmod(int(seconds), 60)
+    return f"{minutes}:{secs:02d}" if minutes < 60 else f"{minutes // 60}:{minutes % 60:02d}:{secs:02d}"
+
+@st.fragment(run_every=1.0)
+def render_batch_upload_progress():
+    # Polls the running batch once a second; when it ends, the page reruns
+    # and shows the results instead.
+    upload = st.session_state.active_upload
+    progress = upload["progress"]
+    if not upload["thread"].is_alive():
+        st.session_state.active_upload = None
+        st.session_state.batch_results = (upload["results"], upload["error"])
+        st.rerun()
+
+    snap = progress.snapshot()
+    finished = snap["files_done"] + snap["files_failed"] + snap["files_cancelled"]
+    st.progress(
+        min(1.0, snap["bytes_sent"] / max(snap["total_bytes"], 1)),
+        text=(
+            f"Uploading... {finished}/{snap['total_files']} files, "
+            f"{snap['bytes_sent'] / 1e6:.1f} / {snap['total_bytes'] / 1e6:.1f} MB"
+        ),
     )
-    service = build("drive", "v3", credentials=creds)
-    st.session_state.drive_service = service
-    return service
-
-def get_parent_drive_id() -> Optional[str]:
-    if st.session_state.parent_drive_checked:
-        return st.session_state.parent_drive_id
-
-    service = get_drive_service()
-    meta = service.files().get(
-        fileId=PARENT_FOLDER_ID,
-        fields="id,driveId",
-        supportsAllDrives=True
-    ).execute()
-
-    st.session_state.parent_drive_id = meta.get("driveId")
-    st.session_state.parent_drive_checked = True
-    return st.session_state.parent_drive_id
-
-def get_or_create_folder(parent_id: str, folder_name: str) -> str:
-    cache_key = f"{parent_id}:{folder_name}"
-    if cache_key in st.session_state.folder_cache:
-        return st.session_state.folder_cache[cache_key]
-
-    service = get_drive_service()
-    drive_id = get_parent_drive_id()
-
-    q = (
-        f"mimeType='{FOLDER_MIME}' and "
-        f"name='{folder_name}' and "
-        f"'{parent_id}' in parents and "
-        f"trashed=false"
+    st.caption(
+        f"{snap['mb_per_s']:.2f} MB/s · ETA {format_duration(snap['eta_sec'])} · "
+        f"elapsed {format_duration(snap['elapsed_sec'])}"
+        + (f" · failed {snap['files_failed']}" if snap["files_failed"] else "")
     )
-
-    if drive_id:
-        res = service.files().list(
-            q=q,
-            spaces="drive",
-            fields="files(id,name)",
-            pageSize=10,
-            corpora="drive",
-            driveId=drive_id,
-            includeItemsFromAllDrives=True,
-            supportsAllDrives=True
-        ).execute()
+    if snap["active"]:
+        st.caption("In flight: " + ", ".join(f"`{name}`" for name in snap["active"][:4]))
+    if snap["cancelled"]:
+        st.info("Cancelling... files already uploaded are kept.")
     else:
-        res = service.files().list(
-            q=q,
-            spaces="drive",
-            fields="files(id,name)",
-            pageSize=10,
-            corpora="user",
-            includeItemsFromAllDrives=True,
-            supportsAllDrives=True
-        ).execute()
-
-    files = res.get("files", [])
-    if files:
-        folder_id = files[0]["id"]
-        st.session_state.folder_cache[cache_key] = folder_id
-        return folder_id
-
-    folder_meta = {
-        "name": folder_name,
-        "mimeType": FOLDER_MIME,
-        "parents": [parent_id]
-    }
-    created = service.files().create(
-        body=folder_meta,
-        fields="id",
-        supportsAllDrives=True
-    ).execute()
-
-    folder_id = created["id"]
-    st.session_state.folder_cache[cache_key] = folder_id
-    return folder_id
-
-def ensure_zip_date_folder(zipcode: str, tz_name: str, date_str: Optional[str] = None) -> tuple[str, str, str]:
-    if date_str is None:
-        date_str = datetime.now(ZoneInfo(tz_name)).strftime("%Y%m%d")
-
-    zip_folder_id = get_or_create_folder(PARENT_FOLDER_ID, zipcode)
-    date_folder_id = get_or_create_folder(zip_folder_id, date_str)
-    return zip_folder_id, date_folder_id, date_str
-
-def upload_bytes_to_drive(image_bytes: bytes, mimetype: str, filename: str, parent_id: str):
-    service = get_drive_service()
-    buffer = io.BytesIO(image_bytes)
-    buffer.seek(0)
-
-    file_metadata = {"name": filename, "parents": [parent_id]}
-    media = MediaIoBaseUpload(buffer, mimetype=mimetype)
-
-    service.files().create(
-        body=file_metadata,
-        media_body=media,
-        fields="id",
-        supportsAllDrives=True
-    ).execute()
+        st.button("⏹️ Cancel upload", key="btn_cancel_batch", use_container_width=True, on_click=progress.cancel)
+
+def render_batch_results(batch_results):
+    results, error = batch_results
+    uploaded_files = [fn for fn, err in results if err is None]
+    cancelled_files = [fn for fn, err in results if isinstance(err, UploadCancelled)]
+    failed_files = [(fn, err) for fn, err in results if err is not None and not isinstance(err, UploadCancelled)]
+
+    if error is not None:
+        st.error(f"❌ Upload failed: {error}")
+    if cancelled_files:
+        st.warning(f"⏹️ Cancelled: {len(cancelled_files)} file(s) were not uploaded.")
+    if failed_files:
+        st.error(f"❌ {len(failed_files)} of {len(results)} file(s) failed to upload.")
+        for fn, err in failed_files[:15]:
+            st.write(f"- {fn}: {err}")
+    if uploaded_files:
+        st.success(f"✅ Done! Uploaded **{len(uploaded_files)}** files.")
+    for fn in uploaded_files[:15]:
+        st.write(f"- {fn}")
+    if len(uploaded_files) > 15:
+        st.write(f"...and {len(uploaded_files) - 15} more.")
+
+def render_catalog_panel():
+    catalog = get_catalog()
+    c1, c2 = st.columns([3, 1])
+    with c1:
+        synced_at = catalog.get_state("synced_at")
+        st.caption(f"{catalog.count()} capture(s) catalogued; last sync {synced_at or 'never'}")
+    with c2:
+        if st.button("Sync now", key="btn_catalog_sync", use_container_width=True):
+            with st.spinner("Syncing catalog..."):
+                st.write(sync_catalog())
+
+    f1, f2, f3 = st.columns(3)
+    zipcode = f1.text_input("ZIP", key="catalog_zip").strip() or None
+    year = f2.number_input("Year", min_value=0, max_value=2100, value=0, key="catalog_year") or None
+    height = f3.selectbox("Height", ["Any"] + [label for label, _ in HEIGHTS], key="catalog_height")
+    f4, f5, f6 = st.columns(3)
+    turf = f4.selectbox("Turf", ["Any"] + [full for _, full in TURF_OPTIONS], key="catalog_turf")
+    grass = f5.text_input("Grass", key="catalog_grass").strip() or None
+    weed = f6.text_input("Weed", key="catalog_weed").strip() or None
+
+    rows = catalog.query(
+        zipcode=zipcode,
+        year=int(year) if year else None,
+        weed=weed,
+        grass=grass,
+        turf=None if turf == "Any" else turf,
+        height=None if height == "Any" else height,
+        limit=1000,
+    )
+    st.write(f"**{len(rows)}** match(es)" + (" (first 1000)" if len(rows) == 1000 else ""))
+    if rows:
+        st.dataframe(
+            [{k: r[k] for k in ("name", "zipcode", "date_str", "turf_setting", "grass_type",
+                                "weed_name", "height_tag", "original_name")} for r in rows],
+            use_container_width=True,
+        )
+
+def render_folder_panel():
+    # Merges same-named ZIP/date folders left by concurrent creates; the
+    # dry run only lists what would move.
+    c1, c2 = st.columns(2)
+    dry_run = c1.button("Find duplicates", key="btn_folders_dry_run", use_container_width=True)
+    merge = c2.button("Merge duplicates", key="btn_folders_merge", use_container_width=True)
+    if not (dry_run or merge):
+        return
+    with st.spinner("Scanning folders..."):
+        merged = reconcile_duplicate_folders(dry_run=dry_run)
+    if not merged:
+        st.success("No duplicate folders.")
+        return
+    st.write(f"**{len(merged)}** duplicate folder(s)" + (" to merge" if dry_run else " merged"))
+    st.dataframe(merged, use_container_width=True)
 
 # -------------------------
 # Save helpers
 # -------------------------
+def clear_capture_set():
+    store = get_capture_store()
+    for item in st.session_state.height_captures.values():
+        store.delete(item["handle"])
+    st.session_state.capture_set_ts = None
+    st.session_state.capture_set_tz = None
+    st.session_state.height_captures = {}
+
 def save_shot_for_height(
     height_tag: str,
     image_bytes: bytes,
@@ -520,8 +470,14 @@ def save_shot_for_height(
         st.session_state.capture_set_tz = tz_name
         st.session_state.capture_set_ts = now_timestamp_str(tz_name)
 
+    store = get_capture_store()
+    previous = st.session_state.height_captures.get(height_tag)
+    if previous is not None:
+        store.delete(previous["handle"])
+
     st.session_state.height_captures[height_tag] = {
-        "bytes": image_bytes,
+        "handle": store.put(image_bytes),
+        "size": len(image_bytes),
         "mimetype": mimetype,
         "original_name": original_name,
         "meta": meta or {},
@@ -537,43 +493,231 @@ def height_picker_ui(key_suffix: str):
     )
     return chosen, HEIGHT_MAP[chosen]
 
-def optional_meta_ui(key_suffix: str) -> Dict[str, Any]:
+@st.fragment
+def optional_meta_ui(key_suffix: str):
+    # Values are read back with read_optional_meta() when the shot is saved.
     with st.expander("Optional annotations (can skip all)", expanded=True):
         c1, c2 = st.columns(2)
-        conf = c1.selectbox(
+        c1.selectbox(
             "Image Confidence Level (optional)",
             CONF_LEVEL_OPTIONS,
             index=0,
             key=f"conf_{key_suffix}"
         )
-        herb = c2.selectbox(
+        c2.selectbox(
             "Herbicide Application (within 30 days) (optional)",
             HERBICIDE_30D_OPTIONS,
             index=0,
             key=f"herb_{key_suffix}"
         )
 
-        stage = st.selectbox(
+        st.selectbox(
             "Growth Stage (optional)",
             GROWTH_STAGE_OPTIONS,
             index=0,
             key=f"stage_{key_suffix}"
         )
 
-        patch = st.selectbox(
+        st.selectbox(
             "Weed Patch Size (optional)",
             PATCH_SIZE_OPTIONS,
             index=0,
             key=f"patch_{key_suffix}"
         )
 
+def read_optional_meta(key_suffix: str) -> Dict[str, Any]:
     return {
-        "confidence": normalize_optional(conf),
-        "growth_stage": normalize_optional(stage),
-        "patch_size": normalize_optional(patch),
-        "herbicide_30d": normalize_optional(herb),
+        "confidence": normalize_optional(st.session_state.get(f"conf_{key_suffix}")),
+        "growth_stage": normalize_optional(st.session_state.get(f"stage_{key_suffix}")),
+        "patch_size": normalize_optional(st.session_state.get(f"patch_{key_suffix}")),
+        "herbicide_30d": normalize_optional(st.session_state.get(f"herb_{key_suffix}")),
     }
 
+# -------------------------
+# Photo step fragments
+# -------------------------
+# Each panel is a fragment: its taps rerun just that panel instead of the
+# whole page (tabs, batch grouping, queue). Saving a shot is the one action
+# that reruns everything, so the set status picks it up.
+def retake_rear_camera():
+    st.session_state.rear_cam_nonce += 1
+
+@st.fragment
+def render_camera_panel(tz_name: str):
+    col1, col2, col3 = st.columns([1, 4, 1])
+    with col2:
+        if BACK_CAM_AVAILABLE:
+            a, b = st.columns([1, 3])
+            with a:
+                # Callbacks run before the panel reruns, so it draws the new state.
+                st.button("🗑️ Clear / Retake", key="btn_clear_rear_cam", use_container_width=True, on_click=retake_rear_camera)
+            with b:
+                st.caption("📌 Tap the video area to capture")
+
+            cam_key = f"rear_cam_{st.session_state.rear_cam_nonce}"
+            cam = back_camera_input(key=cam_key, height=450, width=500)
+
+            if cam is not None:
+                image_bytes = cam.getvalue()
+                mimetype = "image/png"
+                original_name = "rear_camera.png"
+
+                img, w, h = try_get_image_size(image_bytes)
+                if img is not None:
+                    st.image(img, use_container_width=True)
+                    c1, c2 = st.columns(2)
+                    c1.metric("Width", f"{w} px")
+                    c2.metric("Height", f"{h} px")
+                else:
+                    st.warning("Preview/size may not be available. Save/upload is still possible.")
+
+                height_label, height_tag = height_picker_ui("cam")
+                optional_meta_ui("cam")
+
+                if st.button(f"✅ Save this shot ({height_label})", key="btn_save_cam", use_container_width=True):
+                    out_bytes, out_mimetype = transcode_camera_image(image_bytes, mimetype)
+                    out_name = f"rear_camera.{guess_ext(out_mimetype)}"
+                    save_shot_for_height(height_tag, out_bytes, out_mimetype, out_name, tz_name, meta=read_optional_meta("cam"))
+                    st.toast(f"Saved for {height_label}.", icon="✅")
+                    st.rerun()
+        else:
+            st.caption("Fallback camera (rear camera cannot be forced on some iPad browsers).")
+            cam_file = st.camera_input("📸 (Click to Capture)")
+            if cam_file is not None:
+                image_bytes = cam_file.getvalue()
+                mimetype = cam_file.type or "image/jpeg"
+                original_name = cam_file.name
+
+                img, w, h = try_get_image_size(image_bytes)
+                if img is not None:
+                    st.image(img, use_container_width=True)
+                    c1, c2 = st.columns(2)
+                    c1.metric("Width", f"{w} px")
+                    c2.metric("Height", f"{h} px")
+                else:
+                    st.warning("Preview/size may not be available for this file type. Save/upload is still possible.")
+
+                height_label, height_tag = height_picker_ui("cam")
+                optional_meta_ui("cam")
+
+                if st.button(f"✅ Save this shot ({height_label})", key="btn_save_cam_fallback", use_container_width=True):
+                    save_shot_for_height(height_tag, image_bytes, mimetype, original_name, tz_name, meta=read_optional_meta("cam"))
+                    st.toast(f"Saved for {height_label}.", icon="✅")
+                    st.rerun()
+
+@st.fragment
+def render_set_status(zipcode: str, tz_name: str, turf_setting: str, grass_type: str, weed_name: str):
+    st.write("---")
+    st.subheader("📏 3-shot Set Status")
+
+    # Keep this session's saved shots from being swept as abandoned.
+    for item in st.session_state.height_captures.values():
+        get_capture_store().touch(item["handle"])
+
+    def checkbox_line(label: str, tag: str) -> str:
+        done = tag in st.session_state.height_captures
+        box = "✅" if done else "⬜"
+        line = f"- {box} **{label}**"
+        if done:
+            meta = st.session_state.height_captures[tag].get("meta", {}) or {}
+            meta_txt = format_meta_for_status(meta)
+            if meta_txt:
+                line += f"  \n  <span style='color:gray; font-size:0.95rem;'>({meta_txt})</span>"
+        return line
+
+    st.markdown("\n".join([
+        checkbox_line("1 m", "H1m"),
+        checkbox_line("50 cm", "H50cm"),
+        checkbox_line("20 cm", "H20cm"),
+    ]), unsafe_allow_html=True)
+
+    col_reset, col_tip = st.columns([1, 3])
+    with col_reset:
+        st.button("Reset this 3-shot set", key="btn_reset_bottom", use_container_width=True, on_click=clear_capture_set)
+    with col_tip:
+        st.caption("This section is for camera/manual saving. Batch upload bypasses this set.")
+
+    st.subheader("☁️ Upload ALL 3 distances to Google Drive (manual set)")
+
+    missing = [tag for (_, tag) in HEIGHTS if tag not in st.session_state.height_captures]
+    if missing:
+        st.info(f"Remaining distances: {', '.join(missing)}")
+    else:
+        st.success("All 3 distances are ready!")
+
+        if st.button("🚀 Upload ALL 3 images now", key="btn_upload_all3", use_container_width=True):
+            with st.spinner("Uploading 3 images to Google Drive... ☁️"):
+                try:
+                    set_tz = st.session_state.capture_set_tz or tz_name
+                    set_ts = st.session_state.capture_set_ts or now_timestamp_str(set_tz)
+                    date_str = set_ts.split("_")[0]
+
+                    jobs = []
+                    for _, tag in HEIGHTS:
+                        item = st.session_state.height_captures[tag]
+                        meta = item.get("meta", {}) or {}
+                        image_bytes = get_capture_store().get(item["handle"])
+                        if image_bytes is None:
+                            raise RuntimeError(f"Saved {tag} shot has expired. Please capture it again.")
+
+                        filename = make_filename(
+                            turf_setting=turf_setting,
+                            grass_type=grass_type,
+                            weed_name=weed_name,
+                            height_tag=tag,
+                            mimetype=item["mimetype"],
+                            set_timestamp=set_ts,
+                            original_name=item["original_name"],
+                            meta=meta,
+                        )
+                        jobs.append({
+                            "source": image_bytes, "size": len(image_bytes),
+                            "mimetype": item["mimetype"], "filename": filename,
+                            "record": make_manifest_record(
+                                turf_setting, grass_type, weed_name, tag, set_ts,
+                                original_name=item["original_name"], meta=meta,
+                            ),
+                        })
+
+                    if USE_UPLOAD_SPOOL:
+                        set_id = get_upload_spool().enqueue(
+                            jobs, zipcode, set_tz, date_str, priority=PRIORITY_INTERACTIVE
+                        )
+                        st.session_state.queued_sets.append((set_id, f"3-shot set {set_ts}"))
+                        # Rerun the page so the upload queue below shows the new set.
+                        clear_capture_set()
+                        st.toast("✅ Queued! (3 files upload in the background)")
+                        st.rerun()
+                    else:
+                        total_bytes = sum(job["size"] for job in jobs)
+                        offsets = [sum(job["size"] for job in jobs[:i]) for i in range(len(jobs))]
+                        progress_bar = st.progress(0.0, text="Uploading...")
+
+                        def show_progress(i: int, sent: int, _total: int):
+                            done = offsets[i] + sent
+                            progress_bar.progress(
+                                min(1.0, done / max(total_bytes, 1)),
+                                text=f"Uploading... {done / 1e6:.1f} / {total_bytes / 1e6:.1f} MB",
+                            )
+
+                        results = upload_jobs_to_zip_date_folder(
+                            jobs, zipcode, set_tz, date_str, max_workers=1, progress_cb=show_progress
+                        )
+                        errors = [err for _, err in results if err is not None]
+                        if errors:
+                            raise errors[0]
+                        uploaded_files = [fn for fn, _ in results]
+
+                        st.success("✅ Done! (3 files uploaded)")
+                        for f in uploaded_files:
+                            st.write(f"- {f}")
+
+                    clear_capture_set()
+
+                except Exception as e:
+                    st.error(f"❌ Upload failed: {e}")
+                    st.error(f"❌ Upload failed: {e}")
+
 # -------------------------
 # Step rendering
 # -------------------------
@@ -685,6 +829,13 @@ elif st.session_state.form_step == 4:
     grass_type = vals["grass_type"]
     weed_name = vals["weed_name"]
 
+    # Warm the Drive client while the user is taking photos; upload errors
+    # are reported by the upload handlers themselves.
+    try:
+        get_drive_service()
+    except Exception:
+        pass
+
     st.success("✅ Setup complete. You can now upload or capture photos.")
 
     with st.expander("Selected info", expanded=False):
@@ -708,9 +859,7 @@ elif st.session_state.form_step == 4:
                 "grass_type": "",
                 "weed_name": "",
             }
-            st.session_state.capture_set_ts = None
-            st.session_state.capture_set_tz = None
-            st.session_state.height_captures = {}
+            clear_capture_set()
             st.rerun()
 
     st.markdown("""
@@ -736,202 +885,151 @@ elif st.session_state.form_step == 4:
             n = len(up_files)
             st.write(f"Selected: **{n} file(s)**")
 
-            if n % 3 != 0:
+            grouping = st.radio(
+                "Group photos into sets by",
+                ["Upload order (1 m → 50 cm → 20 cm)", "EXIF capture time"],
+                horizontal=True,
+                key="batch_grouping",
+            )
+            group_by_exif = grouping == "EXIF capture time"
+
+            batch_sets: List[List[Any]] = []
+            set_timestamps: Optional[List[str]] = None
+            if group_by_exif:
+                with st.spinner("Reading capture times..."):
+                    captured = probe_capture_times(up_files, st.session_state.capture_time_cache)
+                batch_sets, set_times, incomplete, undated = group_sets_by_capture_time(up_files, captured)
+                set_timestamps = unique_set_timestamps(set_times)
+
+                st.caption(
+                    f"Shots more than {SET_GAP_SEC:g} s apart start a new set; "
+                    "heights follow shot order within each set."
+                )
+                if undated:
+                    st.warning(
+                        f"⚠️ {len(undated)} file(s) have no EXIF capture time and are skipped: "
+                        + ", ".join(f"`{f.name}`" for f in undated[:10])
+                        + (" ..." if len(undated) > 10 else "")
+                    )
+                for burst in incomplete:
+                    st.warning(
+                        f"⚠️ Skipped a burst of {len(burst)} shot(s) (not a multiple of 3): "
+                        + ", ".join(f"`{f.name}`" for f in burst)
+                    )
+                if batch_sets:
+                    st.success(f"✅ Grouped into **{len(batch_sets)} set(s)** by capture time")
+                else:
+                    st.error("❌ No complete 3-shot sets found by capture time.")
+            elif n % 3 != 0:
                 st.error("❌ Please upload in multiples of 3 (3, 6, 9, ...). Each set = 1 m / 50 cm / 20 cm.")
                 st.info("Tip: Upload order for each set must be 1 m → 50 cm → 20 cm, then repeat.")
             else:
-                num_sets = n // 3
-                st.success(f"✅ Batch recognized: **{num_sets} set(s)**")
-
-                st.markdown("### 📦 Batch grouping (by upload order)")
-                for s in range(num_sets):
-                    i0 = s * 3
-                    f1, f2, f3 = up_files[i0], up_files[i0 + 1], up_files[i0 + 2]
-                    st.markdown(
-                        f"**Set {s+1}**  \n"
-                        f"- 1 m   → `{f1.name}`  \n"
-                        f"- 50 cm → `{f2.name}`  \n"
-                        f"- 20 cm → `{f3.name}`"
-                    )
+                batch_sets = [up_files[i:i + 3] for i in range(0, n, 3)]
+                st.success(f"✅ Batch recognized: **{len(batch_sets)} set(s)**")
+
+            if batch_sets:
+                num_sets = len(batch_sets)
+                num_files = num_sets * 3
+
+                st.markdown(
+                    "### 📦 Batch grouping (by capture time)" if group_by_exif
+                    else "### 📦 Batch grouping (by upload order)"
+                )
+                show_thumbs = st.toggle("Show thumbnails", value=False, key="batch_show_thumbs")
+                if show_thumbs:
+                    num_pages = -(-num_sets // THUMB_SETS_PER_PAGE)
+                    page = 1
+                    if num_pages > 1:
+                        page = st.number_input("Page", min_value=1, max_value=num_pages, value=1, key="batch_thumb_page")
+                    visible_sets = range((page - 1) * THUMB_SETS_PER_PAGE, min(num_sets, page * THUMB_SETS_PER_PAGE))
+                else:
+                    visible_sets = range(0)
+
+                for s, (f1, f2, f3) in enumerate(batch_sets):
+                    set_label = f"Set {s+1}" + (f" ({set_timestamps[s]})" if set_timestamps else "")
+                    if s in visible_sets:
+                        st.image(
+                            get_thumbnail_sheet([f1.getvalue(), f2.getvalue(), f3.getvalue()]),
+                            caption=f"{set_label}: 1 m {f1.name} | 50 cm {f2.name} | 20 cm {f3.name}",
+                            use_container_width=True,
+                        )
+                    elif not show_thumbs:
+                        st.markdown(
+                            f"**{set_label}**  \n"
+                            f"- 1 m   → `{f1.name}`  \n"
+                            f"- 50 cm → `{f2.name}`  \n"
+                            f"- 20 cm → `{f3.name}`"
+                        )
 
-                if st.button(f"🚀 Upload ALL ({num_sets} set(s) / {n} files)", key="btn_upload_batch_3n", use_container_width=True):
+                if st.button(
+                    f"🚀 Upload ALL ({num_sets} set(s) / {num_files} files)",
+                    key="btn_upload_batch_3n",
+                    use_container_width=True,
+                    disabled=st.session_state.active_upload is not None,
+                ):
                     with st.spinner("Uploading batch to Google Drive... ☁️"):
                         try:
                             base_dt = datetime.now(ZoneInfo(tz_name))
-                            date_str = base_dt.strftime("%Y%m%d")
-                            _, date_folder_id, _ = ensure_zip_date_folder(zipcode, tz_name, date_str=date_str)
-
-                            uploaded_files = []
-                            for s in range(num_sets):
-                                set_ts = (base_dt + timedelta(seconds=s)).strftime("%Y%m%d_%H%M%S")
-                                i0 = s * 3
-                                group = [up_files[i0], up_files[i0 + 1], up_files[i0 + 2]]
-
-                                for (_, height_tag), f in zip(HEIGHTS, group):
-                                    image_bytes = f.getvalue()
-                                    mimetype = f.type or "application/octet-stream"
-
-                                    filename = make_filename(
-                                        turf_setting=turf_setting,
-                                        grass_type=grass_type,
-                                        weed_name=weed_name,
-                                        height_tag=height_tag,
-                                        mimetype=mimetype,
-                                        set_timestamp=set_ts,
-                                        original_name=f.name,
-                                        meta=None,
+                            if set_timestamps is not None:
+                                jobs = build_set_jobs(batch_sets, set_timestamps, turf_setting, grass_type, weed_name)
+                            else:
+                                jobs = build_batch_jobs(up_files, turf_setting, grass_type, weed_name, base_dt)
+
+                            # EXIF sets can span several days; each day has its own date folder.
+                            jobs_by_date: Dict[str, List[Dict[str, Any]]] = {}
+                            for job in jobs:
+                                jobs_by_date.setdefault(job["date_str"], []).append(job)
+
+                            if USE_UPLOAD_SPOOL:
+                                for date_str, date_jobs in jobs_by_date.items():
+                                    set_id = get_upload_spool().enqueue(date_jobs, zipcode, tz_name, date_str)
+                                    st.session_state.queued_sets.append(
+                                        (set_id, f"Batch of {len(date_jobs) // 3} set(s), {date_str}, {base_dt:%H:%M:%S}")
                                     )
-
-                                    upload_bytes_to_drive(image_bytes, mimetype, filename, parent_id=date_folder_id)
-                                    uploaded_files.append(filename)
-
-                            st.success(f"✅ Done! Uploaded **{len(uploaded_files)}** files.")
-                            for fn in uploaded_files[:15]:
-                                st.write(f"- {fn}")
-                            if len(uploaded_files) > 15:
-                                st.write(f"...and {len(uploaded_files) - 15} more.")
+                                st.success(f"✅ Queued **{len(jobs)}** files. They upload in the background (see Upload queue below).")
+                            else:
+                                start_batch_upload(jobs, zipcode, tz_name)
 
                         except Exception as e:
                             st.error(f"❌ Upload failed: {e}")
 
+        if st.session_state.active_upload is not None:
+            render_batch_upload_progress()
+        elif st.session_state.batch_results is not None:
+            render_batch_results(st.session_state.batch_results)
+            st.session_state.batch_results = None
+
     # =========================
     # 2) Camera tab
     # =========================
     with tabs[1]:
-        col1, col2, col3 = st.columns([1, 4, 1])
-        with col2:
-            if BACK_CAM_AVAILABLE:
-                a, b = st.columns([1, 3])
-                with a:
-                    if st.button("🗑️ Clear / Retake", key="btn_clear_rear_cam", use_container_width=True):
-                        st.session_state.rear_cam_nonce += 1
-                        st.rerun()
-                with b:
-                    st.caption("📌 Tap the video area to capture")
-
-                cam_key = f"rear_cam_{st.session_state.rear_cam_nonce}"
-                cam = back_camera_input(key=cam_key, height=450, width=500)
-
-                if cam is not None:
-                    image_bytes = cam.getvalue()
-                    mimetype = "image/png"
-                    original_name = "rear_camera.png"
-
-                    img, w, h = try_get_image_size(image_bytes)
-                    if img is not None:
-                        st.image(img, use_container_width=True)
-                        c1, c2 = st.columns(2)
-                        c1.metric("Width", f"{w} px")
-                        c2.metric("Height", f"{h} px")
-                    else:
-                        st.warning("Preview/size may not be available. Save/upload is still possible.")
-
-                    height_label, height_tag = height_picker_ui("cam")
-                    meta = optional_meta_ui("cam")
-
-                    if st.button(f"✅ Save this shot ({height_label})", key="btn_save_cam", use_container_width=True):
-                        save_shot_for_height(height_tag, image_bytes, mimetype, original_name, tz_name, meta=meta)
-                        st.success(f"Saved for {height_label}.")
-            else:
-                st.caption("Fallback camera (rear camera cannot be forced on some iPad browsers).")
-                cam_file = st.camera_input("📸 (Click to Capture)")
-                if cam_file is not None:
-                    image_bytes = cam_file.getvalue()
-                    mimetype = cam_file.type or "image/jpeg"
-                    original_name = cam_file.name
-
-                    img, w, h = try_get_image_size(image_bytes)
-                    if img is not None:
-                        st.image(img, use_container_width=True)
-                        c1, c2 = st.columns(2)
-                        c1.metric("Width", f"{w} px")
-                        c2.metric("Height", f"{h} px")
-                    else:
-                        st.warning("Preview/size may not be available for this file type. Save/upload is still possible.")
-
-                    height_label, height_tag = height_picker_ui("cam")
-                    meta = optional_meta_ui("cam")
-
-                    if st.button(f"✅ Save this shot ({height_label})", key="btn_save_cam_fallback", use_container_width=True):
-                        save_shot_for_height(height_tag, image_bytes, mimetype, original_name, tz_name, meta=meta)
-                        st.success(f"Saved for {height_label}.")
+        render_camera_panel(tz_name)
 
     # -------------------------
     # Bottom: 3-shot status + Upload ALL 3
     # -------------------------
-    st.write("---")
-    st.subheader("📏 3-shot Set Status")
-
-    def checkbox_line(label: str, tag: str) -> str:
-        done = tag in st.session_state.height_captures
-        box = "✅" if done else "⬜"
-        line = f"- {box} **{label}**"
-        if done:
-            meta = st.session_state.height_captures[tag].get("meta", {}) or {}
-            meta_txt = format_meta_for_status(meta)
-            if meta_txt:
-                line += f"  \n  <span style='color:gray; font-size:0.95rem;'>({meta_txt})</span>"
-        return line
-
-    st.markdown("\n".join([
-        checkbox_line("1 m", "H1m"),
-        checkbox_line("50 cm", "H50cm"),
-        checkbox_line("20 cm", "H20cm"),
-    ]), unsafe_allow_html=True)
-
-    col_reset, col_tip = st.columns([1, 3])
-    with col_reset:
-        if st.button("Reset this 3-shot set", key="btn_reset_bottom", use_container_width=True):
-            st.session_state.capture_set_ts = None
-            st.session_state.capture_set_tz = None
-            st.session_state.height_captures = {}
-            st.success("Reset completed.")
-    with col_tip:
-        st.caption("This section is for camera/manual saving. Batch upload bypasses this set.")
-
-    st.subheader("☁️ Upload ALL 3 distances to Google Drive (manual set)")
-
-    missing = [tag for (_, tag) in HEIGHTS if tag not in st.session_state.height_captures]
-    if missing:
-        st.info(f"Remaining distances: {', '.join(missing)}")
-    else:
-        st.success("All 3 distances are ready!")
-
-        if st.button("🚀 Upload ALL 3 images now", key="btn_upload_all3", use_container_width=True):
-            with st.spinner("Uploading 3 images to Google Drive... ☁️"):
-                try:
-                    set_tz = st.session_state.capture_set_tz or tz_name
-                    set_ts = st.session_state.capture_set_ts or now_timestamp_str(set_tz)
-                    date_str = set_ts.split("_")[0]
-
-                    _, date_folder_id, _ = ensure_zip_date_folder(zipcode, set_tz, date_str=date_str)
-
-                    uploaded_files = []
-                    for _, tag in HEIGHTS:
-                        item = st.session_state.height_captures[tag]
-                        meta = item.get("meta", {}) or {}
-
-                        filename = make_filename(
-                            turf_setting=turf_setting,
-                            grass_type=grass_type,
-                            weed_name=weed_name,
-                            height_tag=tag,
-                            mimetype=item["mimetype"],
-                            set_timestamp=set_ts,
-                            original_name=item["original_name"],
-                            meta=meta,
-                        )
-                        upload_bytes_to_drive(item["bytes"], item["mimetype"], filename, parent_id=date_folder_id)
-                        uploaded_files.append(filename)
-
-                    st.success("✅ Done! (3 files uploaded)")
-                    for f in uploaded_files:
-                        st.write(f"- {f}")
+    render_set_status(zipcode, tz_name, turf_setting, grass_type, weed_name)
+
+    if st.query_params.get("metrics"):
+        with st.sidebar:
+            st.markdown("#### ⏱️ Stage timings")
+            st.json(get_stage_metrics().snapshot())
+            st.markdown("#### 🚦 Drive rate limiter")
+            st.json(get_rate_limiter().snapshot())
+
+    if USE_UPLOAD_SPOOL:
+        st.write("---")
+        st.subheader("🗂️ Upload queue")
+        render_upload_queue_status()
+        if st.button("Refresh status", key="btn_refresh_spool", use_container_width=True):
+            st.rerun()
 
-                    st.session_state.capture_set_ts = None
-                    st.session_state.capture_set_tz = None
-                    st.session_state.height_captures = {}
+    if st.query_params.get("catalog"):
+        st.write("---")
+        st.subheader("🔎 Capture catalog")
+        render_catalog_panel()
 
-                except Exception as e:
-                    st.error(f"❌ Upload failed: {e}")
-                    st.error(f"❌ Upload failed: {e}")
+    if st.query_params.get("folders"):
+        st.write("---")
+        st.subheader("🧹 Duplicate folders")
+        render_folder_panel()
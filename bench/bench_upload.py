@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+# Upload benchmark against a local fake Drive server (bench/fake_drive.py).
+#
+# Drives the app's own upload functions (weed_collector.py) - ensure_zip_date_folder(s),
+# upload_bytes_to_drive and the 3N batch path (build_batch_jobs +
+# upload_jobs_to_zip_date_folder) - with synthetic files, and reports wall
+# time, throughput, API calls and peak memory per scenario.
+#
+#   python bench/bench_upload.py --sets 30 --file-kb 3000 --workers 4 \
+#       --latency-ms 40 --bandwidth-mbps 50 --error-rate 0.02
+import argparse
+import copy
+import io
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_drive import FakeDriveServer, FakeDriveState  # noqa: E402
+from googleapiclient.http import build_http  # noqa: E402
+
+
+class SyntheticUpload(io.BytesIO):
+    # Same surface as Streamlit's UploadedFile (a BytesIO with name/type/size).
+    def __init__(self, data: bytes, name: str, mimetype: str = "image/jpeg"):
+        super().__init__(data)
+        self.name = name
+        self.type = mimetype
+        self.size = len(data)
+
+
+def synthetic_files(count: int, size_kb: int, seed: int = 0) -> List[SyntheticUpload]:
+    # Unique payloads (so dedup never short-circuits) behind a JPEG marker.
+    files = []
+    for i in range(count):
+        payload = b"\xff\xd8\xff\xe0" + f"{seed}:{i}:".encode() + os.urandom(max(0, size_kb * 1024 - 32))
+        files.append(SyntheticUpload(payload, f"IMG_{i:04d}.JPG"))
+    return files
+
+
+def load_app(data_dir: str):
+    os.environ["WEED_COLLECTOR_DATA_DIR"] = data_dir
+    os.environ.setdefault("USE_UPLOAD_SPOOL", "0")
+    os.environ.setdefault("TIMING_LOG", "0")
+    import weed_collector
+    weed_collector.silence_streamlit_bare_mode()
+    return weed_collector
+
+
+def fake_service_factories(app, server: FakeDriveServer):
+    # (build_drive_service, get_drive_service) replacements talking to server.
+    doc = copy.deepcopy(app.get_drive_discovery_doc())
+    doc["rootUrl"] = server.url
+    doc["batchPath"] = "batch/drive/v3"
+    local = threading.local()
+
+    def build_fake_service(_creds=None):
+        # Same transport stack as build_drive_service(), minus the OAuth layer.
+        http = app.RateLimitedHttp(build_http(), app.get_rate_limiter())
+        return app.build_from_document(doc, http=http)
+
+    def thread_service():
+        if getattr(local, "service", None) is None:
+            local.service = build_fake_service()
+        return local.service
+
+    return build_fake_service, thread_service
+
+
+def point_app_at(app, server: FakeDriveServer):
+    build_fake_service, thread_service = fake_service_factories(app, server)
+    app.get_drive_credentials = lambda: None
+    app.build_drive_service = build_fake_service
+    app.get_drive_service = thread_service
+
+
+def reset_caches(app):
+    for path in (app.FOLDER_CACHE_PATH, app.HASH_INDEX_PATH):
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(path + suffix)
+            except OSError:
+                pass
+    app.get_folder_cache.clear()
+    app.get_hash_index.clear()
+
+
+def run_scenario(name: str, state: FakeDriveState, fn: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    calls_before = dict(state.calls)
+    errors_before = state.injected_errors
+    limited_before = state.rate_limited
+    bytes_before = state.bytes_received
+    tracemalloc.start()
+    start = time.perf_counter()
+    error = None
+    try:
+        extra = fn() or {}
+    except Exception as e:
+        # Record the failure and go on with the other scenarios.
+        extra, error = {}, f"{type(e).__name__}: {e}"
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    calls = {k: v - calls_before.get(k, 0) for k, v in state.calls.items() if v - calls_before.get(k, 0)}
+    sent = state.bytes_received - bytes_before
+    result = {
+        "scenario": name,
+        "seconds": round(elapsed, 3),
+        "api_calls": sum(calls.values()),
+        "calls": calls,
+        "injected_errors": state.injected_errors - errors_before,
+        "rate_limited": state.rate_limited - limited_before,
+        "mb_uploaded": round(sent / 1e6, 2),
+        "mb_per_s": round(sent / 1e6 / elapsed, 2) if elapsed else 0.0,
+        "peak_traced_mb": round(peak / 1e6, 1),
+        **extra,
+    }
+    if "files" in extra:
+        result["files_per_s"] = round(extra["files"] / elapsed, 2) if elapsed else 0.0
+    if error is not None:
+        result["error"] = error
+    return result
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sets", type=int, default=10, help="3-shot sets in the batch scenario")
+    parser.add_argument("--file-kb", type=int, default=2048, help="size of each synthetic file")
+    parser.add_argument("--workers", type=int, default=4, help="upload workers for the batch scenario")
+    parser.add_argument("--zips", type=int, default=20, help="ZIP folders in the folder scenarios")
+    parser.add_argument("--chunk-kb", type=int, default=None, help="override UPLOAD_CHUNK_SIZE")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added per HTTP request")
+    parser.add_argument("--bandwidth-mbps", type=float, default=0.0, help="upload bandwidth cap, 0 = none")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 503")
+    parser.add_argument("--server-qps", type=float, default=0.0, help="fake per-user quota (403 above it), 0 = none")
+    parser.add_argument("--limiter-qps", type=float, default=None, help="override DRIVE_RATE_QPS, 0 = no limiter")
+    parser.add_argument("--scenario", choices=["all", "folders", "upload", "batch"], default="all")
+    parser.add_argument("--json", action="store_true", help="print results as JSON lines")
+    args = parser.parse_args(argv)
+
+    app = load_app(tempfile.mkdtemp(prefix="weed_bench_"))
+    state = FakeDriveState(
+        [app.PARENT_FOLDER_ID],
+        latency_ms=args.latency_ms,
+        error_rate=args.error_rate,
+        bandwidth_mbps=args.bandwidth_mbps,
+        rate_limit_qps=args.server_qps,
+    )
+    if args.limiter_qps is not None:
+        app.DRIVE_RATE_QPS = args.limiter_qps
+        app.get_rate_limiter.clear()
+    server = FakeDriveServer(state).start()
+    point_app_at(app, server)
+    chunk_size = args.chunk_kb * 1024 if args.chunk_kb else app.UPLOAD_CHUNK_SIZE
+    tz_name = "America/New_York"
+    date_str = datetime.now().strftime("%Y%m%d")
+    results = []
+
+    if args.scenario in ("all", "folders"):
+        reset_caches(app)
+        zips = [f"{20000 + i:05d}" for i in range(args.zips)]
+        results.append(run_scenario("ensure_zip_date_folder/cold", state, lambda: {
+            "folders": [app.ensure_zip_date_folder(z, tz_name, date_str) for z in zips] and len(zips) * 2,
+        }))
+        results.append(run_scenario("ensure_zip_date_folder/warm", state, lambda: {
+            "folders": [app.ensure_zip_date_folder(z, tz_name, date_str) for z in zips] and len(zips) * 2,
+        }))
+        reset_caches(app)
+        results.append(run_scenario("ensure_zip_date_folders/batched-cold", state, lambda: {
+            "folders": len(app.ensure_zip_date_folders([(z, f"{date_str[:6]}01") for z in zips])) * 2,
+        }))
+
+    if args.scenario in ("all", "upload"):
+        reset_caches(app)
+        _, folder_id, _ = app.ensure_zip_date_folder("20740", tz_name, date_str)
+        files = synthetic_files(max(3, args.sets), args.file_kb, seed=1)
+
+        def upload_sequential():
+            for f in files:
+                app.upload_bytes_to_drive(f, f.type, f.name, folder_id, chunk_size=chunk_size)
+            return {"files": len(files)}
+
+        results.append(run_scenario("upload_bytes_to_drive/sequential", state, upload_sequential))
+
+    if args.scenario in ("all", "batch"):
+        reset_caches(app)
+        files = synthetic_files(args.sets * 3, args.file_kb, seed=2)
+
+        def batch():
+            jobs = app.build_batch_jobs(files, "Fairway", "Bentgrass", "Crabgrass", datetime.now())
+            out = app.upload_jobs_to_zip_date_folder(
+                jobs, "20740", tz_name, date_str, max_workers=args.workers
+            )
+            return {"files": len(out), "failed": sum(1 for _, err in out if err is not None)}
+
+        results.append(run_scenario(f"3n_batch/workers={args.workers}", state, batch))
+
+    server.shutdown()
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    for result in results:
+        result["max_rss_mb"] = round(rss_mb, 1)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            calls = ", ".join(f"{k}={v}" for k, v in sorted(result["calls"].items()))
+            print(
+                f"{result['scenario']:<40} {result['seconds']:>8.3f}s  "
+                f"{result['mb_per_s']:>8.2f} MB/s  calls={result['api_calls']:<4} "
+                f"errors={result['injected_errors']:<3} 403s={result['rate_limited']:<4} "
+                f"failed={result.get('failed', 0):<3} "
+                f"peak={result['peak_traced_mb']}MB  [{calls}]"
+            )
+            if "error" in result:
+                print(f"{'':<40} ERROR {result['error']}")
+    if not args.json:
+        print(f"rate limiter: {app.get_rate_limiter().snapshot()}")
+    return 1 if any("error" in result for result in results) else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
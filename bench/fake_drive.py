@@ -0,0 +1,418 @@
+# -*- coding: utf-8 -*-
+# Local stand-in for the parts of the Drive v3 API that weed_collector.py uses:
+# files.get/list/create/update, multipart and resumable media uploads, and
+# batch requests. Supports injected latency, bandwidth limits and errors,
+# and counts every call so benchmarks can report API usage.
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+FOLDER_MIME = "application/vnd.google-apps.folder"
+# Small files (manifests, exports in tests) keep their bytes so alt=media
+# downloads work.
+KEEP_CONTENT_BYTES = 1024 * 1024
+RATE_LIMITED = {
+    "error": {
+        "code": 403,
+        "message": "User Rate Limit Exceeded",
+        "errors": [{"domain": "usageLimits", "reason": "userRateLimitExceeded"}],
+    }
+}
+
+
+class FakeDriveState:
+    def __init__(
+        self,
+        root_ids: List[str],
+        latency_ms: float = 0.0,
+        error_rate: float = 0.0,
+        bandwidth_mbps: float = 0.0,
+        rate_limit_qps: float = 0.0,
+        seed: int = 0,
+    ):
+        self.latency_ms = latency_ms
+        self.rate_limit_qps = rate_limit_qps
+        self.recent: List[float] = []
+        self.rate_limited = 0
+        self.error_rate = error_rate
+        self.bandwidth_mbps = bandwidth_mbps
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+        self.ids = itertools.count(1)
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.uploads: Dict[str, Dict[str, Any]] = {}
+        self.contents: Dict[str, bytes] = {}
+        self.change_log: List[str] = []
+        self.calls: Dict[str, int] = {}
+        self.injected_errors = 0
+        self.bytes_received = 0
+        for root_id in root_ids:
+            self.files[root_id] = {
+                "id": root_id, "name": root_id, "mimeType": FOLDER_MIME, "parents": [],
+                "createdTime": self._now(), "trashed": False,
+            }
+
+    @staticmethod
+    def _now() -> str:
+        return time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+
+    def count(self, kind: str):
+        with self.lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            fail = self.error_rate > 0 and self.rng.random() < self.error_rate
+            if fail:
+                self.injected_errors += 1
+            return fail
+
+    def over_rate_limit(self, cost: int = 1) -> bool:
+        # Sliding one-second window, like Drive's per-user quota.
+        if self.rate_limit_qps <= 0:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            self.recent = [t for t in self.recent if now - t < 1.0]
+            if len(self.recent) + cost > self.rate_limit_qps:
+                self.rate_limited += 1
+                return True
+            self.recent.extend([now] * cost)
+            return False
+
+    def new_file(self, meta: Dict[str, Any], content: Optional[bytes] = None) -> Dict[str, Any]:
+        with self.lock:
+            for parent in meta.get("parents", []):
+                if parent not in self.files or self.files[parent]["trashed"]:
+                    raise KeyError(parent)
+            file_id = f"fake{next(self.ids)}"
+            record = {
+                "id": file_id,
+                "name": meta.get("name", "untitled"),
+                "mimeType": meta.get("mimeType", "application/octet-stream"),
+                "parents": list(meta.get("parents", [])),
+                "appProperties": dict(meta.get("appProperties") or {}),
+                "createdTime": self._now(),
+                "trashed": False,
+            }
+            if "shortcutDetails" in meta:
+                record["shortcutDetails"] = meta["shortcutDetails"]
+            self.files[file_id] = record
+            self.change_log.append(file_id)
+            if content is not None:
+                self._set_content(record, content)
+            return record
+
+    def _set_content(self, record: Dict[str, Any], content: bytes):
+        record["size"] = str(len(content))
+        record["sha256Checksum"] = hashlib.sha256(content).hexdigest()
+        record["md5Checksum"] = hashlib.md5(content).hexdigest()
+        self.bytes_received += len(content)
+        if len(content) <= KEEP_CONTENT_BYTES:
+            self.contents[record["id"]] = content
+
+    def set_content(self, file_id: str, content: bytes) -> Dict[str, Any]:
+        with self.lock:
+            record = self.files[file_id]
+            self._set_content(record, content)
+            self.change_log.append(file_id)
+            return dict(record)
+
+    def query(self, q: str) -> List[Dict[str, Any]]:
+        name = re.search(r"name\s*=\s*'((?:[^'\\]|\\.)*)'", q)
+        name_part = re.search(r"name\s+contains\s+'((?:[^'\\]|\\.)*)'", q)
+        mime = re.search(r"mimeType\s*=\s*'([^']*)'", q)
+        parent = re.search(r"'([^']*)'\s+in\s+parents", q)
+        not_trashed = "trashed=false" in q.replace(" ", "")
+        with self.lock:
+            out = []
+            for record in self.files.values():
+                if name and record["name"] != name.group(1).replace("\\'", "'"):
+                    continue
+                if name_part and name_part.group(1).replace("\\'", "'") not in record["name"]:
+                    continue
+                if mime and record["mimeType"] != mime.group(1):
+                    continue
+                if parent and parent.group(1) not in record["parents"]:
+                    continue
+                if not_trashed and record["trashed"]:
+                    continue
+                out.append(dict(record))
+        return sorted(out, key=lambda r: (r["createdTime"], int(r["id"][4:]) if r["id"][4:].isdigit() else 0))
+
+
+class FakeDriveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeDriveServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    # -------------------------
+    # Transport
+    # -------------------------
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        bandwidth = self.server.state.bandwidth_mbps
+        if bandwidth > 0 and body:
+            time.sleep(len(body) * 8 / (bandwidth * 1e6))
+        return body
+
+    def _send(self, status: int, body: Any = None, headers: Optional[Dict[str, str]] = None):
+        payload = b"" if body is None else (body if isinstance(body, bytes) else json.dumps(body).encode())
+        self.send_response(status)
+        self.send_header("Content-Type", (headers or {}).pop("Content-Type", "application/json; charset=UTF-8"))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, method: str):
+        state = self.server.state
+        body = self._read_body()
+        if state.latency_ms:
+            time.sleep(state.latency_ms / 1000.0)
+        parsed = urllib.parse.urlparse(self.path)
+        if parsed.path.startswith("/batch/"):
+            state.count("batch")
+            self._handle_batch(body)
+            return
+        if state.over_rate_limit():
+            self._send(403, RATE_LIMITED)
+            return
+        if state.should_fail():
+            self._send(503, {"error": {"code": 503, "message": "Injected backend error"}})
+            return
+        status, payload, headers = dispatch(state, method, self.path, dict(self.headers), body, self._base_url())
+        self._send(status, payload, headers)
+
+    def _base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handle_batch(self, body: bytes):
+        state = self.server.state
+        msg = BytesParser().parsebytes(
+            f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode() + body
+        )
+        boundary = "fake_batch_boundary"
+        chunks = []
+        for part in msg.get_payload():
+            raw = part.get_payload(decode=False)
+            head, _, inner_body = raw.replace("\r\n", "\n").partition("\n\n")
+            lines = head.split("\n")
+            method, path, _ = lines[0].split(" ", 2)
+            inner_headers = dict(line.split(": ", 1) for line in lines[1:] if ": " in line)
+            if state.over_rate_limit():
+                status, payload = 403, RATE_LIMITED
+            elif state.should_fail():
+                status, payload, _ = 503, {"error": {"code": 503, "message": "Injected backend error"}}, {}
+            else:
+                status, payload, _ = dispatch(
+                    state, method, path, inner_headers, inner_body.encode(), self._base_url()
+                )
+            content_id = part["Content-ID"].strip()
+            response_id = "<response-" + content_id[1:]
+            text = json.dumps(payload) if payload is not None else ""
+            chunks.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: {response_id}\r\n\r\n"
+                f"HTTP/1.1 {status} OK\r\nContent-Type: application/json; charset=UTF-8\r\n"
+                f"Content-Length: {len(text)}\r\n\r\n{text}\r\n"
+            )
+        chunks.append(f"--{boundary}--\r\n")
+        self._send(200, "".join(chunks).encode(), {"Content-Type": f"multipart/mixed; boundary={boundary}"})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+
+def _not_found(file_id: str) -> Tuple[int, Dict[str, Any], Dict[str, str]]:
+    return 404, {"error": {"code": 404, "message": f"File not found: {file_id}."}}, {}
+
+
+def dispatch(
+    state: FakeDriveState,
+    method: str,
+    path: str,
+    headers: Dict[str, str],
+    body: bytes,
+    base_url: str,
+) -> Tuple[int, Any, Dict[str, str]]:
+    parsed = urllib.parse.urlparse(path)
+    params = dict(urllib.parse.parse_qsl(parsed.query))
+    route = parsed.path
+
+    if route == "/drive/v3/files" and method == "GET":
+        state.count("files.list")
+        matches = state.query(params.get("q", ""))
+        page_size = int(params.get("pageSize", 100))
+        start = int(params.get("pageToken") or 0)
+        page = matches[start:start + page_size]
+        result: Dict[str, Any] = {"files": page}
+        if start + page_size < len(matches):
+            result["nextPageToken"] = str(start + page_size)
+        return 200, result, {}
+
+    if route == "/drive/v3/files" and method == "POST":
+        state.count("files.create")
+        try:
+            return 200, state.new_file(json.loads(body or b"{}")), {}
+        except KeyError as e:
+            return _not_found(str(e))
+
+    m = re.fullmatch(r"/drive/v3/files/([^/]+)", route)
+    if m and method == "GET":
+        state.count("files.get")
+        record = state.files.get(m.group(1))
+        if record is None:
+            return _not_found(m.group(1))
+        if params.get("alt") == "media":
+            data = state.contents.get(m.group(1), b"")
+            ranged = re.fullmatch(r"bytes=(\d+)-(\d*)", headers.get("range") or headers.get("Range") or "")
+            if ranged and data:
+                start = int(ranged.group(1))
+                end = min(int(ranged.group(2) or len(data) - 1), len(data) - 1)
+                return 206, data[start:end + 1], {
+                    "Content-Type": "application/octet-stream",
+                    "Content-Range": f"bytes {start}-{end}/{len(data)}",
+                }
+            return 200, data, {"Content-Type": "application/octet-stream"}
+        return 200, dict(record), {}
+
+    if m and method == "PATCH":
+        state.count("files.update")
+        with state.lock:
+            record = state.files.get(m.group(1))
+            if record is None:
+                return _not_found(m.group(1))
+            if body:
+                patch = json.loads(body)
+                record.update({k: v for k, v in patch.items() if k in ("name", "trashed", "appProperties")})
+            if params.get("removeParents"):
+                record["parents"] = [p for p in record["parents"] if p != params["removeParents"]]
+            if params.get("addParents"):
+                record["parents"].append(params["addParents"])
+            state.change_log.append(record["id"])
+            return 200, dict(record), {}
+
+    if route == "/upload/drive/v3/files" and method == "POST" and params.get("uploadType") == "multipart":
+        state.count("upload.multipart")
+        content_type = headers.get("content-type") or headers.get("Content-Type")
+        msg = BytesParser().parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        meta_part, media_part = msg.get_payload()
+        meta = json.loads(meta_part.get_payload(decode=True) or b"{}")
+        try:
+            return 200, state.new_file(meta, media_part.get_payload(decode=True) or b""), {}
+        except KeyError as e:
+            return _not_found(str(e))
+
+    m_upload = re.fullmatch(r"/upload/drive/v3/files/([^/]+)", route)
+    if m_upload and method == "PATCH" and params.get("uploadType") in ("media", "multipart"):
+        state.count("upload.update")
+        if m_upload.group(1) not in state.files:
+            return _not_found(m_upload.group(1))
+        if params["uploadType"] == "multipart":
+            content_type = headers.get("content-type") or headers.get("Content-Type")
+            msg = BytesParser().parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+            body = msg.get_payload()[1].get_payload(decode=True) or b""
+        return 200, state.set_content(m_upload.group(1), body), {}
+
+    if route == "/upload/drive/v3/files" and method == "POST" and params.get("uploadType") == "resumable":
+        state.count("upload.resumable_start")
+        meta = json.loads(body or b"{}")
+        for parent in meta.get("parents", []):
+            if parent not in state.files:
+                return _not_found(parent)
+        upload_id = f"up{next(state.ids)}"
+        with state.lock:
+            state.uploads[upload_id] = {"meta": meta, "data": bytearray()}
+        location = f"{base_url}/upload/drive/v3/files?uploadType=resumable&upload_id={upload_id}"
+        return 200, {}, {"Location": location}
+
+    if route == "/upload/drive/v3/files" and method == "PUT" and params.get("upload_id"):
+        state.count("upload.resumable_chunk")
+        upload = state.uploads.get(params["upload_id"])
+        if upload is None:
+            return _not_found(params["upload_id"])
+        content_range = headers.get("Content-Range") or headers.get("content-range") or ""
+        m_range = re.fullmatch(r"bytes (\*|(\d+)-(\d+))/(\*|\d+)", content_range.strip())
+        data = upload["data"]
+        total = None
+        if m_range:
+            if m_range.group(4) != "*":
+                total = int(m_range.group(4))
+            if m_range.group(1) != "*":
+                start = int(m_range.group(2))
+                if start == len(data):
+                    data.extend(body)
+        elif body:
+            data.extend(body)
+            total = len(data)
+        if total is not None and len(data) >= total:
+            with state.lock:
+                state.uploads.pop(params["upload_id"], None)
+            try:
+                return 200, state.new_file(upload["meta"], bytes(data)), {}
+            except KeyError as e:
+                return _not_found(str(e))
+        headers_out = {"Range": f"bytes=0-{len(data) - 1}"} if data else {}
+        return 308, None, headers_out
+
+    if route == "/drive/v3/changes/startPageToken" and method == "GET":
+        state.count("changes.getStartPageToken")
+        return 200, {"startPageToken": str(len(state.change_log))}, {}
+
+    if route == "/drive/v3/changes" and method == "GET":
+        state.count("changes.list")
+        start = int(params["pageToken"])
+        page_size = int(params.get("pageSize", 100))
+        with state.lock:
+            ids = state.change_log[start:start + page_size]
+            end = len(state.change_log)
+            changes = [
+                {"fileId": file_id, "removed": False, "file": dict(state.files[file_id])} for file_id in ids
+            ]
+        result = {"changes": changes}
+        if start + page_size < end:
+            result["nextPageToken"] = str(start + page_size)
+        else:
+            result["newStartPageToken"] = str(end)
+        return 200, result, {}
+
+    return 404, {"error": {"code": 404, "message": f"No fake route for {method} {route}"}}, {}
+
+
+class FakeDriveServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, state: FakeDriveState, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), FakeDriveHandler)
+        self.state = state
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "FakeDriveServer":
+        threading.Thread(target=self.serve_forever, name="fake-drive", daemon=True).start()
+        return self
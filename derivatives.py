@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Downscaled training derivatives, rendered in worker processes (see
+# DERIVATIVE_SIZES in weed_collector.py). Kept free of Streamlit so spawned
+# pool workers import only PIL.
+import io
+from typing import List, Tuple, Union
+
+from PIL import Image, ImageOps
+
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except Exception:
+    pass
+
+def render_derivatives(source: Union[bytes, str], sizes: Tuple[int, ...], quality: int = 90) -> List[Tuple[int, bytes]]:
+    # source: image bytes or a file path. Returns [(size, jpeg_bytes)] with
+    # the long edge at each size (never upscaled) and EXIF orientation
+    # applied; [] if the file can't be decoded.
+    try:
+        with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as img:
+            # JPEG can decode straight at a reduced scale (never below the box).
+            largest = max(sizes)
+            img.draft("RGB", (largest, largest))
+            img = ImageOps.exif_transpose(img).convert("RGB")
+    except Exception:
+        return []
+
+    out = []
+    for px in sorted(set(sizes), reverse=True):
+        # Each size is reduced from the previous one, largest first.
+        if max(img.size) > px:
+            img.thumbnail((px, px), Image.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=quality, optimize=True)
+        out.append((px, buf.getvalue()))
+    return out
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+# Bulk export of captures from the Drive tree into DEST/ZIP/DATE/<filename>.
+#
+# Selects files from the local capture catalog (synced from Drive first) by
+# the fields make_filename() encodes, downloads them in parallel, and can be
+# stopped and re-run: finished files whose size and SHA-256 match are
+# skipped, and partial downloads (*.part) continue from where they stopped.
+#
+#   GCP_SERVICE_ACCOUNT_FILE=key.json python export_dataset.py --dest data \
+#       --zip 20740 --year 2025 --weed Crabgrass --height H1m --workers 8
+import argparse
+import hashlib
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+# The export syncs once itself; no background sync thread.
+os.environ.setdefault("CATALOG_SYNC_SEC", "0")
+
+from googleapiclient.errors import HttpError  # noqa: E402
+
+from weed_collector import (  # noqa: E402
+    HEIGHTS,
+    PRIORITY_BULK,
+    UPLOAD_CHUNK_SIZE,
+    UPLOAD_READ_BLOCK,
+    UPLOAD_WORKERS,
+    drive_priority,
+    get_catalog,
+    get_drive_service,
+    silence_streamlit_bare_mode,
+    sync_catalog,
+)
+
+
+def file_digest(path: str, algorithm: str) -> str:
+    digest = hashlib.new(algorithm)
+    block = memoryview(bytearray(UPLOAD_READ_BLOCK))
+    with open(path, "rb", buffering=0) as fh:
+        while True:
+            n = fh.readinto(block)
+            if not n:
+                break
+            digest.update(block[:n])
+    return digest.hexdigest()
+
+
+def remote_checksum(row: Dict[str, Any]) -> Tuple[Optional[str], Optional[str], Optional[int]]:
+    # (algorithm, hex digest, size). The catalog has the SHA-256 for files
+    # it learned from Drive listings; manifest rows need one files.get.
+    if row.get("sha256") and row.get("size") is not None:
+        return "sha256", row["sha256"], row["size"]
+    meta = get_drive_service().files().get(
+        fileId=row["file_id"], fields="sha256Checksum,md5Checksum,size", supportsAllDrives=True
+    ).execute()
+    size = int(meta["size"]) if meta.get("size") else None
+    if meta.get("sha256Checksum"):
+        return "sha256", meta["sha256Checksum"], size
+    if meta.get("md5Checksum"):
+        return "md5", meta["md5Checksum"], size
+    return None, None, size
+
+
+def download_to(path: str, file_id: str, chunk_size: int, size: Optional[int] = None):
+    # Appends to path, starting at its current length, one ranged request
+    # per chunk. A short chunk (or a 416 past the end) means done.
+    service = get_drive_service()
+    with open(path, "ab") as fh:
+        offset = fh.tell()
+        while size is None or offset < size:
+            request = service.files().get_media(fileId=file_id, supportsAllDrives=True)
+            request.headers["Range"] = f"bytes={offset}-{offset + chunk_size - 1}"
+            try:
+                data = request.execute(num_retries=5)
+            except HttpError as e:
+                if e.resp.status == 416:
+                    return
+                raise
+            fh.write(data)
+            offset += len(data)
+            if len(data) < chunk_size:
+                return
+
+
+def export_file(row: Dict[str, Any], dest: str, chunk_size: int) -> str:
+    # Returns "skipped" or "downloaded"; raises on failure.
+    folder = os.path.join(dest, row.get("zipcode") or "_unknown", row.get("date_str") or "_undated")
+    path = os.path.join(folder, row["name"])
+    part = path + ".part"
+    os.makedirs(folder, exist_ok=True)
+
+    algorithm, expected, size = remote_checksum(row)
+    if os.path.exists(path) and (size is None or os.path.getsize(path) == size):
+        if expected is None or file_digest(path, algorithm) == expected:
+            return "skipped"
+
+    with drive_priority(PRIORITY_BULK):
+        for _ in range(2):
+            have = os.path.getsize(part) if os.path.exists(part) else 0
+            if size is None or have < size:
+                if size is None and have:
+                    # No size to resume against; start over.
+                    os.remove(part)
+                download_to(part, row["file_id"], chunk_size, size)
+            if expected is None or file_digest(part, algorithm) == expected:
+                os.replace(part, path)
+                return "downloaded"
+            # A corrupt or stale .part: drop it and fetch the file once more.
+            os.remove(part)
+    raise ValueError(f"{algorithm} mismatch after download")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Export captures from Drive to a local directory.")
+    parser.add_argument("--dest", required=True, help="local directory; files land in DEST/ZIP/DATE/")
+    parser.add_argument("--zip", dest="zipcode", help="5-digit ZIP")
+    parser.add_argument("--year", type=int)
+    parser.add_argument("--date-from", help="YYYYMMDD, inclusive")
+    parser.add_argument("--date-to", help="YYYYMMDD, inclusive")
+    parser.add_argument("--weed")
+    parser.add_argument("--grass")
+    parser.add_argument("--turf")
+    parser.add_argument("--height", choices=[tag for _, tag in HEIGHTS], help="height tag, e.g. H1m")
+    parser.add_argument("--include-variants", action="store_true", help="also export resized derivatives")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--workers", type=int, default=UPLOAD_WORKERS * 2)
+    parser.add_argument("--chunk-mb", type=int, default=UPLOAD_CHUNK_SIZE // (1024 * 1024))
+    parser.add_argument("--no-sync", action="store_true", help="use the catalog as it is")
+    parser.add_argument("--dry-run", action="store_true", help="list matching files only")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if not args.no_sync:
+        result = sync_catalog(get_drive_service())
+        print(f"catalog: {result}")
+    rows = get_catalog().query(
+        zipcode=args.zipcode,
+        year=args.year,
+        date_from=args.date_from,
+        date_to=args.date_to,
+        weed=args.weed,
+        grass=args.grass,
+        turf=args.turf,
+        height=args.height,
+        include_variants=args.include_variants,
+        limit=args.limit,
+    )
+    print(f"{len(rows)} matching files")
+    if args.dry_run:
+        for row in rows:
+            print(f"{row.get('zipcode')}/{row.get('date_str')}/{row['name']}")
+        return 0
+
+    chunk_size = max(1, args.chunk_mb) * 1024 * 1024
+    counts = {"downloaded": 0, "skipped": 0, "failed": 0}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(export_file, row, args.dest, chunk_size): row for row in rows}
+        for i, future in enumerate(as_completed(futures), 1):
+            row = futures[future]
+            try:
+                outcome = future.result()
+            except Exception as e:
+                outcome = "failed"
+                print(f"FAILED {row.get('zipcode')}/{row.get('date_str')}/{row['name']}: {e}", file=sys.stderr)
+            counts[outcome] += 1
+            if i % 100 == 0:
+                print(f"{i}/{len(rows)} ...")
+    elapsed = time.perf_counter() - start
+    print(
+        f"downloaded={counts['downloaded']} skipped={counts['skipped']} "
+        f"failed={counts['failed']} in {elapsed:.1f}s"
+    )
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    silence_streamlit_bare_mode()
+    sys.exit(main())
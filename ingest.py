@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# Uploads a directory of photos (e.g. an SD card) straight to Drive, with the
+# same ZIP/date folders, set grouping and filenames as the page's batch tab.
+#
+# Photos are grouped into 1 m / 50 cm / 20 cm sets by EXIF capture time, or
+# with --order by filename (shot order, 3 per set). Files are streamed from
+# disk; nothing is buffered in memory or in the upload spool. Ctrl-C stops
+# at the next chunk or file and keeps (and records) what finished.
+#
+# With STORAGE_MIRROR set, mirror copies are queued in the upload spool and
+# sent in the background; the run waits for them at the end. Ctrl-C leaves
+# them queued for the next run or the app's spool workers.
+#
+#   GCP_SERVICE_ACCOUNT_FILE=key.json python ingest.py /media/sdcard/DCIM/100CANON \
+#       --zip 20740 --tz EST --turf Fairway --grass Bentgrass --weed Crabgrass
+import argparse
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from typing import List, Optional
+
+# A one-shot upload; no background catalog sync.
+os.environ.setdefault("CATALOG_SYNC_SEC", "0")
+
+from weed_collector import (  # noqa: E402
+    INGEST_BATCH_FILES,
+    TURF_OPTIONS,
+    TZ_OPTIONS,
+    UPLOAD_WORKERS,
+    UploadCancelled,
+    UploadProgress,
+    get_mirror_backend,
+    get_upload_spool,
+    ingest_jobs,
+    list_local_photos,
+    plan_local_ingest,
+    silence_streamlit_bare_mode,
+)
+
+
+PROGRESS_EVERY_SEC = 5.0
+
+
+def print_progress(snap):
+    finished = snap["files_done"] + snap["files_failed"] + snap["files_cancelled"]
+    eta = f"{snap['eta_sec']}s" if snap["eta_sec"] is not None else "--"
+    print(
+        f"{finished}/{snap['total_files']} files  "
+        f"{snap['bytes_sent'] / 1e6:.1f}/{snap['total_bytes'] / 1e6:.1f} MB  "
+        f"{snap['mb_per_s']:.2f} MB/s  ETA {eta}"
+    )
+
+
+def wait_for_mirror(since: float, interrupted: bool = False):
+    spool = get_upload_spool()
+    queued = spool.outstanding("mirror", since)
+    last_print = 0.0
+    try:
+        while queued and not interrupted:
+            if time.monotonic() - last_print >= PROGRESS_EVERY_SEC:
+                print(f"mirror: {queued} cop{'y' if queued == 1 else 'ies'} left")
+                last_print = time.monotonic()
+            time.sleep(0.5)
+            queued = spool.outstanding("mirror", since)
+    except KeyboardInterrupt:
+        queued = spool.outstanding("mirror", since)
+    if queued:
+        print(f"{queued} mirror cop{'y' if queued == 1 else 'ies'} left queued in the upload spool", file=sys.stderr)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    turf_values = {label.lower(): value for label, value in TURF_OPTIONS}
+    turf_values.update({value.lower(): value for _, value in TURF_OPTIONS})
+
+    def zipcode(value: str) -> str:
+        if not re.fullmatch(r"\d{5}", value):
+            raise argparse.ArgumentTypeError("ZIP Code must be exactly 5 digits")
+        return value
+
+    def turf(value: str) -> str:
+        if value.lower() not in turf_values:
+            raise argparse.ArgumentTypeError(f"one of {', '.join(v for _, v in TURF_OPTIONS)}")
+        return turf_values[value.lower()]
+
+    parser = argparse.ArgumentParser(description="Upload a directory of 3-shot photo sets to Drive.")
+    parser.add_argument("directory")
+    parser.add_argument("--zip", dest="zipcode", type=zipcode, required=True, help="5-digit ZIP Code")
+    parser.add_argument("--tz", choices=list(TZ_OPTIONS), required=True)
+    parser.add_argument("--turf", type=turf, required=True, help="PG / Tees / Fairway / Rough")
+    parser.add_argument("--grass", required=True, help="turfgrass type, e.g. Bentgrass")
+    parser.add_argument("--weed", required=True, help="weed name, e.g. Crabgrass")
+    parser.add_argument("--order", action="store_true", help="group by filename order instead of EXIF time")
+    parser.add_argument("--recursive", action="store_true", help="include subdirectories")
+    parser.add_argument("--workers", type=int, default=UPLOAD_WORKERS)
+    parser.add_argument("--batch-files", type=int, default=INGEST_BATCH_FILES, help="files per upload pass")
+    parser.add_argument("--dry-run", action="store_true", help="print the planned filenames only")
+    args = parser.parse_args(argv)
+    if not args.grass.strip() or not args.weed.strip():
+        parser.error("--grass and --weed must not be empty")
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    tz_name = TZ_OPTIONS[args.tz]
+    photos = list_local_photos(args.directory, recursive=args.recursive)
+    if not photos:
+        print(f"No photos in {args.directory}", file=sys.stderr)
+        return 1
+
+    jobs, incomplete, undated = plan_local_ingest(
+        photos, args.turf, args.grass.strip(), args.weed.strip(), tz_name, group_by_exif=not args.order
+    )
+    for photo in undated:
+        print(f"SKIPPED (no EXIF capture time) {photo.path}", file=sys.stderr)
+    for burst in incomplete:
+        print(
+            f"SKIPPED {len(burst)} shot(s), not a multiple of 3: {', '.join(p.name for p in burst)}",
+            file=sys.stderr,
+        )
+    print(f"{len(photos)} photo(s) -> {len(jobs) // 3} set(s), {len(jobs)} file(s)")
+    if args.dry_run:
+        for job in jobs:
+            print(f"{args.zipcode}/{job['date_str']}/{job['filename']}  <- {job['source'].path}")
+        return 0
+
+    started_at = time.time()
+    progress = UploadProgress(jobs)
+    failed = []
+    outcome = {"error": None}
+
+    def report(date_str, results):
+        for filename, err in results:
+            if err is not None and not isinstance(err, UploadCancelled):
+                failed.append(filename)
+                print(f"FAILED {args.zipcode}/{date_str}/{filename}: {err}", file=sys.stderr)
+
+    def run():
+        try:
+            ingest_jobs(
+                jobs, args.zipcode, tz_name, max_workers=args.workers,
+                batch_files=args.batch_files, on_batch=report, progress=progress,
+            )
+        except Exception as e:
+            outcome["error"] = e
+
+    worker = threading.Thread(target=run, name="ingest", daemon=True)
+    worker.start()
+    while worker.is_alive():
+        try:
+            worker.join(timeout=PROGRESS_EVERY_SEC)
+        except KeyboardInterrupt:
+            print("Cancelling; files already uploaded are kept...", file=sys.stderr)
+            progress.cancel()
+            continue
+        print_progress(progress.snapshot())
+
+    if get_mirror_backend() is not None:
+        wait_for_mirror(started_at, interrupted=progress.cancelled)
+
+    snap = progress.snapshot()
+    if outcome["error"] is not None:
+        print(f"Ingest failed: {outcome['error']}", file=sys.stderr)
+    print(
+        f"uploaded={snap['files_done']} failed={snap['files_failed']} "
+        f"cancelled={snap['files_cancelled']} in {snap['elapsed_sec']:.1f}s"
+    )
+    return 1 if failed or snap["files_cancelled"] or outcome["error"] is not None else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    silence_streamlit_bare_mode()
+    sys.exit(main())
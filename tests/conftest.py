@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# Shared fixtures. weed_collector is imported headless (as the CLIs do),
+# every test gets its own APP_DATA_DIR state, and fake_drive points the
+# Drive client at the local fake server from bench/fake_drive.py.
+#
+#   python -m pytest -q
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+os.environ["WEED_COLLECTOR_DATA_DIR"] = tempfile.mkdtemp(prefix="weed_tests_")
+os.environ["CATALOG_SYNC_SEC"] = "0"
+os.environ["TIMING_LOG"] = "0"
+os.environ["STORAGE_BACKEND"] = "drive"
+os.environ["STORAGE_MIRROR"] = ""
+
+import streamlit as st  # noqa: E402
+
+import weed_collector as wc  # noqa: E402
+from bench_upload import fake_service_factories  # noqa: E402
+from fake_drive import FakeDriveServer, FakeDriveState  # noqa: E402
+
+wc.silence_streamlit_bare_mode()
+
+# The date folder the storage and mirror tests upload into.
+ZIP, TZ, DATE = "20740", "America/New_York", "20250601"
+
+DATA_PATHS = (
+    "FOLDER_CACHE_PATH", "HASH_INDEX_PATH", "METRICS_PATH", "MANIFEST_DB_PATH",
+    "CATALOG_PATH", "CAPTURE_DIR", "SPOOL_DIR", "SPOOL_DB_PATH",
+)
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    # Fresh folder cache, hash index, outbox, spool, ... for every test.
+    for name in DATA_PATHS:
+        monkeypatch.setattr(wc, name, str(tmp_path / "data" / os.path.basename(getattr(wc, name))))
+    st.cache_resource.clear()
+    yield tmp_path
+    st.cache_resource.clear()
+
+
+@pytest.fixture
+def fake_drive(monkeypatch):
+    state = FakeDriveState([wc.PARENT_FOLDER_ID])
+    server = FakeDriveServer(state).start()
+    build_fake_service, thread_service = fake_service_factories(wc, server)
+    monkeypatch.setattr(wc, "get_drive_credentials", lambda: None)
+    monkeypatch.setattr(wc, "build_drive_service", build_fake_service)
+    monkeypatch.setattr(wc, "get_drive_service", thread_service)
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+def children(state: FakeDriveState, parent_id: str):
+    return [f for f in state.files.values() if parent_id in f["parents"] and not f["trashed"]]
+
+
+def date_folder(state: FakeDriveState, zipcode: str, date_str: str) -> str:
+    (zip_folder,) = [f for f in children(state, wc.PARENT_FOLDER_ID) if f["name"] == zipcode]
+    (folder,) = [f for f in children(state, zip_folder["id"]) if f["name"] == date_str]
+    return folder["id"]
+
+
+def make_jobs(n):
+    return [
+        {"source": f"photo {i}".encode(), "size": 7, "mimetype": "image/jpeg", "filename": f"f{i}.jpg",
+         "record": {"weed_name": "Crabgrass"}}
+        for i in range(n)
+    ]
+
+
+def manifest_rows(storage):
+    return [json.loads(line) for content in storage._read_manifests(f"{ZIP}/{DATE}") for line in content.splitlines()]
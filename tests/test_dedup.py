@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import weed_collector as wc
+from conftest import children
+
+PHOTO = b"\xff\xd8\xff\xe0 same bytes"
+
+
+def folders():
+    _, a, _ = wc.ensure_zip_date_folder("20740", "America/New_York", "20250601")
+    _, b, _ = wc.ensure_zip_date_folder("20740", "America/New_York", "20250602")
+    return a, b
+
+
+def upload(parent_id, name="a.jpg", mode="skip"):
+    return wc.upload_bytes_to_drive(PHOTO, "image/jpeg", name, parent_id, dedup_mode=mode)
+
+
+def test_same_folder_duplicate_is_skipped(fake_drive):
+    a, _ = folders()
+    first = upload(a)
+    again = upload(a, "b.jpg")
+    assert again == {"id": first["id"], "duplicate_of": first["id"]}
+    assert [f["name"] for f in children(fake_drive, a)] == ["a.jpg"]
+
+
+def test_skip_mode_still_uploads_into_another_folder(fake_drive):
+    a, b = folders()
+    upload(a)
+    created = upload(b)
+    assert "duplicate_of" not in created
+    assert [f["name"] for f in children(fake_drive, b)] == ["a.jpg"]
+
+
+def test_link_mode_adds_a_shortcut_in_another_folder(fake_drive):
+    a, b = folders()
+    first = upload(a, mode="link")
+    linked = upload(b, mode="link")
+    assert linked["duplicate_of"] == first["id"]
+    (shortcut,) = children(fake_drive, b)
+    assert shortcut["mimeType"] == wc.SHORTCUT_MIME
+    assert shortcut["shortcutDetails"] == {"targetId": first["id"]}
+
+
+def test_trashed_or_moved_files_are_not_trusted(fake_drive):
+    a, b = folders()
+    first = upload(a)
+    fake_drive.files[first["id"]]["trashed"] = True
+    second = upload(a)
+    assert "duplicate_of" not in second
+
+    # Moved out of the folder after it was indexed.
+    fake_drive.files[second["id"]]["parents"] = [b]
+    third = upload(a)
+    assert "duplicate_of" not in third
+    assert [f["id"] for f in children(fake_drive, a)] == [third["id"]]
+
+
+def test_candidates_are_checked_in_one_batch(fake_drive):
+    a, _ = folders()
+    upload(a)
+    calls = dict(fake_drive.calls)
+    upload(a)
+    assert fake_drive.calls.get("batch", 0) - calls.get("batch", 0) == 1
+    assert fake_drive.calls.get("files.get", 0) - calls.get("files.get", 0) == 1
+
+
+def test_concurrent_uploads_share_one_transfer(fake_drive, monkeypatch):
+    a, _ = folders()
+    entered, release = threading.Event(), threading.Event()
+    upload_deduplicated = wc._upload_deduplicated
+
+    def slow_leader(*args):
+        entered.set()
+        release.wait(5)
+        return upload_deduplicated(*args)
+
+    monkeypatch.setattr(wc, "_upload_deduplicated", slow_leader)
+    results = {}
+
+    def run(name):
+        results[name] = wc.upload_bytes_to_drive(PHOTO, "image/jpeg", name, a, service=wc.build_drive_service())
+
+    leader = threading.Thread(target=run, args=("a.jpg",))
+    leader.start()
+    entered.wait(5)
+    follower = threading.Thread(target=run, args=("b.jpg",))
+    follower.start()
+    time.sleep(0.2)  # let the follower queue up behind the leader
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert "duplicate_of" not in results["a.jpg"]
+    assert results["b.jpg"] == {"id": results["a.jpg"]["id"], "duplicate_of": results["a.jpg"]["id"]}
+    assert [f["name"] for f in children(fake_drive, a)] == ["a.jpg"]
+    assert fake_drive.calls.get("upload.multipart") == 1
+
+
+def test_skipped_duplicate_keeps_the_original_in_the_catalog(fake_drive):
+    a, _ = folders()
+    uploads = [
+        ("turf_tall-fescue_crabgrass_H1m_20250601_100000.jpg", "H1m", "20250601_100000"),
+        ("turf_tall-fescue_crabgrass_H20cm_20250601_110000.jpg", "H20cm", "20250601_110000"),
+    ]
+    for name, height, stamp in uploads:
+        job = {
+            "filename": name, "mimetype": "image/jpeg", "size": len(PHOTO),
+            "record": {"zipcode": "20740", "weed_name": "Crabgrass", "height_tag": height, "set_timestamp": stamp},
+        }
+        wc.record_upload(job, upload(a, name), [], a)
+    wc.flush_pending_manifests()
+
+    wc.bootstrap_catalog(wc.get_catalog(), wc.get_drive_service())
+    row, = [row for row in wc.get_catalog().query(zipcode="20740") if row["source"] == "manifest"]
+    assert (row["name"], row["height_tag"], row["set_timestamp"]) == (
+        uploads[0][0], "H1m", "20250601_100000"
+    )
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import json
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+import weed_collector as wc
+from conftest import children, date_folder
+
+PHOTO = b"\xff\xd8\xff\xe0 original"
+
+
+@pytest.fixture
+def flaky_derivatives(fake_drive, monkeypatch):
+    # Two sizes, rendered without the process pool; the first 256 px upload
+    # fails with a 503. Dedup is off, so a repeated upload would show up.
+    monkeypatch.setattr(wc, "DERIVATIVE_SIZES", (512, 256))
+    # (The callers' default sizes were bound at import, when the stage was off.)
+    monkeypatch.setattr(wc, "make_derivatives", lambda source, filename, sizes=(): [
+        (px, wc.derivative_filename(filename, px), b"jpeg %d" % px) for px in sizes or wc.DERIVATIVE_SIZES
+    ])
+    upload = wc.upload_bytes_to_drive
+    failures = []
+
+    def flaky_upload(source, mimetype, filename, parent_id, service=None, **kwargs):
+        if filename.endswith("_256px.jpg") and not failures:
+            failures.append(filename)
+            raise HttpError(httplib2.Response({"status": 503}), b"backend error")
+        return upload(source, mimetype, filename, parent_id, service=service, dedup_mode="off")
+
+    monkeypatch.setattr(wc, "upload_bytes_to_drive", flaky_upload)
+    return fake_drive
+
+
+def names(state):
+    return sorted(f["name"] for f in children(state, date_folder(state, "20740", "20250601")))
+
+
+def test_spool_retry_uploads_only_missing_derivatives(flaky_derivatives, data_dir):
+    spool = wc.UploadSpool(str(data_dir / "spool" / "queue.sqlite3"), str(data_dir / "spool"))
+    job = {"source": PHOTO, "mimetype": "image/jpeg", "filename": "a.jpg", "record": {"weed": "Crabgrass"}}
+    spool.enqueue([job], "20740", "America/New_York", "20250601")
+    service = wc.get_drive_service()
+
+    job = spool.claim_next()
+    with pytest.raises(HttpError):
+        wc.upload_spooled_drive_job(spool, job, service)
+    spool.mark_retry(job["id"], "503", delay=0)
+
+    job = spool.claim_next()
+    created = wc.upload_spooled_drive_job(spool, job, service)
+    assert names(flaky_derivatives) == ["a.jpg", "a_256px.jpg", "a_512px.jpg"]
+    ((_, row),) = wc.get_manifest_outbox().pending(date_folder(flaky_derivatives, "20740", "20250601"))
+    row = json.loads(row)
+    assert row["drive_file_id"] == created["id"]
+    assert sorted(d["px"] for d in row["derivatives"]) == [256, 512]
+
+
+def test_inline_derivative_failure_keeps_the_original(flaky_derivatives):
+    _, parent_id, _ = wc.ensure_zip_date_folder("20740", "America/New_York", "20250601")
+    job = {"source": PHOTO, "size": len(PHOTO), "mimetype": "image/jpeg", "filename": "a.jpg", "record": {}}
+    assert wc.upload_jobs_to_drive([job], parent_id, max_workers=1) == [("a.jpg", None)]
+    assert names(flaky_derivatives) == ["a.jpg", "a_512px.jpg"]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+import export_dataset
+import weed_collector as wc
+
+DATA = bytes(range(256)) * 40  # 10 KiB
+
+
+@pytest.fixture
+def remote(fake_drive, monkeypatch):
+    monkeypatch.setattr(export_dataset, "get_drive_service", wc.get_drive_service)
+    f = fake_drive.new_file({"name": "a.jpg", "parents": [wc.PARENT_FOLDER_ID]}, DATA)
+    return f["id"]
+
+
+def test_download_resumes_from_the_part_file(remote, tmp_path):
+    part = tmp_path / "a.jpg.part"
+    part.write_bytes(DATA[:3000])
+    export_dataset.download_to(str(part), remote, chunk_size=4096, size=len(DATA))
+    assert part.read_bytes() == DATA
+
+
+def test_download_without_size_stops_at_the_end(remote, tmp_path):
+    part = tmp_path / "a.jpg.part"
+    export_dataset.download_to(str(part), remote, chunk_size=1024)
+    assert part.read_bytes() == DATA
+
+
+def test_export_file_replaces_a_corrupt_part(remote, tmp_path):
+    row = {"file_id": remote, "name": "a.jpg", "zipcode": "20740", "date_str": "20250601"}
+    part = tmp_path / "20740" / "20250601" / "a.jpg.part"
+    part.parent.mkdir(parents=True)
+    part.write_bytes(b"x" * 100)
+    assert export_dataset.export_file(row, str(tmp_path), chunk_size=4096) == "downloaded"
+    assert (part.parent / "a.jpg").read_bytes() == DATA and not os.path.exists(part)
+    assert export_dataset.export_file(row, str(tmp_path), chunk_size=4096) == "skipped"
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+import weed_collector as wc
+from conftest import children
+
+
+def test_duplicate_date_folders_are_merged(fake_drive):
+    zip_id = fake_drive.new_file({"name": "20740", "parents": [wc.PARENT_FOLDER_ID], "mimeType": wc.FOLDER_MIME})["id"]
+    keep = fake_drive.new_file({"name": "20250601", "parents": [zip_id], "mimeType": wc.FOLDER_MIME})["id"]
+    dup = fake_drive.new_file({"name": "20250601", "parents": [zip_id], "mimeType": wc.FOLDER_MIME})["id"]
+    fake_drive.new_file({"name": "a.jpg", "parents": [keep]}, b"a")
+    fake_drive.new_file({"name": "b.jpg", "parents": [dup]}, b"b")
+
+    assert len(wc.reconcile_duplicate_folders(dry_run=True)) == 1
+    assert len(children(fake_drive, zip_id)) == 2
+
+    (merged,) = wc.reconcile_duplicate_folders()
+    assert (merged["kept"], merged["merged"], merged["moved"]) == (keep, dup, 1)
+    assert [f["id"] for f in children(fake_drive, zip_id)] == [keep]
+    assert sorted(f["name"] for f in children(fake_drive, keep)) == ["a.jpg", "b.jpg"]
+
+
+def test_trash_is_retried_on_transient_errors(fake_drive, monkeypatch):
+    zip_id = fake_drive.new_file({"name": "20740", "parents": [wc.PARENT_FOLDER_ID], "mimeType": wc.FOLDER_MIME})["id"]
+    fake_drive.new_file({"name": "20250601", "parents": [zip_id], "mimeType": wc.FOLDER_MIME})
+    fake_drive.new_file({"name": "20250601", "parents": [zip_id], "mimeType": wc.FOLDER_MIME})
+    fake_drive.error_rate = 0.5
+    monkeypatch.setattr(wc, "UPLOAD_MAX_RETRIES", 20)
+    monkeypatch.setattr(wc.time, "sleep", lambda s: None)
+    assert len(wc.reconcile_duplicate_folders()) == 1
+    fake_drive.error_rate = 0.0
+    assert len(children(fake_drive, zip_id)) == 1
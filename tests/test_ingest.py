@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import io
+
+from PIL import Image
+
+import weed_collector as wc
+
+TZ = "America/New_York"
+
+
+def write_photo(directory, name, exif_time=None):
+    exif = Image.Exif()
+    if exif_time:
+        exif.get_ifd(wc.EXIF_IFD)[wc.EXIF_DATETIME_ORIGINAL] = exif_time
+    out = io.BytesIO()
+    Image.new("RGB", (64, 48), "green").save(out, format="JPEG", exif=exif)
+    (directory / name).write_bytes(out.getvalue())
+
+
+def plan(directory, group_by_exif=True):
+    photos = wc.list_local_photos(str(directory))
+    return wc.plan_local_ingest(photos, "Fairway", "Bentgrass", "Crabgrass", TZ, group_by_exif=group_by_exif)
+
+
+def summary(jobs):
+    return [(job["source"].name, job["filename"].split("_", 3)[3], job["date_str"]) for job in jobs]
+
+
+def test_exif_bursts_become_sets_in_capture_order(tmp_path):
+    # Shot order is capture time, not filename (e.g. after a counter reset).
+    write_photo(tmp_path, "IMG_0003.JPG", "2025:06:01 10:15:00")
+    write_photo(tmp_path, "IMG_0001.JPG", "2025:06:01 10:15:04")
+    write_photo(tmp_path, "IMG_0002.JPG", "2025:06:01 10:15:09")
+    write_photo(tmp_path, "IMG_0004.JPG", "2025:06:02 08:00:00")
+    write_photo(tmp_path, "IMG_0005.JPG", "2025:06:02 08:00:05")
+    write_photo(tmp_path, "IMG_0006.JPG", "2025:06:02 08:00:10")
+    jobs, incomplete, undated = plan(tmp_path)
+    assert summary(jobs) == [
+        ("IMG_0003.JPG", "H1m_20250601_101500.jpg", "20250601"),
+        ("IMG_0001.JPG", "H50cm_20250601_101500.jpg", "20250601"),
+        ("IMG_0002.JPG", "H20cm_20250601_101500.jpg", "20250601"),
+        ("IMG_0004.JPG", "H1m_20250602_080000.jpg", "20250602"),
+        ("IMG_0005.JPG", "H50cm_20250602_080000.jpg", "20250602"),
+        ("IMG_0006.JPG", "H20cm_20250602_080000.jpg", "20250602"),
+    ]
+    assert incomplete == [] and undated == []
+    assert jobs[0]["record"]["original_name"] == "IMG_0003.JPG"
+
+
+def test_incomplete_bursts_and_undated_photos_are_left_out(tmp_path):
+    for i in range(3):
+        write_photo(tmp_path, f"A{i}.JPG", f"2025:06:01 10:00:0{i}")
+    write_photo(tmp_path, "B0.JPG", "2025:06:01 11:00:00")
+    write_photo(tmp_path, "B1.JPG", "2025:06:01 11:00:05")
+    write_photo(tmp_path, "C0.JPG")
+    jobs, incomplete, undated = plan(tmp_path)
+    assert [job["source"].name for job in jobs] == ["A0.JPG", "A1.JPG", "A2.JPG"]
+    assert [[p.name for p in burst] for burst in incomplete] == [["B0.JPG", "B1.JPG"]]
+    assert [p.name for p in undated] == ["C0.JPG"]
+
+
+def test_sets_in_the_same_second_get_distinct_timestamps(tmp_path):
+    for i in range(6):
+        write_photo(tmp_path, f"IMG_{i}.JPG", "2025:06:01 10:00:00")
+    jobs, _, _ = plan(tmp_path)
+    stamps = sorted({job["filename"].split("_", 4)[4] for job in jobs})
+    assert stamps == ["20250601_100000.jpg", "20250601_100001.jpg"]
+
+
+def test_order_mode_groups_by_filename(tmp_path):
+    for i in range(7):
+        write_photo(tmp_path, f"IMG_{i}.JPG")
+    jobs, incomplete, undated = plan(tmp_path, group_by_exif=False)
+    assert [job["source"].name for job in jobs] == [f"IMG_{i}.JPG" for i in range(6)]
+    assert [job["filename"].split("_")[3] for job in jobs] == ["H1m", "H50cm", "H20cm"] * 2
+    assert [[p.name for p in burst] for burst in incomplete] == [["IMG_6.JPG"]]
+    assert undated == []
+
+
+def test_listing_skips_hidden_and_non_image_files(tmp_path):
+    write_photo(tmp_path, "IMG_1.JPG")
+    write_photo(tmp_path, "._IMG_1.JPG")
+    (tmp_path / "notes.txt").write_text("x")
+    (tmp_path / "sub").mkdir()
+    write_photo(tmp_path / "sub", "IMG_2.JPG")
+    assert [p.name for p in wc.list_local_photos(str(tmp_path))] == ["IMG_1.JPG"]
+    assert [p.name for p in wc.list_local_photos(str(tmp_path), recursive=True)] == ["IMG_1.JPG", "IMG_2.JPG"]
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import json
+
+import weed_collector as wc
+from conftest import children
+
+TZ = "America/New_York"
+
+
+def record(folder_id, name, file_id):
+    job = {"filename": name, "mimetype": "image/jpeg", "size": 3, "record": {"zipcode": "20740", "weed_name": "Crabgrass"}}
+    wc.record_upload(job, {"id": file_id}, [], folder_id)
+
+
+def parts(state, folder_id):
+    found = [f for f in children(state, folder_id) if wc.is_manifest_name(f["name"])]
+    return {f["name"]: [json.loads(line) for line in state.contents[f["id"]].splitlines()] for f in found}
+
+
+def test_flush_writes_one_part_without_reading(fake_drive):
+    _, folder_id, _ = wc.ensure_zip_date_folder("20740", TZ, "20250601")
+    record(folder_id, "a.jpg", "id-a")
+    record(folder_id, "b.jpg", "id-b")
+    before = dict(fake_drive.calls)
+    assert wc.flush_manifest(folder_id) == 2
+    calls = {k: v - before.get(k, 0) for k, v in fake_drive.calls.items() if v != before.get(k, 0)}
+    assert list(calls.values()) == [1]  # the create; no list, no download
+
+    (name, rows), = parts(fake_drive, folder_id).items()
+    assert wc.MANIFEST_PART_RE.fullmatch(name) and name != wc.MANIFEST_NAME
+    assert [row["drive_file_id"] for row in rows] == ["id-a", "id-b"]
+    assert wc.get_manifest_outbox().pending(folder_id) == []
+    assert wc.flush_manifest(folder_id) == 0
+
+
+def test_later_flushes_add_parts_and_keep_earlier_rows(fake_drive):
+    _, folder_id, _ = wc.ensure_zip_date_folder("20740", TZ, "20250601")
+    record(folder_id, "a.jpg", "id-a")
+    wc.flush_manifest(folder_id)
+    record(folder_id, "b.jpg", "id-b")
+    wc.flush_pending_manifests()
+    rows = [row["drive_file_id"] for part in parts(fake_drive, folder_id).values() for row in part]
+    assert sorted(rows) == ["id-a", "id-b"]
+
+
+def test_failed_flush_keeps_rows_in_the_outbox(fake_drive, monkeypatch):
+    _, folder_id, _ = wc.ensure_zip_date_folder("20740", TZ, "20250601")
+    record(folder_id, "a.jpg", "id-a")
+    monkeypatch.setattr(wc, "UPLOAD_MAX_RETRIES", 0)
+    fake_drive.error_rate = 1.0
+    wc.flush_pending_manifests()
+    fake_drive.error_rate = 0.0
+    assert len(wc.get_manifest_outbox().pending(folder_id)) == 1
+    assert wc.flush_manifest(folder_id) == 1
+
+
+def test_catalog_reads_parts_and_the_legacy_manifest(fake_drive):
+    _, folder_id, _ = wc.ensure_zip_date_folder("20740", TZ, "20250601")
+    legacy = {"drive_file_id": "id-old", "filename": "old.jpg", "zipcode": "20740"}
+    fake_drive.new_file(
+        {"name": wc.MANIFEST_NAME, "parents": [folder_id]}, (json.dumps(legacy) + "\n").encode()
+    )
+    record(folder_id, "a.jpg", "id-a")
+    wc.flush_manifest(folder_id)
+    record(folder_id, "a.jpg", "id-a")  # the same row again, e.g. after a crash
+    wc.flush_manifest(folder_id)
+
+    wc.bootstrap_catalog(wc.get_catalog(), wc.get_drive_service())
+    rows = wc.get_catalog().query(zipcode="20740")
+    assert sorted(row["file_id"] for row in rows if row["source"] == "manifest") == ["id-a", "id-old"]
+
+
+def test_flushes_compact_into_one_manifest(fake_drive, monkeypatch):
+    monkeypatch.setattr(wc, "MANIFEST_COMPACT_PARTS", 3)
+    _, folder_id, _ = wc.ensure_zip_date_folder("20740", TZ, "20250601")
+    for name in ("a", "b", "c"):
+        record(folder_id, f"{name}.jpg", f"id-{name}")
+        wc.flush_manifest(folder_id)
+
+    (name, rows), = parts(fake_drive, folder_id).items()
+    assert name == wc.MANIFEST_NAME
+    assert [row["drive_file_id"] for row in rows] == ["id-a", "id-b", "id-c"]
+
+    # The counter starts over: the next flush only adds a part.
+    record(folder_id, "d.jpg", "id-d")
+    wc.flush_manifest(folder_id)
+    assert len(parts(fake_drive, folder_id)) == 2
+    wc.bootstrap_catalog(wc.get_catalog(), wc.get_drive_service())
+    rows = wc.get_catalog().query(zipcode="20740")
+    assert sorted(row["file_id"] for row in rows) == ["id-a", "id-b", "id-c", "id-d"]
+
+
+def test_compaction_trashes_only_the_files_it_merged(fake_drive):
+    _, folder_id, _ = wc.ensure_zip_date_folder("20740", TZ, "20250601")
+    record(folder_id, "a.jpg", "id-a")
+    wc.flush_manifest(folder_id)
+    record(folder_id, "a.jpg", "id-a")
+    wc.flush_manifest(folder_id)
+    merged = {f["id"] for f in children(fake_drive, folder_id) if wc.is_manifest_name(f["name"])}
+    assert wc.compact_manifest(folder_id) == 2
+
+    assert all(fake_drive.files[file_id]["trashed"] for file_id in merged)
+    (name, rows), = parts(fake_drive, folder_id).items()
+    assert [row["drive_file_id"] for row in rows] == ["id-a"]  # the repeated row is written once
+    assert wc.compact_manifest(folder_id) == 0
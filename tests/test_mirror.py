@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import errno
+import os
+
+import pytest
+
+import weed_collector as wc
+from conftest import DATE, TZ, ZIP, make_jobs
+
+
+def stored(storage):
+    folder = os.path.join(storage.root, ZIP, DATE)
+    names = os.listdir(folder) if os.path.isdir(folder) else []
+    return sorted(n for n in names if not wc.is_manifest_name(n))
+
+
+def drain(spool):
+    while True:
+        job = spool.claim_next()
+        if job is None:
+            wc.flush_spool_manifests()
+            return
+        wc.run_spool_job(spool, job)
+
+
+@pytest.fixture
+def stores(data_dir, monkeypatch):
+    primary = wc.FilesystemStorage(str(data_dir / "primary"))
+    mirror = wc.FilesystemStorage(str(data_dir / "mirror"))
+    # No worker threads: the tests drain the spool themselves.
+    spool = wc.UploadSpool(str(data_dir / "spool" / "queue.sqlite3"), str(data_dir / "spool"))
+    monkeypatch.setattr(wc, "get_storage_backend", lambda: primary)
+    monkeypatch.setattr(wc, "get_mirror_backend", lambda: mirror)
+    monkeypatch.setattr(wc, "get_upload_spool", lambda: spool)
+    return primary, mirror, spool
+
+
+def test_inline_upload_queues_mirror_copies(stores):
+    primary, mirror, spool = stores
+    results = wc.upload_jobs_to_zip_date_folder(make_jobs(2), ZIP, TZ, DATE)
+    assert results == [("f0.jpg", None), ("f1.jpg", None)]
+    assert stored(primary) == ["f0.jpg", "f1.jpg"] and stored(mirror) == []
+    assert spool.outstanding("mirror") == 2 and spool.outstanding() == 0
+
+    drain(spool)
+    assert stored(mirror) == ["f0.jpg", "f1.jpg"]
+    assert mirror._manifest_paths(f"{ZIP}/{DATE}") == {f"{ZIP}/{DATE}/f0.jpg", f"{ZIP}/{DATE}/f1.jpg"}
+    assert spool.outstanding("mirror") == 0
+
+
+def test_spooled_upload_is_mirrored_after_it_is_done(stores):
+    primary, mirror, spool = stores
+    set_id = spool.enqueue(make_jobs(1), ZIP, TZ, DATE)
+    job = spool.claim_next()
+    wc.run_spool_job(spool, job)
+    assert [row["status"] for row in spool.set_status(set_id)] == ["done"]
+    assert stored(primary) == ["f0.jpg"] and stored(mirror) == []
+    assert spool.outstanding("mirror") == 1
+
+    drain(spool)
+    assert stored(mirror) == ["f0.jpg"]
+
+
+def test_mirror_failures_are_retried_without_touching_the_upload(stores, monkeypatch):
+    primary, mirror, spool = stores
+    monkeypatch.setattr(wc, "backoff_delay", lambda *a, **kw: 0)
+    monkeypatch.setattr(wc, "UPLOAD_MAX_RETRIES", 0)
+    put = mirror._put
+    failures = [OSError(errno.ENETUNREACH, "Network is unreachable")]
+
+    def flaky(*args):
+        if failures:
+            raise failures.pop(0)
+        return put(*args)
+
+    monkeypatch.setattr(mirror, "_put", flaky)
+    assert wc.upload_jobs_to_zip_date_folder(make_jobs(1), ZIP, TZ, DATE) == [("f0.jpg", None)]
+    drain(spool)
+    assert stored(mirror) == ["f0.jpg"] and failures == []
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import io
+from datetime import datetime
+
+import pytest
+from PIL import Image, PngImagePlugin
+
+import weed_collector as wc
+
+
+def encode(fmt, exif_time=None, orientation=None, size=(640, 480)):
+    exif = Image.Exif()
+    if exif_time:
+        exif.get_ifd(wc.EXIF_IFD)[wc.EXIF_DATETIME_ORIGINAL] = exif_time
+    if orientation:
+        exif[wc.EXIF_ORIENTATION] = orientation
+    out = io.BytesIO()
+    Image.new("RGB", size, "green").save(out, format=fmt, exif=exif)
+    return out.getvalue()
+
+
+@pytest.fixture
+def no_decode(monkeypatch):
+    def refuse(self):
+        raise AssertionError("probe decoded the image")
+    monkeypatch.setattr(PngImagePlugin.PngImageFile, "load", refuse)
+
+
+@pytest.mark.parametrize("fmt", ["PNG", "JPEG"])
+def test_probe_reads_header_metadata(fmt, no_decode):
+    meta = wc.probe_image_metadata(encode(fmt, "2025:06:01 09:30:05", orientation=6))
+    assert meta == {
+        "format": fmt, "width": 640, "height": 480, "orientation": 6,
+        "captured_at": datetime(2025, 6, 1, 9, 30, 5),
+    }
+
+
+def test_png_without_exif_is_not_decoded(no_decode):
+    meta = wc.probe_image_metadata(encode("PNG"))
+    assert meta["captured_at"] is None and meta["orientation"] == 1
+
+
+def test_probe_restores_stream_position():
+    fh = io.BytesIO(encode("JPEG", "2025:06:01 09:30:05"))
+    fh.seek(0)
+    wc.probe_image_metadata(fh)
+    assert fh.tell() == 0
+    assert wc.probe_image_metadata(b"not an image") is None
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import os
+
+import weed_collector as wc
+from conftest import children
+
+TZ = "America/New_York"
+
+
+def make_jobs(n, size=1024):
+    return [
+        {"source": b"\xff\xd8\xff\xe0" + os.urandom(size - 4), "size": size, "mimetype": "image/jpeg",
+         "filename": f"f{i}.jpg", "record": {}}
+        for i in range(n)
+    ]
+
+
+def folder():
+    _, folder_id, _ = wc.ensure_zip_date_folder("20740", TZ, "20250601")
+    return folder_id
+
+
+def test_cancel_between_files_keeps_finished_ones(fake_drive):
+    folder_id = folder()
+    jobs = make_jobs(3)
+    progress = wc.UploadProgress(jobs)
+
+    def cancel_after_first(i, sent, total):
+        if i == 0 and sent == total:
+            progress.cancel()
+
+    results = wc.upload_jobs_to_drive(jobs, folder_id, max_workers=1, progress_cb=cancel_after_first, progress=progress)
+    assert results[0] == ("f0.jpg", None)
+    assert all(isinstance(err, wc.UploadCancelled) for _, err in results[1:])
+    snap = progress.snapshot()
+    assert (snap["files_done"], snap["files_cancelled"], snap["files_failed"]) == (1, 2, 0)
+    assert snap["bytes_sent"] == 1024 and snap["cancelled"]
+    assert [f["name"] for f in children(fake_drive, folder_id)] == ["f0.jpg"]
+    assert len(wc.get_manifest_outbox().pending(folder_id)) == 1
+
+
+def test_cancel_mid_file_stops_at_the_next_chunk(fake_drive, monkeypatch):
+    folder_id = folder()
+    chunk = 256 * 1024
+    upload = wc.upload_bytes_to_drive
+    monkeypatch.setattr(wc, "upload_bytes_to_drive", lambda *a, **kw: upload(*a, **dict(kw, chunk_size=chunk)))
+    jobs = make_jobs(2, size=4 * chunk)
+    progress = wc.UploadProgress(jobs)
+    sent_chunks = []
+
+    def cancel_after_a_chunk(i, sent, total):
+        sent_chunks.append(sent)
+        progress.cancel()
+
+    results = wc.upload_jobs_to_drive(jobs, folder_id, max_workers=1, progress_cb=cancel_after_a_chunk, progress=progress)
+    assert [type(err) for _, err in results] == [wc.UploadCancelled] * 2
+    assert sent_chunks == [chunk]
+    snap = progress.snapshot()
+    assert snap["files_cancelled"] == 2 and snap["bytes_sent"] == 0
+    assert children(fake_drive, folder_id) == []
+    assert wc.get_manifest_outbox().pending(folder_id) == []
+
+
+def test_snapshot_tracks_bytes_and_files():
+    progress = wc.UploadProgress(make_jobs(2), window_sec=60)
+    progress.start_file("f0.jpg")
+    progress.update("f0.jpg", 512)
+    snap = progress.snapshot()
+    assert snap["bytes_sent"] == 512 and snap["total_bytes"] == 2048
+    assert snap["active"] == ["f0.jpg"] and not snap["cancelled"]
+    progress.update("f0.jpg", 1024)
+    progress.finish_file("f0.jpg")
+    snap = progress.snapshot()
+    assert snap["files_done"] == 1 and snap["active"] == [] and snap["bytes_sent"] == 1024
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+import time
+
+import pytest
+
+import weed_collector as wc
+
+
+def make_spool(data_dir, lease_sec=60.0):
+    return wc.UploadSpool(str(data_dir / "spool" / "queue.sqlite3"), str(data_dir / "spool"), lease_sec=lease_sec)
+
+
+def enqueue(spool, n=2):
+    jobs = [{"source": f"payload {i}".encode(), "mimetype": "image/jpeg", "filename": f"f{i}.jpg"} for i in range(n)]
+    return spool.enqueue(jobs, "20740", "America/New_York", "20250601")
+
+
+def status(spool, set_id):
+    return [row["status"] for row in spool.set_status(set_id)]
+
+
+def test_claim_done_removes_payload(data_dir):
+    spool = make_spool(data_dir)
+    set_id = enqueue(spool, 1)
+    job = spool.claim_next()
+    assert job["attempts"] == 1 and status(spool, set_id) == ["uploading"]
+    with open(job["payload_path"], "rb") as fh:
+        assert fh.read() == b"payload 0"
+    spool.mark_done(job["id"], "drive-id", job["payload_path"])
+    assert status(spool, set_id) == ["done"]
+    assert not os.path.exists(job["payload_path"])
+    assert spool.claim_next() is None
+
+
+def test_retry_waits_for_backoff(data_dir):
+    spool = make_spool(data_dir)
+    set_id = enqueue(spool, 1)
+    job = spool.claim_next()
+    spool.mark_retry(job["id"], "503", delay=60)
+    assert status(spool, set_id) == ["pending"]
+    assert spool.claim_next() is None
+
+    spool.mark_retry(job["id"], "503", delay=0)  # not held any more: ignored
+    assert spool.claim_next() is None
+
+
+def test_failed_jobs_can_be_retried(data_dir):
+    spool = make_spool(data_dir)
+    set_id = enqueue(spool, 1)
+    job = spool.claim_next()
+    spool.mark_failed(job["id"], "400 bad request")
+    assert status(spool, set_id) == ["failed"] and spool.claim_next() is None
+    assert spool.retry_failed() == 1
+    again = spool.claim_next()
+    assert again["id"] == job["id"] and again["attempts"] == 1
+
+
+def test_live_lease_is_not_taken_over(data_dir):
+    app = make_spool(data_dir)
+    ingest = make_spool(data_dir)
+    set_id = enqueue(app, 2)
+    first = app.claim_next()
+    second = ingest.claim_next()
+    assert first["id"] != second["id"]
+    assert ingest.claim_next() is None
+    # A process restarting against the same queue leaves both alone.
+    assert make_spool(data_dir).claim_next() is None
+    assert status(app, set_id) == ["uploading", "uploading"]
+
+
+def test_expired_lease_is_taken_over(data_dir):
+    dead = make_spool(data_dir, lease_sec=0.05)
+    alive = make_spool(data_dir)
+    set_id = enqueue(dead, 1)
+    job = dead.claim_next()
+    time.sleep(0.1)
+
+    taken = alive.claim_next()
+    assert taken["id"] == job["id"] and taken["attempts"] == 2
+    # The old owner finishing late doesn't overwrite the new owner's job
+    # or delete the payload it is reading.
+    dead.mark_done(job["id"], "late", job["payload_path"])
+    assert status(alive, set_id) == ["uploading"]
+    assert os.path.exists(job["payload_path"])
+    alive.mark_done(taken["id"], "drive-id", taken["payload_path"])
+    assert status(alive, set_id) == ["done"]
+
+
+def test_renewed_lease_stays_live(data_dir):
+    owner = make_spool(data_dir, lease_sec=0.2)
+    other = make_spool(data_dir)
+    enqueue(owner, 1)
+    owner.claim_next()
+    for _ in range(3):
+        time.sleep(0.1)
+        owner.renew_leases()
+        assert other.claim_next() is None
+
+
+def test_prune_drops_old_failed_jobs_and_payloads(data_dir, monkeypatch):
+    spool = make_spool(data_dir)
+    set_id = enqueue(spool, 1)
+    job = spool.claim_next()
+    spool.mark_failed(job["id"], "400 bad request")
+    spool.prune()
+    assert status(spool, set_id) == ["failed"]
+
+    monkeypatch.setattr(wc, "SPOOL_KEEP_FAILED_SEC", -1)
+    spool.prune()
+    assert spool.set_status(set_id) == []
+    assert not os.path.exists(job["payload_path"])
+
+
+class Stop(BaseException):
+    pass
+
+
+def test_worker_survives_failed_iterations(data_dir, monkeypatch):
+    spool = make_spool(data_dir)
+    set_id = enqueue(spool, 1)
+    monkeypatch.setattr(wc, "backoff_delay", lambda *a, **kw: 0)
+
+    def no_service():
+        raise RuntimeError("no credentials")
+
+    monkeypatch.setattr(wc, "spool_drive_service", no_service)
+    monkeypatch.setattr(wc.ManifestOutbox, "pending_folders", lambda self: ["folder"])
+    claims = iter([sqlite3.OperationalError("database is locked"), None])
+    claim_next = spool.claim_next
+    done = []
+
+    def claim():
+        step = next(claims, "job")
+        if isinstance(step, Exception):
+            raise step
+        if step == "job":
+            if done:
+                raise Stop()
+            return claim_next()
+        return None
+
+    def run(spool_, job):
+        done.append(job["filename"])
+        spool_.mark_done(job["id"], "drive-id", job["payload_path"])
+
+    monkeypatch.setattr(spool, "claim_next", claim)
+    monkeypatch.setattr(wc, "run_spool_job", run)
+    with pytest.raises(Stop):
+        wc.spool_worker_loop(spool)
+    assert done == ["f0.jpg"] and status(spool, set_id) == ["done"]
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import errno
+import os
+
+import pytest
+
+import weed_collector as wc
+from conftest import DATE, TZ, ZIP, make_jobs, manifest_rows
+
+
+@pytest.fixture
+def fs(tmp_path, monkeypatch):
+    monkeypatch.setattr(wc, "backoff_delay", lambda *a, **kw: 0)
+    return wc.FilesystemStorage(str(tmp_path / "store"))
+
+
+def test_backends_must_implement_the_interface():
+    with pytest.raises(TypeError):
+        wc.StorageBackend()
+
+    class Partial(wc.FileTreeStorage):
+        def _stat(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_batch_writes_files_and_one_manifest_part(fs):
+    results = fs.upload_jobs(make_jobs(3), ZIP, TZ, DATE, max_workers=2)
+    assert results == [(f"f{i}.jpg", None) for i in range(3)]
+    folder = os.path.join(fs.root, ZIP, DATE)
+    assert sorted(n for n in os.listdir(folder) if not wc.is_manifest_name(n)) == ["f0.jpg", "f1.jpg", "f2.jpg"]
+    (part,) = [n for n in os.listdir(folder) if wc.is_manifest_name(n)]
+    assert part != wc.MANIFEST_NAME
+    assert [row["path"] for row in manifest_rows(fs)] == [f"{ZIP}/{DATE}/f{i}.jpg" for i in range(3)]
+
+
+def test_rerun_skips_stored_files_and_known_rows(fs, monkeypatch):
+    fs.upload_jobs(make_jobs(2), ZIP, TZ, DATE)
+    puts = []
+    monkeypatch.setattr(fs, "_put", lambda *a: puts.append(a))
+    fs.upload_jobs(make_jobs(2), ZIP, TZ, DATE)
+    assert puts == [] and len(manifest_rows(fs)) == 2
+
+
+def test_retry_after_the_file_landed_still_writes_its_row(fs):
+    # The file made it but the batch died before its manifest row.
+    fs.put(b"photo 0", "image/jpeg", f"{ZIP}/{DATE}/f0.jpg")
+    fs.upload_jobs(make_jobs(1), ZIP, TZ, DATE)
+    (row,) = manifest_rows(fs)
+    assert row["path"] == f"{ZIP}/{DATE}/f0.jpg" and row["duplicate_of"] == row["path"]
+
+
+def test_transient_nas_errors_are_retried(fs, monkeypatch):
+    put = fs._put
+    failures = [OSError(errno.EIO, "I/O error"), OSError(errno.ESTALE, "Stale file handle")]
+
+    def flaky(*args):
+        if failures:
+            raise failures.pop(0)
+        return put(*args)
+
+    monkeypatch.setattr(fs, "_put", flaky)
+    assert fs.upload_jobs(make_jobs(1), ZIP, TZ, DATE) == [("f0.jpg", None)]
+    assert failures == []
+
+
+def test_permanent_errors_fail_the_job(fs, monkeypatch):
+    calls = []
+
+    def denied(*args):
+        calls.append(args)
+        raise PermissionError(errno.EACCES, "Permission denied")
+
+    monkeypatch.setattr(fs, "_put", denied)
+    ((_, err),) = fs.upload_jobs(make_jobs(1), ZIP, TZ, DATE)
+    assert isinstance(err, PermissionError) and len(calls) == 1
+    assert manifest_rows(fs) == []
+
+
+@pytest.mark.parametrize("err, transient", [
+    (OSError(errno.EIO, "I/O error"), True),
+    (OSError(errno.ENOSPC, "No space left on device"), True),
+    (FileNotFoundError(errno.ENOENT, "No such file"), False),
+    (ValueError("bad"), False),
+])
+def test_nas_error_classification(err, transient):
+    assert wc.is_transient_error(err) is transient
+
+
+def test_failed_derivative_keeps_the_original_and_its_row(fs, monkeypatch):
+    def make_derivatives(source, filename, sizes=None):
+        yield 640, "f0_640.jpg", b"small"
+        raise OSError(errno.EACCES, "Permission denied")
+
+    monkeypatch.setattr(wc, "make_derivatives", make_derivatives)
+    assert fs.upload_jobs(make_jobs(1), ZIP, TZ, DATE) == [("f0.jpg", None)]
+    (row,) = manifest_rows(fs)
+    assert row["path"] == f"{ZIP}/{DATE}/f0.jpg" and row["duplicate_of"] is None
+    assert row["derivatives"] == [{"px": 640, "name": "f0_640.jpg", "path": f"{ZIP}/{DATE}/f0_640.jpg"}]
+
+
+def test_held_rows_go_out_as_one_part_and_manifests_are_read_once(fs, monkeypatch):
+    read = fs._read_manifests
+    reads = []
+    monkeypatch.setattr(fs, "_read_manifests", lambda folder: reads.append(folder) or read(folder))
+    jobs = make_jobs(20)
+    for job in jobs[:10]:
+        fs.upload_jobs([job], ZIP, TZ, DATE, max_workers=1, hold_manifest=True)
+    folder = os.path.join(fs.root, ZIP, DATE)
+    assert reads == [] and not any(wc.is_manifest_name(n) for n in os.listdir(folder))
+    assert fs.flush_manifests() == 10
+    for job in jobs[10:]:
+        fs.upload_jobs([job], ZIP, TZ, DATE, max_workers=1, hold_manifest=True)
+    assert fs.flush_manifests() == 10 and fs.flush_manifests() == 0
+
+    assert reads == [f"{ZIP}/{DATE}"]
+    assert len([n for n in os.listdir(folder) if wc.is_manifest_name(n)]) == 2
+    assert sorted(row["path"] for row in manifest_rows(fs)) == sorted(f"{ZIP}/{DATE}/f{i}.jpg" for i in range(20))
+
+
+def test_held_rows_are_written_once_enough_build_up(fs, monkeypatch):
+    monkeypatch.setattr(wc, "MANIFEST_HOLD_ROWS", 3)
+    for job in make_jobs(4):
+        fs.upload_jobs([job], ZIP, TZ, DATE, max_workers=1, hold_manifest=True)
+    assert len(manifest_rows(fs)) == 3
+    assert fs.flush_manifests() == 1
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+pytest.importorskip("boto3")
+
+from boto3.exceptions import S3UploadFailedError  # noqa: E402
+from botocore.exceptions import ClientError, EndpointConnectionError, NoCredentialsError  # noqa: E402
+
+import weed_collector as wc  # noqa: E402
+from conftest import DATE, TZ, ZIP, make_jobs, manifest_rows  # noqa: E402
+
+
+def client_error(status, code="InternalError"):
+    return ClientError({"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}}, "PutObject")
+
+
+@pytest.mark.parametrize("err, transient", [
+    (EndpointConnectionError(endpoint_url="http://minio:9000"), True),
+    (client_error(503, "SlowDown"), True),
+    (client_error(500), True),
+    (client_error(400, "RequestTimeout"), True),
+    (client_error(403, "AccessDenied"), False),
+    (NoCredentialsError(), False),
+])
+def test_s3_error_classification(err, transient):
+    assert wc.is_transient_error(err) is transient
+
+
+def test_wrapped_s3_errors_are_classified_by_their_cause():
+    for cause, transient in ((client_error(503), True), (client_error(403, "AccessDenied"), False)):
+        try:
+            try:
+                raise cause
+            except ClientError:
+                raise S3UploadFailedError("Failed to upload")
+        except S3UploadFailedError as e:
+            assert wc.is_transient_error(e) is transient
+
+
+def test_s3_batches_write_separate_manifest_objects(monkeypatch):
+    moto = pytest.importorskip("moto")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    with moto.mock_aws():
+        s3 = wc.S3Storage("captures", prefix="weeds", region="us-east-1")
+        s3.client.create_bucket(Bucket="captures")
+        jobs = make_jobs(2)
+        s3.upload_jobs(jobs[:1], ZIP, TZ, DATE)
+        s3.upload_jobs(jobs, ZIP, TZ, DATE)
+        keys = [o["Key"] for o in s3.client.list_objects_v2(Bucket="captures")["Contents"]]
+        parts = [k for k in keys if wc.is_manifest_name(k.rsplit("/", 1)[-1])]
+        assert len(parts) == 2 and all(k.startswith(f"weeds/{ZIP}/{DATE}/") for k in parts)
+        assert sorted(row["filename"] for row in manifest_rows(s3)) == ["f0.jpg", "f1.jpg"]
@@ -0,0 +1,3599 @@
+# -*- coding: utf-8 -*-
+# Everything behind the Weed Data Collector page that doesn't draw it:
+# settings, naming, Drive folders and uploads, storage backends, the upload
+# spool, manifests, the capture catalog. app.py renders the Streamlit page on
+# top of this; command-line tools import it directly.
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp, Request as AuthRequest
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload, build_http
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from PIL import Image, ImageOps
+import contextvars
+import errno
+import hashlib
+import httplib2
+import io
+import json
+import logging
+import mimetypes
+import multiprocessing
+import re
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from functools import wraps
+from typing import Optional, Dict, Any, List, Tuple, Callable, Union, BinaryIO, Iterator
+from zoneinfo import ZoneInfo
+
+from derivatives import render_derivatives
+
+# ------------------------------------------
+# Optional: HEIC/HEIF support for iPhone originals
+# pip install pillow-heif
+# ------------------------------------------
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIF_AVAILABLE = True
+except Exception:
+    HEIF_AVAILABLE = False
+
+# ------------------------------------------
+# Optional: S3-compatible storage backend (AWS S3, MinIO, ...)
+# pip install boto3
+# ------------------------------------------
+try:
+    import boto3
+    from boto3.exceptions import S3UploadFailedError
+    from boto3.s3.transfer import TransferConfig
+    from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+    S3_AVAILABLE = True
+except Exception:
+    S3_AVAILABLE = False
+
+# ==========================================
+# Settings
+# ==========================================
+PARENT_FOLDER_ID = "12WeFmWCJ1RJE-kAzZdzeetp6Hqc32IcX"
+
+# Parallel Drive transfers for the batch ("Upload ALL") path; 1 = sequential
+UPLOAD_WORKERS = max(1, int(os.environ.get("UPLOAD_WORKERS", "4")))
+
+# Files larger than one chunk go through a resumable, chunked upload.
+# Drive requires chunk sizes in multiples of 256 KiB; 0 disables chunking.
+UPLOAD_CHUNK_ALIGN = 256 * 1024
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(4 * 1024 * 1024)))
+UPLOAD_MAX_RETRIES = 6
+
+# Uploads stream from the uploaded file (or a memoryview / spool file) in
+# blocks of this size for hashing and spooling instead of copying it whole.
+UPLOAD_READ_BLOCK = 1024 * 1024
+
+# Drive accepts at most 100 calls per batch HTTP request.
+DRIVE_BATCH_SIZE = 100
+
+# Every session shares one service account, so all Drive requests in the
+# process draw from one token bucket (DRIVE_RATE_QPS, bursts up to
+# DRIVE_RATE_BURST). Interactive 3-shot uploads are served ahead of batch
+# work. A 403/429 rate-limit response halves the rate; it then climbs back
+# by DRIVE_RATE_STEP of the maximum per second of successful requests.
+DRIVE_RATE_QPS = float(os.environ.get("DRIVE_RATE_QPS", "20"))
+DRIVE_RATE_BURST = int(os.environ.get("DRIVE_RATE_BURST", "20"))
+DRIVE_RATE_MIN_QPS = 0.5
+DRIVE_RATE_STEP = 0.05
+
+# Rear-camera frames arrive as lossless PNG; re-encode them on save.
+# Format: "jpeg", "webp" or "png" (keep as captured).
+CAMERA_OUTPUT_FORMAT = os.environ.get("CAMERA_OUTPUT_FORMAT", "jpeg").lower()
+CAMERA_OUTPUT_QUALITY = int(os.environ.get("CAMERA_OUTPUT_QUALITY", "92"))
+CAMERA_WEBP_LOSSLESS = os.environ.get("CAMERA_WEBP_LOSSLESS", "0") == "1"
+
+# Downscaled previews: camera preview, batch grouping tiles, and the
+# process-wide LRU holding them (keyed by content hash).
+PREVIEW_MAX_PX = 1024
+THUMB_MAX_PX = 200
+THUMB_SETS_PER_PAGE = 10
+PREVIEW_CACHE_BYTES = int(os.environ.get("PREVIEW_CACHE_BYTES", str(32 * 1024 * 1024)))
+
+# Optional training derivatives: after each upload, JPEG copies with EXIF
+# orientation applied and the long edge at each of DERIVATIVE_SIZES px are
+# rendered in a process pool and uploaded next to the original as
+# <stem>_<size>px.jpg. Empty (the default) turns the stage off.
+DERIVATIVE_SIZES = tuple(
+    int(px) for px in os.environ.get("DERIVATIVE_SIZES", "").replace(" ", "").split(",") if px
+)
+DERIVATIVE_QUALITY = int(os.environ.get("DERIVATIVE_QUALITY", "90"))
+DERIVATIVE_WORKERS = max(1, int(os.environ.get("DERIVATIVE_WORKERS", str(min(4, os.cpu_count() or 1)))))
+
+# EXIF grouping for batch ingests: photos sorted by capture time start a new
+# burst after a gap longer than SET_GAP_SEC; a burst of 3k shots becomes k
+# sets with heights in shot order (1 m, 50 cm, 20 cm).
+SET_GAP_SEC = float(os.environ.get("SET_GAP_SEC", "30"))
+
+# Live batch progress: throughput (and so ETA) is averaged over the last
+# PROGRESS_WINDOW_SEC seconds.
+PROGRESS_WINDOW_SEC = 10.0
+
+# Directory ingest (ingest.py) uploads this many files per pass, so a large
+# SD card never has more than this many photos open at once.
+INGEST_BATCH_FILES = int(os.environ.get("INGEST_BATCH_FILES", "300"))
+
+# Local state shared by all sessions (folder-ID cache, ...)
+APP_DATA_DIR = os.environ.get(
+    "WEED_COLLECTOR_DATA_DIR",
+    os.path.join(tempfile.gettempdir(), "weed_collector")
+)
+FOLDER_CACHE_PATH = os.path.join(APP_DATA_DIR, "folder_cache.json")
+FOLDER_CACHE_TTL_SEC = int(os.environ.get("FOLDER_CACHE_TTL_SEC", str(7 * 24 * 3600)))
+
+# Camera captures waiting for their 3-shot upload live on disk; session
+# state only holds handles. Up to CAPTURE_MEMORY_BUDGET bytes are also kept
+# in RAM per process, and captures untouched for CAPTURE_IDLE_TTL_SEC
+# (abandoned sessions) are deleted.
+CAPTURE_DIR = os.path.join(APP_DATA_DIR, "captures")
+CAPTURE_MEMORY_BUDGET = int(os.environ.get("CAPTURE_MEMORY_BUDGET", str(64 * 1024 * 1024)))
+CAPTURE_IDLE_TTL_SEC = int(os.environ.get("CAPTURE_IDLE_TTL_SEC", str(6 * 3600)))
+
+# Content-hash deduplication. Every upload carries its SHA-256 in
+# appProperties and is recorded in a local index; an identical file already
+# in the target folder is skipped ("skip" and "link"). With "link", one in
+# another folder is linked with a Drive shortcut instead of uploaded again.
+# "off" always uploads. A folder's listing in the index is refreshed after
+# HASH_INDEX_TTL_SEC, and candidates are checked against Drive before use.
+DEDUP_MODE = os.environ.get("DEDUP_MODE", "skip").lower()
+HASH_INDEX_PATH = os.path.join(APP_DATA_DIR, "hash_index.sqlite3")
+HASH_INDEX_TTL_SEC = int(os.environ.get("HASH_INDEX_TTL_SEC", "600"))
+SHORTCUT_MIME = "application/vnd.google-apps.shortcut"
+
+# Per-stage timing: one JSON log line per span on the "weed_collector.timing"
+# logger, plus rolling p50/p95 per stage written to METRICS_PATH (and shown
+# in the sidebar with ?metrics=1).
+TIMING_LOG = os.environ.get("TIMING_LOG", "1") != "0"
+METRICS_PATH = os.path.join(APP_DATA_DIR, "metrics.json")
+METRICS_WINDOW = 1000
+METRICS_FLUSH_SEC = 10
+
+# Durable upload spool: "Upload ALL" writes files to disk and returns, and
+# background workers drain the queue into Drive. Set USE_UPLOAD_SPOOL=0 to
+# upload inline instead.
+USE_UPLOAD_SPOOL = os.environ.get("USE_UPLOAD_SPOOL", "1") != "0"
+SPOOL_DIR = os.path.join(APP_DATA_DIR, "spool")
+SPOOL_DB_PATH = os.path.join(SPOOL_DIR, "queue.sqlite3")
+SPOOL_WORKERS = UPLOAD_WORKERS
+SPOOL_MAX_ATTEMPTS = 8
+SPOOL_KEEP_DONE_SEC = 7 * 24 * 3600
+SPOOL_KEEP_FAILED_SEC = 30 * 24 * 3600
+# A claimed job is leased to its process for SPOOL_LEASE_SEC and renewed
+# while it uploads; other processes sharing APP_DATA_DIR (a second server,
+# ingest.py) only take over jobs whose lease ran out.
+SPOOL_LEASE_SEC = 120
+
+# Per-date manifests: every upload adds one JSON line (all capture metadata,
+# ZIP, timezone, original name, Drive file ID) to its date folder's manifest.
+# Rows wait in a local outbox and each flush writes them as a new part file,
+# manifest-<UTC time>-<id>.jsonl, with one create call: no read-modify-write,
+# so concurrent writers can't drop each other's rows. After every
+# MANIFEST_COMPACT_PARTS flushes to a folder, its manifest files are merged
+# into one new MANIFEST_NAME and the merged files are trashed. Readers take
+# every manifest file in the folder. Spooled uploads to a file-tree backend
+# (fs, s3) hold their rows and write one part per folder when the spool goes
+# idle or MANIFEST_HOLD_ROWS rows have built up.
+MANIFEST_NAME = "manifest.jsonl"
+MANIFEST_COMPACT_PARTS = max(1, int(os.environ.get("MANIFEST_COMPACT_PARTS", "8")))
+MANIFEST_HOLD_ROWS = max(1, int(os.environ.get("MANIFEST_HOLD_ROWS", "200")))
+MANIFEST_PART_RE = re.compile(r"manifest(-\d{8}T\d{6}Z-[0-9a-f]{8})?\.jsonl")
+MANIFEST_MIME = "application/x-ndjson"
+MANIFEST_DB_PATH = os.path.join(APP_DATA_DIR, "manifest_outbox.sqlite3")
+
+# Local catalog of every capture under PARENT_FOLDER_ID, queryable by ZIP,
+# date, weed, grass, turf and height (?catalog=1). Built by one tree walk,
+# then kept current from the Drive changes feed every CATALOG_SYNC_SEC
+# (0 = only when "Sync now" is pressed).
+CATALOG_PATH = os.path.join(APP_DATA_DIR, "catalog.sqlite3")
+CATALOG_SYNC_SEC = int(os.environ.get("CATALOG_SYNC_SEC", "300"))
+
+# Storage backend for uploads: "drive" (PARENT_FOLDER_ID), "fs" (a local
+# directory or NAS mount at STORAGE_FS_ROOT) or "s3" (an S3-compatible
+# bucket; S3_ENDPOINT_URL points at MinIO and the like). STORAGE_MIRROR
+# names an optional second backend that receives a copy of every upload;
+# copies go through the upload spool in the background, after the primary
+# upload, so they never slow it down or fail it.
+# The catalog, export and dedup index work on the Drive tree only.
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "drive").lower()
+STORAGE_MIRROR = os.environ.get("STORAGE_MIRROR", "").lower()
+STORAGE_FS_ROOT = os.environ.get("STORAGE_FS_ROOT")
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")
+S3_BUCKET = os.environ.get("S3_BUCKET")
+S3_PREFIX = os.environ.get("S3_PREFIX", "")
+S3_REGION = os.environ.get("S3_REGION")
+
+# Optional on-disk Drive v3 discovery document; defaults to the copy bundled
+# with google-api-python-client.
+DRIVE_DISCOVERY_PATH = os.environ.get("DRIVE_DISCOVERY_PATH")
+
+# Service-account key for command-line tools run outside Streamlit; the page
+# reads st.secrets["gcp_service_account"] when this is unset.
+GCP_SERVICE_ACCOUNT_FILE = os.environ.get("GCP_SERVICE_ACCOUNT_FILE")
+
+# -------------------------
+# Constants
+# -------------------------
+FOLDER_MIME = "application/vnd.google-apps.folder"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".heic", ".heif")
+
+HEIGHTS = [
+    ("1 m", "H1m"),
+    ("50 cm", "H50cm"),
+    ("20 cm", "H20cm"),
+]
+HEIGHT_MAP = dict(HEIGHTS)
+
+TZ_OPTIONS = {
+    "EST": "America/New_York",
+    "CST": "America/Chicago",
+    "MST": "America/Denver",
+    "PST": "America/Los_Angeles",
+}
+
+TURF_OPTIONS = [
+    ("PG", "Putting Green"),
+    ("Tees", "Tees"),
+    ("Fairway", "Fairway"),
+    ("Rough", "Rough"),
+]
+
+SKIP = "(skip / optional)"
+CONF_LEVEL_OPTIONS = [SKIP, "High", "Medium", "Low"]
+GROWTH_STAGE_OPTIONS = [SKIP, "Seedling", "Vegetative", "Flowering", "Seed set", "Senescent"]
+PATCH_SIZE_OPTIONS = [SKIP, "0-10cm", "10-30cm", "30-100cm", "<1m"]
+HERBICIDE_30D_OPTIONS = [SKIP, "Yes", "No"]
+
+PATCH_CODE_MAP = {
+    "0-10cm": "P0_10cm",
+    "10-30cm": "P10_30cm",
+    "30-100cm": "P30_100cm",
+    "<1m": "Plt1m",
+}
+
+# -------------------------
+# Timing
+# -------------------------
+def silence_streamlit_bare_mode():
+    # For the command-line tools and tests: outside `streamlit run` every
+    # cache logs a bare-mode warning.
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+timing_log = logging.getLogger("weed_collector.timing")
+if not timing_log.handlers:
+    _timing_handler = logging.StreamHandler()
+    _timing_handler.setFormatter(logging.Formatter("%(message)s"))
+    timing_log.addHandler(_timing_handler)
+    timing_log.setLevel(logging.INFO if TIMING_LOG else logging.WARNING)
+    timing_log.propagate = False
+
+class StageMetrics:
+    # Rolling window of durations per stage plus byte totals, for p50/p95.
+    def __init__(self, window: int, path: str, flush_sec: float):
+        self.window = window
+        self.path = path
+        self.flush_sec = flush_sec
+        self._lock = threading.Lock()
+        self._durations: Dict[str, deque] = {}
+        self._counts: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._bytes: Dict[str, int] = {}
+        self._busy_sec: Dict[str, float] = {}
+        self._last_flush = 0.0
+
+    def record(self, stage: str, seconds: float, nbytes: int = 0, ok: bool = True):
+        with self._lock:
+            self._durations.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+            if not ok:
+                self._errors[stage] = self._errors.get(stage, 0) + 1
+            if nbytes:
+                self._bytes[stage] = self._bytes.get(stage, 0) + nbytes
+                self._busy_sec[stage] = self._busy_sec.get(stage, 0.0) + seconds
+            flush = time.time() - self._last_flush > self.flush_sec
+            if flush:
+                self._last_flush = time.time()
+        if flush:
+            self.flush()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            snap = {}
+            for stage, durations in self._durations.items():
+                ordered = sorted(durations)
+                pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+                entry = {
+                    "count": self._counts[stage],
+                    "errors": self._errors.get(stage, 0),
+                    "p50_ms": round(pick(0.50), 2),
+                    "p95_ms": round(pick(0.95), 2),
+                    "max_ms": round(ordered[-1] * 1000, 2),
+                }
+                if stage in self._bytes:
+                    entry["bytes"] = self._bytes[stage]
+                    entry["mb_per_s"] = round(self._bytes[stage] / 1e6 / max(self._busy_sec[stage], 1e-9), 3)
+                snap[stage] = entry
+            return snap
+
+    def flush(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as fh:
+                json.dump({"ts": time.time(), "pid": os.getpid(), "stages": self.snapshot()}, fh, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+@st.cache_resource(show_spinner=False)
+def get_stage_metrics() -> StageMetrics:
+    return StageMetrics(METRICS_WINDOW, METRICS_PATH, METRICS_FLUSH_SEC)
+
+@contextmanager
+def timed_stage(stage: str, **fields: Any) -> Iterator[Dict[str, Any]]:
+    # Yields the span's field dict so the body can add to it (e.g. "bytes").
+    span = dict(fields)
+    start = time.perf_counter()
+    ok = True
+    try:
+        yield span
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        nbytes = int(span.get("bytes") or 0)
+        get_stage_metrics().record(stage, elapsed, nbytes, ok)
+        if timing_log.isEnabledFor(logging.INFO):
+            record = {"event": "stage", "stage": stage, "ms": round(elapsed * 1000, 2), "ok": ok, **span}
+            if nbytes:
+                record["mb_per_s"] = round(nbytes / 1e6 / max(elapsed, 1e-9), 3)
+            timing_log.info(json.dumps(record, default=str))
+
+def timed(stage: str) -> Callable:
+    def decorate(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed_stage(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# -------------------------
+# Helpers
+# -------------------------
+def slugify(text: str, max_len: int = 40) -> str:
+    if text is None:
+        return "NA"
+    text = text.strip()
+    if not text:
+        return "NA"
+    text = text.replace(" ", "_")
+    text = re.sub(r"[^A-Za-z0-9_\-]+", "", text)
+    return text[:max_len] if len(text) > max_len else text
+
+def normalize_optional(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    v = str(value).strip()
+    if not v or v == SKIP:
+        return None
+    return v
+
+def guess_ext(mimetype: str, original_name: Optional[str] = None) -> str:
+    mt = (mimetype or "").lower()
+    if "jpeg" in mt or "jpg" in mt:
+        return "jpg"
+    if "png" in mt:
+        return "png"
+    if "webp" in mt:
+        return "webp"
+    if "heic" in mt or "heif" in mt:
+        return "heic"
+    if original_name:
+        _, ext = os.path.splitext(original_name)
+        if ext:
+            return ext.lstrip(".").lower()
+    return "jpg"
+
+def now_timestamp_str(tz_name: str) -> str:
+    return datetime.now(ZoneInfo(tz_name)).strftime("%Y%m%d_%H%M%S")
+
+EXIF_ORIENTATION = 0x0112
+EXIF_DATETIME = 0x0132
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 0x9003
+
+def parse_exif_datetime(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value).strip("\x00 "), "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+
+@timed("probe")
+def probe_image_metadata(source: Union[bytes, BinaryIO]) -> Optional[Dict[str, Any]]:
+    # Width/height, EXIF orientation and capture time from the file headers
+    # only: Image.open() parses headers lazily and pixels are never decoded.
+    # Accepts bytes or a seekable file object (e.g. an UploadedFile).
+    fh = io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source
+    start = fh.tell()
+    try:
+        with Image.open(fh) as img:
+            # PngImageFile.getexif() decodes the whole image when the header
+            # has no eXIf chunk, to look for one after the pixel data. The
+            # base reader uses the header chunks only.
+            exif = Image.Image.getexif(img) if img.format == "PNG" else img.getexif()
+            captured = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+            return {
+                "format": img.format,
+                "width": img.size[0],
+                "height": img.size[1],
+                "orientation": int(exif.get(EXIF_ORIENTATION, 1) or 1),
+                "captured_at": parse_exif_datetime(captured),
+            }
+    except Exception:
+        return None
+    finally:
+        fh.seek(start)
+
+class PreviewCache:
+    # LRU of small encoded images, bounded by total bytes.
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Any, Tuple[bytes, int, int]]" = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: Any) -> Optional[Tuple[bytes, int, int]]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def put(self, key: Any, item: Tuple[bytes, int, int]):
+        with self._lock:
+            if key in self._items:
+                return
+            self._items[key] = item
+            self._bytes += len(item[0])
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted[0])
+
+@st.cache_resource(show_spinner=False)
+def get_preview_cache() -> PreviewCache:
+    return PreviewCache(PREVIEW_CACHE_BYTES)
+
+def content_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+@timed("thumbnail")
+def render_thumbnail(image_bytes: bytes, max_px: int) -> Tuple[bytes, int, int]:
+    # Returns (JPEG thumbnail, original width, original height). draft() lets
+    # the JPEG decoder scale down by 1/2-1/8 while decoding; reduce() does a
+    # cheap integer downscale for other formats before the final resize.
+    img = Image.open(io.BytesIO(image_bytes))
+    width, height = img.size
+    img.draft("RGB", (max_px, max_px))
+    factor = min(img.size) // max_px
+    if factor > 1:
+        img = img.reduce(factor)
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((max_px, max_px))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=80)
+    return out.getvalue(), width, height
+
+def get_thumbnail(image_bytes: bytes, max_px: int) -> Optional[Tuple[bytes, int, int]]:
+    cache = get_preview_cache()
+    key = (content_hash(image_bytes), max_px)
+    item = cache.get(key)
+    if item is None:
+        try:
+            item = render_thumbnail(image_bytes, max_px)
+        except Exception:
+            return None
+        cache.put(key, item)
+    return item
+
+def get_thumbnail_sheet(images: List[bytes], tile_px: int = THUMB_MAX_PX) -> Optional[bytes]:
+    # One JPEG with the images' thumbnails side by side (a 3-shot set), so the
+    # grouping view sends one small image per set.
+    cache = get_preview_cache()
+    key = ("sheet", tuple(content_hash(b) for b in images), tile_px)
+    item = cache.get(key)
+    if item is not None:
+        return item[0]
+
+    sheet = Image.new("RGB", (tile_px * len(images), tile_px), "white")
+    for i, image_bytes in enumerate(images):
+        thumb = get_thumbnail(image_bytes, tile_px)
+        if thumb is None:
+            continue
+        tile = Image.open(io.BytesIO(thumb[0]))
+        sheet.paste(tile, (i * tile_px + (tile_px - tile.width) // 2, (tile_px - tile.height) // 2))
+    out = io.BytesIO()
+    sheet.save(out, format="JPEG", quality=80)
+    cache.put(key, (out.getvalue(), sheet.width, sheet.height))
+    return out.getvalue()
+
+def try_get_image_size(image_bytes: bytes):
+    # (preview JPEG bytes, width, height) of the original; the preview is
+    # what gets sent to the browser.
+    item = get_thumbnail(image_bytes, PREVIEW_MAX_PX)
+    if item is None:
+        return None, None, None
+    return item
+
+@timed("transcode")
+def transcode_camera_image(
+    image_bytes: bytes,
+    mimetype: str,
+    output_format: str = CAMERA_OUTPUT_FORMAT,
+    quality: int = CAMERA_OUTPUT_QUALITY,
+    webp_lossless: bool = CAMERA_WEBP_LOSSLESS,
+) -> tuple[bytes, str]:
+    # Re-encodes PNG captures at the same pixel size. Anything else, or a
+    # result that isn't smaller, is returned unchanged.
+    if "png" not in (mimetype or "").lower() or output_format not in ("jpeg", "webp"):
+        return image_bytes, mimetype
+
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        img.load()
+        out = io.BytesIO()
+        if output_format == "jpeg":
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            img.save(out, format="JPEG", quality=quality, optimize=True)
+            out_mimetype = "image/jpeg"
+        else:
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+            img.save(out, format="WEBP", quality=quality, lossless=webp_lossless, method=4)
+            out_mimetype = "image/webp"
+    except Exception:
+        return image_bytes, mimetype
+
+    if out.tell() >= len(image_bytes):
+        return image_bytes, mimetype
+    return out.getvalue(), out_mimetype
+
+def format_meta_for_status(meta: Dict[str, Any]) -> str:
+    if not meta:
+        return ""
+    conf = normalize_optional(meta.get("confidence"))
+    stage = normalize_optional(meta.get("growth_stage"))
+    patch = normalize_optional(meta.get("patch_size"))
+    herb = normalize_optional(meta.get("herbicide_30d"))
+    bits = []
+    if conf:
+        bits.append(f"Conf: {conf}")
+    if stage:
+        bits.append(f"Stage: {stage}")
+    if patch:
+        bits.append(f"Patch: {patch}")
+    if herb:
+        bits.append(f"Herb: {herb}")
+    return ", ".join(bits)
+
+@timed("make_filename")
+def make_filename(
+    turf_setting: str,
+    grass_type: str,
+    weed_name: str,
+    height_tag: str,
+    mimetype: str,
+    set_timestamp: str,
+    original_name: Optional[str] = None,
+    meta: Optional[Dict[str, Any]] = None,
+) -> str:
+    meta = meta or {}
+
+    turf_part = slugify(turf_setting.replace(" ", ""))
+    grass_part = slugify(grass_type)
+    weed_part = slugify(weed_name)
+    ext = guess_ext(mimetype, original_name)
+
+    parts = [turf_part, grass_part, weed_part, height_tag, set_timestamp]
+
+    conf = normalize_optional(meta.get("confidence"))
+    stage = normalize_optional(meta.get("growth_stage"))
+    patch = normalize_optional(meta.get("patch_size"))
+    herb = normalize_optional(meta.get("herbicide_30d"))
+
+    if conf:
+        parts.append(slugify(f"Conf{conf}", max_len=18))
+    if stage:
+        parts.append(slugify(f"Stage{stage}", max_len=22))
+    if patch:
+        patch_code = PATCH_CODE_MAP.get(patch, slugify(f"P{patch}", max_len=18))
+        parts.append(slugify(patch_code, max_len=18))
+    if herb:
+        parts.append(slugify(f"Herb{herb}", max_len=12))
+
+    return f"{'_'.join(parts)}.{ext}"
+
+def make_manifest_record(
+    turf_setting: str,
+    grass_type: str,
+    weed_name: str,
+    height_tag: str,
+    set_timestamp: str,
+    original_name: Optional[str] = None,
+    meta: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    # The metadata make_filename() encodes, as manifest fields; upload
+    # adds ZIP, timezone, date and Drive details.
+    meta = meta or {}
+    return {
+        "turf_setting": turf_setting,
+        "grass_type": grass_type,
+        "weed_name": weed_name,
+        "height_tag": height_tag,
+        "set_timestamp": set_timestamp,
+        "original_name": original_name,
+        "confidence": normalize_optional(meta.get("confidence")),
+        "growth_stage": normalize_optional(meta.get("growth_stage")),
+        "patch_size": normalize_optional(meta.get("patch_size")),
+        "herbicide_30d": normalize_optional(meta.get("herbicide_30d")),
+    }
+
+# -------------------------
+# Drive helpers
+# -------------------------
+# Credentials and the discovery document are shared by every session in the
+# process; only the (non-thread-safe) HTTP transport is per client.
+@st.cache_resource(show_spinner=False)
+def get_drive_credentials():
+    scopes = ["https://www.googleapis.com/auth/drive"]
+    if GCP_SERVICE_ACCOUNT_FILE:
+        creds = service_account.Credentials.from_service_account_file(GCP_SERVICE_ACCOUNT_FILE, scopes=scopes)
+    else:
+        creds = service_account.Credentials.from_service_account_info(
+            st.secrets["gcp_service_account"],
+            scopes=scopes
+        )
+    # Fetch the access token now so the first upload doesn't pay for it.
+    # google-auth refreshes it again on its own when it expires.
+    try:
+        creds.refresh(AuthRequest(httplib2.Http(timeout=30)))
+    except Exception:
+        pass
+    return creds
+
+@st.cache_resource(show_spinner=False)
+def get_drive_discovery_doc() -> Optional[Dict[str, Any]]:
+    if DRIVE_DISCOVERY_PATH and os.path.exists(DRIVE_DISCOVERY_PATH):
+        with open(DRIVE_DISCOVERY_PATH, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    doc = get_static_doc("drive", "v3")
+    return json.loads(doc) if doc else None
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+_drive_priority: contextvars.ContextVar = contextvars.ContextVar("drive_priority", default=PRIORITY_INTERACTIVE)
+
+@contextmanager
+def drive_priority(priority: int) -> Iterator[None]:
+    # Drive requests made inside the block queue at this priority.
+    token = _drive_priority.set(priority)
+    try:
+        yield
+    finally:
+        _drive_priority.reset(token)
+
+def is_rate_limit_response(status: int, content: Optional[bytes]) -> bool:
+    if status == 429:
+        return True
+    return status == 403 and b"ratelimitexceeded" in (content or b"").lower()
+
+class DriveRateLimiter:
+    # Token bucket with strict priorities: a request waits while any request
+    # of a higher priority (lower number) is waiting. The rate adapts
+    # AIMD-style to rate-limit responses.
+    def __init__(self, qps: float, burst: int, min_qps: float, step: float):
+        self.max_qps = qps
+        self.qps = qps
+        self.burst = burst
+        self.min_qps = min_qps
+        self.step = step
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._last_change = 0.0
+        self._waiting = [0, 0]
+        self._cond = threading.Condition()
+        self.throttled = 0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.qps)
+        self._last_refill = now
+
+    def acquire(self, tokens: int = 1, priority: Optional[int] = None):
+        # A batch may ask for more than the bucket holds; it waits for a
+        # full bucket and leaves the rest as debt for later requests.
+        if self.max_qps <= 0:
+            return
+        priority = _drive_priority.get() if priority is None else priority
+        need = min(tokens, self.burst)
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    self._refill(time.monotonic())
+                    if not any(self._waiting[:priority]) and self._tokens >= need:
+                        self._tokens -= tokens
+                        return
+                    self._cond.wait(timeout=max(0.01, (need - self._tokens) / self.qps))
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+
+    def on_throttled(self):
+        if self.max_qps <= 0:
+            return
+        with self._cond:
+            now = time.monotonic()
+            self.throttled += 1
+            self._refill(now)
+            # One cut per second however many in-flight requests bounce.
+            if now - self._last_change >= 1.0:
+                self.qps = max(self.min_qps, self.qps / 2)
+                self._tokens = min(self._tokens, 0.0)
+                self._last_change = now
+
+    def on_success(self):
+        if self.max_qps <= 0 or self.qps >= self.max_qps:
+            return
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_change >= 1.0:
+                self._refill(now)
+                self.qps = min(self.max_qps, self.qps + self.max_qps * self.step)
+                self._last_change = now
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            self._refill(time.monotonic())
+            return {
+                "qps": round(self.qps, 2),
+                "max_qps": self.max_qps,
+                "tokens": round(self._tokens, 1),
+                "waiting_interactive": self._waiting[PRIORITY_INTERACTIVE],
+                "waiting_bulk": self._waiting[PRIORITY_BULK],
+                "throttled": self.throttled,
+            }
+
+@st.cache_resource(show_spinner=False)
+def get_rate_limiter() -> DriveRateLimiter:
+    return DriveRateLimiter(DRIVE_RATE_QPS, DRIVE_RATE_BURST, DRIVE_RATE_MIN_QPS, DRIVE_RATE_STEP)
+
+class RateLimitedHttp:
+    # Wraps a client's HTTP transport so every Drive request (list, create,
+    # get, upload chunk, batch) takes a token first; anything else is passed
+    # through to the wrapped object. Rate-limit responses are retried here,
+    # behind the limiter's reduced rate, so metadata calls without their own
+    # retries don't fail the moment the quota is hit.
+    def __init__(self, http, limiter: DriveRateLimiter, max_retries: int = UPLOAD_MAX_RETRIES):
+        self.http = http
+        self.limiter = limiter
+        self.max_retries = max_retries
+
+    def request(self, uri, method="GET", *args, **kwargs):
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            resp, content = self.http.request(uri, method, *args, **kwargs)
+            if not is_rate_limit_response(resp.status, content):
+                break
+            self.limiter.on_throttled()
+            attempt += 1
+            if attempt > self.max_retries:
+                break
+            time.sleep(backoff_delay(attempt, base=0.5, cap=8.0))
+        if resp.status < 400:
+            self.limiter.on_success()
+        return resp, content
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+def build_drive_service(creds):
+    # One client per thread: the httplib2 transport behind it is not thread-safe.
+    # build_http() keeps 308 (resumable upload "Resume Incomplete") from being
+    # followed as a redirect.
+    http = RateLimitedHttp(AuthorizedHttp(creds, http=build_http()), get_rate_limiter())
+    doc = get_drive_discovery_doc()
+    if doc is None:
+        return build("drive", "v3", http=http)
+    return build_from_document(doc, http=http)
+
+_headless_drive = threading.local()
+
+def get_drive_service():
+    # Outside a Streamlit run (CLIs, worker threads) there is no session, so
+    # each thread keeps its own client.
+    if get_script_run_ctx(suppress_warning=True) is None:
+        if getattr(_headless_drive, "service", None) is None:
+            _headless_drive.service = build_drive_service(get_drive_credentials())
+        return _headless_drive.service
+
+    if st.session_state.get("drive_service") is not None:
+        return st.session_state.drive_service
+
+    service = build_drive_service(get_drive_credentials())
+    st.session_state.drive_service = service
+    return service
+
+class FolderCache:
+    # parent ID -> folder name -> {"id", "ts"}, shared by every session and
+    # mirrored to a JSON file so it survives restarts. Entries expire after
+    # ttl_sec; IDs that Drive reports as gone are dropped via invalidate_id.
+    def __init__(self, path: str, ttl_sec: int):
+        self.path = path
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+        self._folders: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._drive_ids: Dict[str, Dict[str, Any]] = {}
+        self._load()
+
+    def _fresh(self, entry: Optional[Dict[str, Any]]) -> bool:
+        return entry is not None and time.time() - entry.get("ts", 0) < self.ttl_sec
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+            self._folders = data.get("folders", {})
+            self._drive_ids = data.get("drive_ids", {})
+        except (OSError, ValueError):
+            self._folders, self._drive_ids = {}, {}
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as fh:
+                json.dump({"folders": self._folders, "drive_ids": self._drive_ids}, fh)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def get(self, parent_id: str, folder_name: str) -> Optional[str]:
+        with self._lock:
+            entry = self._folders.get(parent_id, {}).get(folder_name)
+            return entry["id"] if self._fresh(entry) else None
+
+    def put(self, parent_id: str, folder_name: str, folder_id: str):
+        with self._lock:
+            self._folders.setdefault(parent_id, {})[folder_name] = {"id": folder_id, "ts": time.time()}
+            self._save()
+
+    def get_drive_id(self, folder_id: str) -> Tuple[bool, Optional[str]]:
+        with self._lock:
+            entry = self._drive_ids.get(folder_id)
+            if not self._fresh(entry):
+                return False, None
+            return True, entry["drive_id"]
+
+    def put_drive_id(self, folder_id: str, drive_id: Optional[str]):
+        with self._lock:
+            self._drive_ids[folder_id] = {"drive_id": drive_id, "ts": time.time()}
+            self._save()
+
+    def invalidate_id(self, folder_id: str):
+        # Drop the folder and everything cached beneath it.
+        with self._lock:
+            stale = {folder_id}
+            while stale:
+                fid = stale.pop()
+                for children in self._folders.values():
+                    for name in [n for n, e in children.items() if e["id"] == fid]:
+                        del children[name]
+                for entry in self._folders.pop(fid, {}).values():
+                    stale.add(entry["id"])
+                self._drive_ids.pop(fid, None)
+            self._save()
+
+@st.cache_resource(show_spinner=False)
+def get_folder_cache() -> FolderCache:
+    return FolderCache(FOLDER_CACHE_PATH, FOLDER_CACHE_TTL_SEC)
+
+def is_not_found_error(err: Exception) -> bool:
+    return isinstance(err, HttpError) and err.resp.status == 404
+
+def get_parent_drive_id(service=None) -> Optional[str]:
+    cache = get_folder_cache()
+    hit, drive_id = cache.get_drive_id(PARENT_FOLDER_ID)
+    if hit:
+        return drive_id
+
+    if service is None:
+        service = get_drive_service()
+    meta = service.files().get(
+        fileId=PARENT_FOLDER_ID,
+        fields="id,driveId",
+        supportsAllDrives=True
+    ).execute(num_retries=UPLOAD_MAX_RETRIES)
+
+    drive_id = meta.get("driveId")
+    cache.put_drive_id(PARENT_FOLDER_ID, drive_id)
+    return drive_id
+
+class SingleFlight:
+    # Coalesces concurrent calls for the same key: the first caller runs fn,
+    # later callers wait for and share its result (or exception).
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Any, Dict[str, Any]] = {}
+
+    def do(self, key: Any, fn: Callable[[], Any]) -> Any:
+        return self.run(key, fn)[0]
+
+    def run(self, key: Any, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        # (result, leader): leader is False for callers that got a shared
+        # result.
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"done": threading.Event(), "result": None, "error": None}
+                self._calls[key] = call
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"], False
+
+        try:
+            call["result"] = fn()
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call["done"].set()
+        return call["result"], True
+
+@st.cache_resource(show_spinner=False)
+def get_folder_flights() -> SingleFlight:
+    return SingleFlight()
+
+class KeyedLocks:
+    # One lock per key, made on first use. hold() takes several keys' locks
+    # in sorted order, so two callers holding overlapping sets can't deadlock.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks: Dict[Any, threading.Lock] = {}
+
+    @contextmanager
+    def hold(self, keys: List[Any]) -> Iterator[None]:
+        with self._lock:
+            locks = [self._locks.setdefault(key, threading.Lock()) for key in sorted(set(keys))]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+@st.cache_resource(show_spinner=False)
+def get_folder_create_locks() -> KeyedLocks:
+    # Held per (parent_id, folder_name) around "re-check cache, then create"
+    # so the single-key and the batched resolvers never create the same
+    # folder twice in this process; creates for other keys don't wait.
+    return KeyedLocks()
+
+def execute_batch(requests: List[Any], service=None) -> List[Tuple[Optional[Dict[str, Any]], Optional[Exception]]]:
+    # Sends requests as Drive batch HTTP calls (DRIVE_BATCH_SIZE per round
+    # trip) and returns (response, error) pairs in request order. Calls that
+    # fail with a transient error (5xx, 429, rate limit) are sent again, as
+    # is a batch request that fails as a whole.
+    if service is None:
+        service = get_drive_service()
+    results: List[Tuple[Optional[Dict[str, Any]], Optional[Exception]]] = [(None, None)] * len(requests)
+
+    limiter = get_rate_limiter()
+    retry: List[int] = []
+    throttled = False
+
+    def on_response(request_id, response, exception):
+        nonlocal throttled
+        results[int(request_id)] = (response, exception)
+        if exception is not None and is_transient_error(exception):
+            retry.append(int(request_id))
+            if isinstance(exception, HttpError) and is_rate_limit_response(exception.resp.status, exception.content):
+                throttled = True
+
+    def send(chunk: List[int]):
+        failures = 0
+        while True:
+            batch = service.new_batch_http_request(callback=on_response)
+            for i in chunk:
+                batch.add(requests[i], request_id=str(i))
+            # Drive counts each call in a batch against the quota; the batch
+            # request itself takes one more token in RateLimitedHttp.
+            limiter.acquire(len(chunk) - 1)
+            try:
+                batch.execute()
+                return
+            except Exception as e:
+                failures += 1
+                if failures > UPLOAD_MAX_RETRIES or not is_transient_error(e):
+                    raise
+                time.sleep(backoff_delay(failures, base=0.5, cap=8.0))
+
+    pending = list(range(len(requests)))
+    for attempt in range(UPLOAD_MAX_RETRIES + 1):
+        if attempt:
+            time.sleep(backoff_delay(attempt, base=0.5, cap=8.0))
+        for start in range(0, len(pending), DRIVE_BATCH_SIZE):
+            send(pending[start:start + DRIVE_BATCH_SIZE])
+        if not retry:
+            break
+        # Calls bounced by the rate limit are sent again once the rate is cut.
+        if throttled:
+            limiter.on_throttled()
+        pending, retry, throttled = sorted(retry), [], False
+    return results
+
+def drive_list_kwargs(drive_id: Optional[str]) -> Dict[str, Any]:
+    if drive_id:
+        return {
+            "corpora": "drive",
+            "driveId": drive_id,
+            "includeItemsFromAllDrives": True,
+            "supportsAllDrives": True,
+        }
+    return {
+        "corpora": "user",
+        "includeItemsFromAllDrives": True,
+        "supportsAllDrives": True,
+    }
+
+@timed("get_or_create_folder")
+def get_or_create_folder(parent_id: str, folder_name: str, service=None) -> str:
+    cache = get_folder_cache()
+    folder_id = cache.get(parent_id, folder_name)
+    if folder_id:
+        return folder_id
+
+    return get_folder_flights().do(
+        (parent_id, folder_name),
+        lambda: _lookup_or_create_folder(parent_id, folder_name, service),
+    )
+
+def _lookup_or_create_folder(parent_id: str, folder_name: str, service=None) -> str:
+    cache = get_folder_cache()
+    # Another flight for this key may have finished just before ours started.
+    folder_id = cache.get(parent_id, folder_name)
+    if folder_id:
+        return folder_id
+
+    if service is None:
+        service = get_drive_service()
+    drive_id = get_parent_drive_id(service)
+
+    q = (
+        f"mimeType='{FOLDER_MIME}' and "
+        f"name='{folder_name}' and "
+        f"'{parent_id}' in parents and "
+        f"trashed=false"
+    )
+
+    # Oldest first, so every session settles on the same folder if
+    # duplicates already exist. Folder calls retry 5xx/429 like uploads.
+    res = service.files().list(
+        q=q,
+        spaces="drive",
+        fields="files(id,name)",
+        orderBy="createdTime",
+        pageSize=10,
+        **drive_list_kwargs(drive_id)
+    ).execute(num_retries=UPLOAD_MAX_RETRIES)
+
+    files = res.get("files", [])
+    if files:
+        folder_id = files[0]["id"]
+        cache.put(parent_id, folder_name, folder_id)
+        return folder_id
+
+    with get_folder_create_locks().hold([(parent_id, folder_name)]):
+        folder_id = cache.get(parent_id, folder_name)
+        if folder_id:
+            return folder_id
+
+        folder_meta = {
+            "name": folder_name,
+            "mimeType": FOLDER_MIME,
+            "parents": [parent_id]
+        }
+        created = service.files().create(
+            body=folder_meta,
+            fields="id",
+            supportsAllDrives=True
+        ).execute(num_retries=UPLOAD_MAX_RETRIES)
+
+        folder_id = created["id"]
+        cache.put(parent_id, folder_name, folder_id)
+    return folder_id
+
+def list_children(
+    parent_id: str,
+    service=None,
+    folders_only: bool = False,
+    fields: str = "id,name,createdTime",
+) -> List[Dict[str, Any]]:
+    if service is None:
+        service = get_drive_service()
+    drive_id = get_parent_drive_id(service)
+
+    q = f"'{parent_id}' in parents and trashed=false"
+    if folders_only:
+        q = f"mimeType='{FOLDER_MIME}' and {q}"
+
+    children: List[Dict[str, Any]] = []
+    page_token = None
+    while True:
+        res = service.files().list(
+            q=q,
+            spaces="drive",
+            fields=f"nextPageToken,files({fields})",
+            orderBy="createdTime",
+            pageSize=1000,
+            pageToken=page_token,
+            **drive_list_kwargs(drive_id)
+        ).execute(num_retries=UPLOAD_MAX_RETRIES)
+        children.extend(res.get("files", []))
+        page_token = res.get("nextPageToken")
+        if not page_token:
+            return children
+
+def reconcile_duplicate_folders(
+    parent_id: str = PARENT_FOLDER_ID,
+    depth: int = 2,
+    service=None,
+    dry_run: bool = False,
+) -> List[Dict[str, Any]]:
+    # Merges same-named sibling folders (ZIP level, then date level for
+    # depth=2): children of each duplicate move into the oldest folder and the
+    # emptied duplicate is trashed. Returns one record per merged duplicate.
+    # Run from the app's ?folders=1 panel.
+    if service is None:
+        service = get_drive_service()
+    cache = get_folder_cache()
+    merged: List[Dict[str, Any]] = []
+
+    by_name: Dict[str, List[Dict[str, Any]]] = {}
+    for folder in list_children(parent_id, service, folders_only=True):
+        by_name.setdefault(folder["name"], []).append(folder)
+
+    for name, folders in by_name.items():
+        keep = folders[0]
+        for dup in folders[1:]:
+            children = list_children(dup["id"], service, fields="id")
+            if not dry_run:
+                moves = [
+                    service.files().update(
+                        fileId=child["id"],
+                        addParents=keep["id"],
+                        removeParents=dup["id"],
+                        fields="id",
+                        supportsAllDrives=True
+                    )
+                    for child in children
+                ]
+                errors = [err for _, err in execute_batch(moves, service) if err is not None]
+                if errors:
+                    raise errors[0]
+                service.files().update(
+                    fileId=dup["id"],
+                    body={"trashed": True},
+                    fields="id",
+                    supportsAllDrives=True
+                ).execute(num_retries=UPLOAD_MAX_RETRIES)
+                cache.invalidate_id(dup["id"])
+            merged.append({"parent_id": parent_id, "name": name, "kept": keep["id"], "merged": dup["id"], "moved": len(children)})
+        if not dry_run:
+            cache.put(parent_id, name, keep["id"])
+
+    if depth > 1:
+        for folders in by_name.values():
+            merged.extend(reconcile_duplicate_folders(folders[0]["id"], depth - 1, service, dry_run))
+    return merged
+
+@timed("ensure_zip_date_folder")
+def ensure_zip_date_folder(
+    zipcode: str,
+    tz_name: str,
+    date_str: Optional[str] = None,
+    service=None,
+) -> tuple[str, str, str]:
+    if date_str is None:
+        date_str = datetime.now(ZoneInfo(tz_name)).strftime("%Y%m%d")
+
+    zip_folder_id = get_or_create_folder(PARENT_FOLDER_ID, zipcode, service)
+    try:
+        date_folder_id = get_or_create_folder(zip_folder_id, date_str, service)
+    except HttpError as e:
+        if not is_not_found_error(e):
+            raise
+        # The cached ZIP folder no longer exists in Drive.
+        get_folder_cache().invalidate_id(zip_folder_id)
+        zip_folder_id = get_or_create_folder(PARENT_FOLDER_ID, zipcode, service)
+        date_folder_id = get_or_create_folder(zip_folder_id, date_str, service)
+    return zip_folder_id, date_folder_id, date_str
+
+# OSErrors a NAS mount or a full disk can clear up on their own.
+TRANSIENT_ERRNOS = {
+    getattr(errno, name) for name in (
+        "EIO", "ESTALE", "ETIMEDOUT", "EAGAIN", "EBUSY", "ENETDOWN", "ENETUNREACH",
+        "EHOSTDOWN", "EHOSTUNREACH", "ENOTCONN", "ENOSPC",
+    ) if hasattr(errno, name)
+}
+S3_TRANSIENT_CODES = {"SlowDown", "RequestTimeout", "Throttling", "ThrottlingException"}
+
+def is_transient_error(err: Exception) -> bool:
+    # Follows explicit chaining (raise ... from e), and the implicit one for
+    # boto3's S3UploadFailedError, which wraps the ClientError that way.
+    while err is not None:
+        if isinstance(err, HttpError):
+            status = err.resp.status
+            if status in (408, 429, 500, 502, 503, 504):
+                return True
+            return is_rate_limit_response(status, err.content)
+        if isinstance(err, (ConnectionError, TimeoutError, httplib2.HttpLib2Error)):
+            return True
+        if isinstance(err, OSError):
+            return err.errno in TRANSIENT_ERRNOS
+        if S3_AVAILABLE:
+            if isinstance(err, (BotoConnectionError, HTTPClientError)):
+                return True
+            if isinstance(err, ClientError):
+                status = err.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+                code = err.response.get("Error", {}).get("Code")
+                return status in (408, 429) or status >= 500 or code in S3_TRANSIENT_CODES
+            if isinstance(err, S3UploadFailedError) and err.__cause__ is None:
+                err = err.__context__
+                continue
+        err = err.__cause__
+    return False
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 32.0) -> float:
+    # Exponential backoff with jitter; attempt starts at 1.
+    return min(cap, base * 2 ** (attempt - 1)) * (0.5 + random.random() / 2)
+
+def normalize_chunk_size(chunk_size: int) -> int:
+    if chunk_size <= 0:
+        return 0
+    return max(1, -(-chunk_size // UPLOAD_CHUNK_ALIGN)) * UPLOAD_CHUNK_ALIGN
+
+
+UploadSource = Union[bytes, bytearray, memoryview, BinaryIO]
+
+class MemoryviewReader(io.RawIOBase):
+    # Seekable read-only stream over a buffer. Reads slice the view, so the
+    # payload is never copied whole (io.BytesIO(memoryview) would copy it).
+    def __init__(self, data: Union[bytes, bytearray, memoryview]):
+        self._view = memoryview(data).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def readinto(self, buffer) -> int:
+        n = max(0, min(len(buffer), len(self._view) - self._pos))
+        buffer[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+def open_upload_source(source: UploadSource) -> Tuple[BinaryIO, int]:
+    # Returns a seekable stream positioned at 0 and its size. File objects
+    # (Streamlit's UploadedFile, open spool files) are used as they are.
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        stream = MemoryviewReader(source)
+    else:
+        stream = source
+    size = stream.seek(0, io.SEEK_END)
+    stream.seek(0)
+    return stream, size
+
+def stream_sha256(stream: BinaryIO) -> str:
+    digest = hashlib.sha256()
+    block = memoryview(bytearray(UPLOAD_READ_BLOCK))
+    stream.seek(0)
+    while True:
+        n = stream.readinto(block)
+        if not n:
+            break
+        digest.update(block[:n])
+    stream.seek(0)
+    return digest.hexdigest()
+
+def resolve_folders(
+    keys: List[Tuple[str, str]],
+    service=None,
+) -> Dict[Tuple[str, str], str]:
+    # Batched get_or_create_folder for many (parent_id, folder_name) keys:
+    # one batch of lists for the cache misses, then one batch of creates for
+    # whatever is still missing.
+    cache = get_folder_cache()
+    resolved: Dict[Tuple[str, str], str] = {}
+    misses: List[Tuple[str, str]] = []
+    for key in dict.fromkeys(keys):
+        folder_id = cache.get(*key)
+        if folder_id:
+            resolved[key] = folder_id
+        else:
+            misses.append(key)
+    if not misses:
+        return resolved
+
+    if service is None:
+        service = get_drive_service()
+    list_kwargs = drive_list_kwargs(get_parent_drive_id(service))
+
+    lookups = [
+        service.files().list(
+            q=(
+                f"mimeType='{FOLDER_MIME}' and "
+                f"name='{folder_name}' and "
+                f"'{parent_id}' in parents and "
+                f"trashed=false"
+            ),
+            spaces="drive",
+            fields="files(id,name)",
+            orderBy="createdTime",
+            pageSize=10,
+            **list_kwargs
+        )
+        for parent_id, folder_name in misses
+    ]
+    missing: List[Tuple[str, str]] = []
+    for key, (res, err) in zip(misses, execute_batch(lookups, service)):
+        if err is not None:
+            raise err
+        files = res.get("files", [])
+        if files:
+            resolved[key] = files[0]["id"]
+            cache.put(key[0], key[1], files[0]["id"])
+        else:
+            missing.append(key)
+    if not missing:
+        return resolved
+
+    with get_folder_create_locks().hold(missing):
+        to_create = []
+        for key in missing:
+            folder_id = cache.get(*key)
+            if folder_id:
+                resolved[key] = folder_id
+            else:
+                to_create.append(key)
+
+        creates = [
+            service.files().create(
+                body={"name": folder_name, "mimeType": FOLDER_MIME, "parents": [parent_id]},
+                fields="id",
+                supportsAllDrives=True
+            )
+            for parent_id, folder_name in to_create
+        ]
+        first_error = None
+        for key, (res, err) in zip(to_create, execute_batch(creates, service)):
+            if err is not None:
+                first_error = first_error or err
+                continue
+            resolved[key] = res["id"]
+            cache.put(key[0], key[1], res["id"])
+    if first_error is not None:
+        raise first_error
+    return resolved
+
+@timed("ensure_zip_date_folders")
+def ensure_zip_date_folders(
+    zip_dates: List[Tuple[str, str]],
+    service=None,
+) -> Dict[Tuple[str, str], Tuple[str, str]]:
+    # Back-fill variant of ensure_zip_date_folder: {(zipcode, date_str):
+    # (zip_folder_id, date_folder_id)} at one batch round trip per level.
+    zip_ids = resolve_folders([(PARENT_FOLDER_ID, zipcode) for zipcode, _ in zip_dates], service)
+    date_ids = resolve_folders(
+        [(zip_ids[(PARENT_FOLDER_ID, zipcode)], date_str) for zipcode, date_str in zip_dates],
+        service,
+    )
+    return {
+        (zipcode, date_str): (
+            zip_ids[(PARENT_FOLDER_ID, zipcode)],
+            date_ids[(zip_ids[(PARENT_FOLDER_ID, zipcode)], date_str)],
+        )
+        for zipcode, date_str in zip_dates
+    }
+
+class HashIndex:
+    # sha256 -> Drive files already holding that content. Folders whose
+    # existing files have been read in are remembered, so each folder is
+    # listed at most once per ttl_sec; a new listing replaces the old one.
+    def __init__(self, path: str, ttl_sec: int):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS hashes (
+                    sha256 TEXT NOT NULL,
+                    file_id TEXT NOT NULL PRIMARY KEY,
+                    parent_id TEXT NOT NULL,
+                    name TEXT NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS hashes_sha ON hashes (sha256)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS indexed_folders (parent_id TEXT PRIMARY KEY, ts REAL NOT NULL)")
+
+    def add(self, sha256: str, file_id: str, parent_id: str, name: str):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO hashes (sha256, file_id, parent_id, name) VALUES (?, ?, ?, ?)",
+                (sha256, file_id, parent_id, name)
+            )
+
+    def remove(self, file_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM hashes WHERE file_id = ?", (file_id,))
+
+    def lookup(self, sha256: str) -> List[Dict[str, str]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT file_id, parent_id, name FROM hashes WHERE sha256 = ?", (sha256,)
+            ).fetchall()
+        return [{"file_id": r[0], "parent_id": r[1], "name": r[2]} for r in rows]
+
+    def is_folder_indexed(self, parent_id: str) -> bool:
+        with self._lock:
+            row = self._db.execute("SELECT ts FROM indexed_folders WHERE parent_id = ?", (parent_id,)).fetchone()
+        return row is not None and time.time() - row[0] < self.ttl_sec
+
+    def replace_folder(self, parent_id: str, files: List[Tuple[str, str, str]]):
+        # files: (sha256, file_id, name) for everything now in the folder.
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM hashes WHERE parent_id = ?", (parent_id,))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO hashes (sha256, file_id, parent_id, name) VALUES (?, ?, ?, ?)",
+                [(sha256, file_id, parent_id, name) for sha256, file_id, name in files]
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO indexed_folders (parent_id, ts) VALUES (?, ?)", (parent_id, time.time())
+            )
+            self._db.execute("COMMIT")
+
+@st.cache_resource(show_spinner=False)
+def get_hash_index() -> HashIndex:
+    return HashIndex(HASH_INDEX_PATH, HASH_INDEX_TTL_SEC)
+
+@st.cache_resource(show_spinner=False)
+def get_upload_flights() -> SingleFlight:
+    return SingleFlight()
+
+def index_drive_folder(parent_id: str, service=None):
+    # Drive reports sha256Checksum for every binary file, so files uploaded
+    # before appProperties were written are matched too.
+    index = get_hash_index()
+    if index.is_folder_indexed(parent_id):
+        return
+    files = []
+    for f in list_children(parent_id, service, fields="id,name,appProperties,sha256Checksum"):
+        sha256 = (f.get("appProperties") or {}).get("sha256") or f.get("sha256Checksum")
+        if sha256:
+            files.append((sha256, f["id"], f["name"]))
+    index.replace_folder(parent_id, files)
+
+def find_duplicate(
+    sha256: str,
+    parent_id: str,
+    service,
+    same_folder_only: bool = True,
+) -> Optional[Dict[str, str]]:
+    # A live file with this content, in parent_id if there is one. Other
+    # folders are only searched when same_folder_only is off ("link" mode).
+    index = get_hash_index()
+    index_drive_folder(parent_id, service)
+    candidates = sorted(index.lookup(sha256), key=lambda c: c["parent_id"] != parent_id)
+    if same_folder_only:
+        candidates = [c for c in candidates if c["parent_id"] == parent_id]
+    if not candidates:
+        return None
+
+    # The index may be stale (files trashed, deleted or moved since it was
+    # built); never skip an upload on its word alone. All candidates are
+    # checked in one batch request.
+    checks = [
+        service.files().get(fileId=c["file_id"], fields="id,trashed,parents", supportsAllDrives=True)
+        for c in candidates
+    ]
+    found = None
+    for candidate, (meta, err) in zip(candidates, execute_batch(checks, service)):
+        if err is not None and not is_not_found_error(err):
+            raise err
+        live = meta is not None and not meta.get("trashed") and candidate["parent_id"] in (meta.get("parents") or [])
+        if not live:
+            index.remove(candidate["file_id"])
+        elif found is None:
+            found = candidate
+    return found
+
+def upload_bytes_to_drive(
+    source: UploadSource,
+    mimetype: str,
+    filename: str,
+    parent_id: str,
+    service=None,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+    progress_cb: Optional[Callable[[int, int], None]] = None,
+    dedup_mode: str = DEDUP_MODE,
+) -> Dict[str, Any]:
+    # source: bytes, a memoryview or a seekable binary file; it is streamed,
+    # never copied whole. Returns the created file's {"id"}; for a skipped or
+    # linked duplicate also "duplicate_of" (the existing file's ID).
+    if service is None:
+        service = get_drive_service()
+    stream, size = open_upload_source(source)
+    with timed_stage("upload_bytes_to_drive", filename=filename, bytes=size) as span:
+        sha256 = stream_sha256(stream)
+        if dedup_mode == "off":
+            return _upload_new_file(stream, size, mimetype, filename, parent_id, sha256, service, chunk_size, progress_cb)
+
+        # Identical files in flight at the same time (e.g. a batch re-run while
+        # the first run is still going) share one transfer. The callers that
+        # waited get a duplicate of the leader's file.
+        result, leader = get_upload_flights().run(
+            (sha256, parent_id),
+            lambda: _upload_deduplicated(
+                stream, size, mimetype, filename, parent_id, sha256, service, chunk_size, progress_cb, dedup_mode
+            ),
+        )
+        if not leader:
+            result = {"id": result["id"], "duplicate_of": result.get("duplicate_of", result["id"])}
+            if progress_cb:
+                progress_cb(size, size)
+        if "duplicate_of" in result:
+            span["duplicate"] = True
+            span["bytes"] = 0
+        return result
+
+def _upload_deduplicated(
+    stream: BinaryIO,
+    size: int,
+    mimetype: str,
+    filename: str,
+    parent_id: str,
+    sha256: str,
+    service,
+    chunk_size: int,
+    progress_cb: Optional[Callable[[int, int], None]],
+    dedup_mode: str,
+) -> Dict[str, Any]:
+    existing = find_duplicate(sha256, parent_id, service, same_folder_only=dedup_mode != "link")
+    if existing is None:
+        return _upload_new_file(stream, size, mimetype, filename, parent_id, sha256, service, chunk_size, progress_cb)
+
+    if progress_cb:
+        progress_cb(size, size)
+    if existing["parent_id"] == parent_id:
+        return {"id": existing["file_id"], "duplicate_of": existing["file_id"]}
+
+    shortcut = service.files().create(
+        body={
+            "name": filename,
+            "mimeType": SHORTCUT_MIME,
+            "parents": [parent_id],
+            "shortcutDetails": {"targetId": existing["file_id"]},
+        },
+        fields="id",
+        supportsAllDrives=True
+    ).execute(num_retries=UPLOAD_MAX_RETRIES)
+    return {"id": shortcut["id"], "duplicate_of": existing["file_id"]}
+
+def _upload_new_file(
+    stream: BinaryIO,
+    size: int,
+    mimetype: str,
+    filename: str,
+    parent_id: str,
+    sha256: str,
+    service,
+    chunk_size: int,
+    progress_cb: Optional[Callable[[int, int], None]],
+) -> Dict[str, Any]:
+    created = _transfer_bytes_to_drive(
+        stream, size, mimetype,
+        {"name": filename, "parents": [parent_id], "appProperties": {"sha256": sha256}},
+        service, chunk_size, progress_cb,
+    )
+    get_hash_index().add(sha256, created["id"], parent_id, filename)
+    return created
+
+def _transfer_bytes_to_drive(
+    stream: BinaryIO,
+    total: int,
+    mimetype: str,
+    file_metadata: Dict[str, Any],
+    service,
+    chunk_size: int,
+    progress_cb: Optional[Callable[[int, int], None]],
+) -> Dict[str, Any]:
+    # MediaIoBaseUpload seeks and reads the stream itself, so at most one
+    # chunk (or one small file) per transfer is held in memory.
+    stream.seek(0)
+    chunk_size = normalize_chunk_size(chunk_size)
+
+    if not chunk_size or total <= chunk_size:
+        media = MediaIoBaseUpload(stream, mimetype=mimetype)
+        created = service.files().create(
+            body=file_metadata,
+            media_body=media,
+            fields="id",
+            supportsAllDrives=True
+        ).execute(num_retries=UPLOAD_MAX_RETRIES)
+        if progress_cb:
+            progress_cb(total, total)
+        return created
+
+    media = MediaIoBaseUpload(stream, mimetype=mimetype, chunksize=chunk_size, resumable=True)
+    request = service.files().create(
+        body=file_metadata,
+        media_body=media,
+        fields="id",
+        supportsAllDrives=True
+    )
+
+    # After a failed chunk the request asks Drive for the acknowledged
+    # offset on the next call, so a retry resumes instead of restarting.
+    created = None
+    failures = 0
+    while created is None:
+        try:
+            status, created = request.next_chunk()
+        except Exception as e:
+            failures += 1
+            if failures > UPLOAD_MAX_RETRIES or not is_transient_error(e):
+                raise
+            time.sleep(backoff_delay(failures))
+            continue
+        failures = 0
+        if progress_cb:
+            progress_cb(status.resumable_progress if status else total, total)
+    return created
+
+# "spawn": forking the multi-threaded server process is unsafe.
+@st.cache_resource(show_spinner=False)
+def get_derivative_pool() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=DERIVATIVE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+    )
+
+def derivative_filename(filename: str, px: int) -> str:
+    return f"{os.path.splitext(filename)[0]}_{px}px.jpg"
+
+def make_derivatives(
+    source: Union[str, UploadSource],
+    filename: str,
+    sizes: Tuple[int, ...] = DERIVATIVE_SIZES,
+) -> List[Tuple[int, str, bytes]]:
+    # [(px, name, jpeg_bytes)]. source: as for upload_bytes_to_drive, or a
+    # file path (spool payloads), which the worker process reads itself.
+    # Files Pillow can't decode get no derivatives.
+    if not sizes:
+        return []
+    if isinstance(source, str):
+        payload, size = source, os.path.getsize(source)
+    else:
+        stream, size = open_upload_source(source)
+        payload = stream.read()
+        stream.seek(0)
+    with timed_stage("render_derivatives", filename=filename, bytes=size):
+        variants = get_derivative_pool().submit(
+            render_derivatives, payload, tuple(sizes), DERIVATIVE_QUALITY
+        ).result()
+    return [(px, derivative_filename(filename, px), data) for px, data in variants]
+
+def upload_derivatives(
+    source: Union[str, UploadSource],
+    filename: str,
+    parent_id: str,
+    service=None,
+    sizes: Tuple[int, ...] = DERIVATIVE_SIZES,
+    on_uploaded: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> List[Dict[str, Any]]:
+    # on_uploaded(derivative) runs as each one lands, so a caller keeps the
+    # sizes that made it when a later one fails.
+    uploaded = []
+    for px, name, data in make_derivatives(source, filename, sizes):
+        created = upload_bytes_to_drive(data, "image/jpeg", name, parent_id, service=service)
+        uploaded.append({"id": created["id"], "name": name, "px": px})
+        if on_uploaded:
+            on_uploaded(uploaded[-1])
+    return uploaded
+
+upload_log = logging.getLogger("weed_collector.upload")
+
+class UploadCancelled(Exception):
+    pass
+
+class UploadProgress:
+    # Live state of one batch, shared by the upload workers and whoever
+    # shows it. cancel() stops the batch at the next chunk or file boundary;
+    # files that finished stay uploaded and recorded.
+    def __init__(self, jobs: List[Dict[str, Any]], window_sec: float = PROGRESS_WINDOW_SEC):
+        self.total_files = len(jobs)
+        self.total_bytes = sum(job.get("size") or 0 for job in jobs)
+        self.window_sec = window_sec
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._sent: Dict[str, int] = {}
+        self._bytes = 0
+        self._active: Dict[str, None] = {}
+        self._outcomes: Dict[str, str] = {}
+        self._samples: deque = deque([(self.started_at, 0)])
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check(self):
+        if self._cancel.is_set():
+            raise UploadCancelled("Upload cancelled")
+
+    def start_file(self, filename: str):
+        self.check()
+        with self._lock:
+            self._active[filename] = None
+
+    def update(self, filename: str, sent: int):
+        # sent: the file's bytes so far.
+        now = time.monotonic()
+        with self._lock:
+            self._bytes += sent - self._sent.get(filename, 0)
+            self._sent[filename] = sent
+            self._samples.append((now, self._bytes))
+            while len(self._samples) > 2 and now - self._samples[1][0] > self.window_sec:
+                self._samples.popleft()
+
+    def finish_file(self, filename: str, error: Optional[Exception] = None):
+        # A retried file's later outcome replaces its earlier one.
+        with self._lock:
+            self._active.pop(filename, None)
+            if error is None:
+                outcome = "done"
+            elif isinstance(error, UploadCancelled):
+                outcome = "cancelled"
+                self._bytes -= self._sent.pop(filename, 0)
+            else:
+                outcome = "failed"
+            self._outcomes[filename] = outcome
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            outcomes = list(self._outcomes.values())
+            t0, b0 = self._samples[0]
+            rate = (self._bytes - b0) / (now - t0) if now > t0 else 0.0
+            remaining = max(0, self.total_bytes - self._bytes)
+            return {
+                "files_done": outcomes.count("done"),
+                "files_failed": outcomes.count("failed"),
+                "files_cancelled": outcomes.count("cancelled"),
+                "total_files": self.total_files,
+                "bytes_sent": self._bytes,
+                "total_bytes": self.total_bytes,
+                "mb_per_s": round(rate / 1e6, 2),
+                "eta_sec": round(remaining / rate) if rate > 0 else None,
+                "elapsed_sec": round(now - self.started_at, 1),
+                "active": list(self._active),
+                "cancelled": self.cancelled,
+            }
+
+def upload_jobs_to_drive(
+    jobs: List[Dict[str, Any]],
+    parent_id: str,
+    max_workers: int = UPLOAD_WORKERS,
+    progress_cb: Optional[Callable[[int, int, int], None]] = None,
+    progress: Optional[UploadProgress] = None,
+) -> List[Tuple[str, Optional[Exception]]]:
+    # jobs: [{"source", "size", "mimetype", "filename", "record"?}] (source as
+    # for upload_bytes_to_drive; "record" is the job's manifest row); results
+    # come back in job order. Cancelled jobs fail with UploadCancelled.
+    # progress_cb(job_index, bytes_sent, job_bytes) is only called in sequential
+    # mode, where it runs on the Streamlit script thread; progress is updated
+    # from any thread.
+    def upload_one(i: int, job: Dict[str, Any], service=None, job_cb=None) -> str:
+        def report(sent: int, total: int):
+            if job_cb:
+                job_cb(i, sent, total)
+            if progress is not None:
+                progress.update(job["filename"], sent)
+                # Raising between chunks aborts the transfer; once the last
+                # byte is in, the file is kept and recorded.
+                if sent < total:
+                    progress.check()
+
+        try:
+            if progress is not None:
+                progress.start_file(job["filename"])
+            created = upload_bytes_to_drive(
+                job["source"], job["mimetype"], job["filename"], parent_id, service=service, progress_cb=report
+            )
+            # Past this point the file is in Drive; it is always recorded,
+            # with whichever derivatives made it.
+            derivatives: List[Dict[str, Any]] = []
+            try:
+                upload_derivatives(
+                    job["source"], job["filename"], parent_id, service=service, on_uploaded=derivatives.append
+                )
+            except Exception as e:
+                upload_log.warning("Derivatives for %s failed: %s", job["filename"], e)
+            record_upload(job, created, derivatives, parent_id)
+        except Exception as e:
+            if progress is not None:
+                progress.finish_file(job["filename"], e)
+            raise
+        if progress is not None:
+            progress.finish_file(job["filename"])
+        return job["filename"]
+
+    results: List[Tuple[str, Optional[Exception]]] = []
+    if max_workers <= 1 or len(jobs) <= 1:
+        for i, job in enumerate(jobs):
+            try:
+                results.append((upload_one(i, job, job_cb=progress_cb), None))
+            except Exception as e:
+                results.append((job["filename"], e))
+        return results
+
+    # Worker threads have no Streamlit session, so resolve credentials here
+    # and give each worker its own Drive client.
+    creds = get_drive_credentials()
+    local = threading.local()
+    priority = _drive_priority.get()
+
+    def init_worker():
+        local.service = build_drive_service(creds)
+
+    def run(i: int, job: Dict[str, Any]) -> str:
+        with drive_priority(priority):
+            return upload_one(i, job, service=local.service)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs)), initializer=init_worker) as pool:
+        futures = [pool.submit(run, i, job) for i, job in enumerate(jobs)]
+        for job, fut in zip(jobs, futures):
+            try:
+                results.append((fut.result(), None))
+            except Exception as e:
+                results.append((job["filename"], e))
+    return results
+
+def upload_jobs_to_drive_date_folder(
+    jobs: List[Dict[str, Any]],
+    zipcode: str,
+    tz_name: str,
+    date_str: str,
+    max_workers: int = UPLOAD_WORKERS,
+    progress_cb: Optional[Callable[[int, int, int], None]] = None,
+    progress: Optional[UploadProgress] = None,
+) -> List[Tuple[str, Optional[Exception]]]:
+    jobs = [
+        dict(job, record=dict(job["record"], zipcode=zipcode, tz_name=tz_name, date_str=date_str))
+        if job.get("record") is not None else job
+        for job in jobs
+    ]
+    _, date_folder_id, _ = ensure_zip_date_folder(zipcode, tz_name, date_str=date_str)
+    results = upload_jobs_to_drive(jobs, date_folder_id, max_workers, progress_cb, progress)
+
+    # A 404 means the cached date folder was deleted in Drive: drop it,
+    # resolve the folders again and retry just those files.
+    stale = [i for i, (_, err) in enumerate(results) if err is not None and is_not_found_error(err)]
+    if stale:
+        get_folder_cache().invalidate_id(date_folder_id)
+        _, date_folder_id, _ = ensure_zip_date_folder(zipcode, tz_name, date_str=date_str)
+        retried = upload_jobs_to_drive(
+            [jobs[i] for i in stale], date_folder_id, max_workers,
+            (lambda j, sent, total: progress_cb(stale[j], sent, total)) if progress_cb else None,
+            progress,
+        )
+        for i, result in zip(stale, retried):
+            results[i] = result
+    flush_pending_manifests()
+    return results
+
+# -------------------------
+# Storage backends
+# -------------------------
+# Where uploads land, chosen by STORAGE_BACKEND; STORAGE_MIRROR optionally
+# copies every upload to a second backend. All keep the ZIP/DATE/filename
+# layout under their root (PARENT_FOLDER_ID, STORAGE_FS_ROOT, S3_PREFIX).
+storage_log = logging.getLogger("weed_collector.storage")
+
+class StorageBackend(ABC):
+    name = "base"
+
+    @abstractmethod
+    def upload_jobs(
+        self,
+        jobs: List[Dict[str, Any]],
+        zipcode: str,
+        tz_name: str,
+        date_str: str,
+        max_workers: int = UPLOAD_WORKERS,
+        progress_cb: Optional[Callable[[int, int, int], None]] = None,
+        progress: Optional[UploadProgress] = None,
+        hold_manifest: bool = False,
+    ) -> List[Tuple[str, Optional[Exception]]]:
+        # hold_manifest: keep the jobs' manifest rows for a later
+        # flush_manifests() instead of writing them now.
+        ...
+
+    def flush_manifests(self) -> int:
+        # Writes held manifest rows; returns how many were written.
+        return 0
+
+class DriveStorage(StorageBackend):
+    # The Google Drive tree: folder cache, dedup, rate limiting, manifests.
+    # Its rows always wait in the manifest outbox, so nothing is held here.
+    name = "drive"
+
+    def upload_jobs(self, jobs, zipcode, tz_name, date_str, max_workers=UPLOAD_WORKERS, progress_cb=None, progress=None,
+                    hold_manifest=False):
+        return upload_jobs_to_drive_date_folder(jobs, zipcode, tz_name, date_str, max_workers, progress_cb, progress)
+
+class FileTreeStorage(StorageBackend):
+    # Shared upload loop for stores addressed by "ZIP/DATE/filename" keys.
+    # Subclasses provide _stat (stored SHA-256 or None), _put, and reading
+    # and writing a folder's manifest files. A file already stored with the
+    # same content is skipped, so retried jobs don't upload twice. Each
+    # batch (or, when held, each flush) writes its manifest rows as a new
+    # part file as Drive flushes do, so concurrent writers never rewrite
+    # each other's rows.
+    def __init__(self):
+        self._manifest_lock = threading.Lock()
+        # Paths a folder's manifests list (read once per folder), and rows
+        # not yet written.
+        self._known: Dict[str, set] = {}
+        self._held: Dict[str, List[Dict[str, Any]]] = {}
+
+    @abstractmethod
+    def _stat(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def _put(self, stream: BinaryIO, size: int, mimetype: str, key: str, sha256: str,
+             progress_cb: Optional[Callable[[int, int], None]]):
+        ...
+
+    @abstractmethod
+    def _read_manifests(self, folder: str) -> List[bytes]:
+        ...
+
+    @abstractmethod
+    def _write_manifest(self, folder: str, name: str, body: bytes):
+        ...
+
+    def _manifest_paths(self, folder: str) -> set:
+        paths = set()
+        for content in self._read_manifests(folder):
+            for line in content.splitlines():
+                try:
+                    paths.add(json.loads(line).get("path"))
+                except ValueError:
+                    continue
+        return paths
+
+    def put(self, source: UploadSource, mimetype: str, key: str,
+            progress_cb: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        # Transient errors (a NAS hiccup, S3 5xx or throttling) are retried
+        # with backoff, like Drive uploads.
+        stream, size = open_upload_source(source)
+        with timed_stage(f"{self.name}_put", filename=key, bytes=size) as span:
+            sha256 = stream_sha256(stream)
+            failures = 0
+            while True:
+                try:
+                    if self._stat(key) == sha256:
+                        span["duplicate"] = True
+                        span["bytes"] = 0
+                        if progress_cb:
+                            progress_cb(size, size)
+                        return {"id": key, "duplicate_of": key}
+                    self._put(stream, size, mimetype, key, sha256, progress_cb)
+                    return {"id": key}
+                except Exception as e:
+                    failures += 1
+                    if failures > UPLOAD_MAX_RETRIES or not is_transient_error(e):
+                        raise
+                    time.sleep(backoff_delay(failures))
+
+    def upload_jobs(self, jobs, zipcode, tz_name, date_str, max_workers=UPLOAD_WORKERS, progress_cb=None, progress=None,
+                    hold_manifest=False):
+        # Same contract as upload_jobs_to_drive: results in job order,
+        # cancelled jobs fail with UploadCancelled, progress_cb only when
+        # sequential.
+        folder = f"{zipcode}/{date_str}"
+        sequential = max_workers <= 1 or len(jobs) <= 1
+        rows: List[Dict[str, Any]] = []
+
+        def upload_one(i: int, job: Dict[str, Any]) -> str:
+            def report(sent: int, total: int):
+                if progress_cb and sequential:
+                    progress_cb(i, sent, total)
+                if progress is not None:
+                    progress.update(job["filename"], sent)
+                    if sent < total:
+                        progress.check()
+
+            try:
+                if progress is not None:
+                    progress.start_file(job["filename"])
+                created = self.put(job["source"], job["mimetype"], f"{folder}/{job['filename']}", report)
+            except Exception as e:
+                if progress is not None:
+                    progress.finish_file(job["filename"], e)
+                raise
+            # The original is stored; a failed derivative is only logged and
+            # the row lists the ones that made it.
+            derivatives: List[Dict[str, Any]] = []
+            try:
+                for px, name, data in make_derivatives(job["source"], job["filename"]):
+                    stored = self.put(data, "image/jpeg", f"{folder}/{name}")
+                    derivatives.append({"px": px, "name": name, "path": stored["id"]})
+            except Exception as e:
+                storage_log.warning("Derivatives for %s failed: %s", job["filename"], e)
+            if progress is not None:
+                progress.finish_file(job["filename"])
+            if job.get("record") is not None:
+                rows.append(dict(
+                    job["record"],
+                    zipcode=zipcode,
+                    tz_name=tz_name,
+                    date_str=date_str,
+                    filename=job["filename"],
+                    mimetype=job["mimetype"],
+                    size=job.get("size"),
+                    path=created["id"],
+                    duplicate_of=created.get("duplicate_of"),
+                    derivatives=derivatives,
+                    uploaded_at=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                ))
+            return job["filename"]
+
+        results: List[Tuple[str, Optional[Exception]]] = []
+        if sequential:
+            for i, job in enumerate(jobs):
+                try:
+                    results.append((upload_one(i, job), None))
+                except Exception as e:
+                    results.append((job["filename"], e))
+        else:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+                futures = [pool.submit(upload_one, i, job) for i, job in enumerate(jobs)]
+                for job, fut in zip(jobs, futures):
+                    try:
+                        results.append((fut.result(), None))
+                    except Exception as e:
+                        results.append((job["filename"], e))
+
+        # Rows go out in job order, whatever order the workers finished in.
+        order = {job["filename"]: i for i, job in enumerate(jobs)}
+        rows = sorted(rows, key=lambda r: order[r["filename"]])
+        with self._manifest_lock:
+            held = self._held.setdefault(folder, [])
+            held.extend(rows)
+            full = len(held) >= MANIFEST_HOLD_ROWS
+        if not hold_manifest or full:
+            self.flush_manifests(folder)
+        return results
+
+    def flush_manifests(self, folder: Optional[str] = None) -> int:
+        # One new part per folder with held rows (all folders by default). A
+        # retried job finds its file already stored; it still gets its row
+        # unless the folder's manifests already list that path. Rows whose
+        # write fails stay held for the next flush.
+        written = 0
+        with self._manifest_lock:
+            for f in [folder] if folder is not None else list(self._held):
+                rows = self._held.pop(f, [])
+                if not rows:
+                    continue
+                try:
+                    if f not in self._known:
+                        self._known[f] = self._manifest_paths(f)
+                    known = self._known[f]
+                    fresh: Dict[str, Dict[str, Any]] = {}
+                    for row in rows:
+                        if row["path"] not in known:
+                            fresh.setdefault(row["path"], row)
+                    if fresh:
+                        body = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in fresh.values())
+                        self._write_manifest(f, manifest_part_name(), body.encode("utf-8"))
+                except Exception:
+                    self._held[f] = rows + self._held.get(f, [])
+                    raise
+                known.update(fresh)
+                written += len(fresh)
+        return written
+
+class FilesystemStorage(FileTreeStorage):
+    # A local directory or NAS mount. Files are written next to their final
+    # name and renamed into place, so readers never see half a photo.
+    name = "fs"
+
+    def __init__(self, root: str):
+        super().__init__()
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def _stat(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb", buffering=0) as fh:
+            return stream_sha256(fh)
+
+    def _put(self, stream, size, mimetype, key, sha256, progress_cb):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{uuid.uuid4().hex}.part")
+        block = memoryview(bytearray(UPLOAD_READ_BLOCK))
+        sent = 0
+        try:
+            with open(tmp, "wb") as out:
+                stream.seek(0)
+                while True:
+                    n = stream.readinto(block)
+                    if not n:
+                        break
+                    out.write(block[:n])
+                    sent += n
+                    if progress_cb:
+                        progress_cb(sent, size)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _read_manifests(self, folder):
+        directory = self._path(folder)
+        contents = []
+        for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+            if is_manifest_name(name):
+                with open(os.path.join(directory, name), "rb") as fh:
+                    contents.append(fh.read())
+        return contents
+
+    def _write_manifest(self, folder, name, body):
+        path = self._path(f"{folder}/{name}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = os.path.join(os.path.dirname(path), f".{name}.{uuid.uuid4().hex}.part")
+        with open(tmp, "wb") as fh:
+            fh.write(body)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+
+class S3Storage(FileTreeStorage):
+    # An S3-compatible bucket (AWS, MinIO, ...). Large files go up as
+    # multipart uploads of UPLOAD_CHUNK_SIZE parts; each object carries its
+    # SHA-256 in its metadata. Credentials come from the usual AWS
+    # environment variables / config files.
+    name = "s3"
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None, region: Optional[str] = None):
+        super().__init__()
+        if not S3_AVAILABLE:
+            raise RuntimeError("The S3 storage backend needs boto3 (pip install boto3).")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        # boto3 clients are thread-safe; one serves every worker.
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None, region_name=region or None)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=UPLOAD_CHUNK_SIZE,
+            multipart_chunksize=max(UPLOAD_CHUNK_SIZE, 5 * 1024 * 1024),
+            # Progress callbacks then run on the calling worker, so a cancel
+            # raised from one stops the upload between parts.
+            use_threads=False,
+        )
+
+    def _stat(self, key: str) -> Optional[str]:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return head.get("Metadata", {}).get("sha256")
+
+    def _put(self, stream, size, mimetype, key, sha256, progress_cb):
+        sent = 0
+
+        def on_bytes(n: int):
+            nonlocal sent
+            sent += n
+            if progress_cb:
+                progress_cb(sent, size)
+
+        stream.seek(0)
+        self.client.upload_fileobj(
+            stream, self.bucket, self.prefix + key,
+            ExtraArgs={"ContentType": mimetype, "Metadata": {"sha256": sha256}},
+            Callback=on_bytes,
+            Config=self.transfer_config,
+        )
+
+    def _read_manifests(self, folder):
+        contents = []
+        pages = self.client.get_paginator("list_objects_v2").paginate(
+            Bucket=self.bucket, Prefix=f"{self.prefix}{folder}/manifest"
+        )
+        for page in pages:
+            for obj in page.get("Contents", []):
+                if is_manifest_name(obj["Key"].rsplit("/", 1)[-1]):
+                    contents.append(self.client.get_object(Bucket=self.bucket, Key=obj["Key"])["Body"].read())
+        return contents
+
+    def _write_manifest(self, folder, name, body):
+        # One new object per batch; nothing is read back and rewritten.
+        self.client.put_object(
+            Bucket=self.bucket, Key=f"{self.prefix}{folder}/{name}", Body=body, ContentType=MANIFEST_MIME
+        )
+
+def make_storage_backend(name: str) -> StorageBackend:
+    name = name.strip().lower()
+    if name == "drive":
+        return DriveStorage()
+    if name == "fs":
+        if not STORAGE_FS_ROOT:
+            raise RuntimeError("STORAGE_BACKEND=fs needs STORAGE_FS_ROOT.")
+        return FilesystemStorage(STORAGE_FS_ROOT)
+    if name == "s3":
+        if not S3_BUCKET:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs S3_BUCKET.")
+        return S3Storage(S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL, S3_REGION)
+    raise RuntimeError(f"Unknown storage backend {name!r} (drive, fs or s3).")
+
+@st.cache_resource(show_spinner=False)
+def get_storage_backend() -> StorageBackend:
+    return make_storage_backend(STORAGE_BACKEND)
+
+@st.cache_resource(show_spinner=False)
+def get_mirror_backend() -> Optional[StorageBackend]:
+    return make_storage_backend(STORAGE_MIRROR) if STORAGE_MIRROR else None
+
+def queue_mirror_uploads(
+    jobs: List[Dict[str, Any]],
+    zipcode: str,
+    tz_name: str,
+    date_str: str,
+) -> Optional[str]:
+    # Spools mirror copies of jobs already uploaded; the spool workers send
+    # them to the mirror at bulk priority and retry failures. Returns the
+    # spool set ID, or None if there is nothing to mirror.
+    if get_mirror_backend() is None or not jobs:
+        return None
+    try:
+        return get_upload_spool().enqueue(jobs, zipcode, tz_name, date_str, PRIORITY_BULK, backend="mirror")
+    except Exception as e:
+        storage_log.warning("Queueing mirror copies for %s/%s failed: %s", zipcode, date_str, e)
+        return None
+
+def upload_jobs_to_zip_date_folder(
+    jobs: List[Dict[str, Any]],
+    zipcode: str,
+    tz_name: str,
+    date_str: str,
+    max_workers: int = UPLOAD_WORKERS,
+    progress_cb: Optional[Callable[[int, int, int], None]] = None,
+    progress: Optional[UploadProgress] = None,
+) -> List[Tuple[str, Optional[Exception]]]:
+    # Uploads to the configured backend, then queues mirror copies of what
+    # made it there.
+    results = get_storage_backend().upload_jobs(jobs, zipcode, tz_name, date_str, max_workers, progress_cb, progress)
+    queue_mirror_uploads([job for job, (_, err) in zip(jobs, results) if err is None], zipcode, tz_name, date_str)
+    return results
+
+# -------------------------
+# Manifests
+# -------------------------
+manifest_log = logging.getLogger("weed_collector.manifest")
+
+class ManifestOutbox:
+    # Manifest rows recorded locally until flushed, and each folder's flushes
+    # since its last compaction.
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS rows (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    folder_id TEXT NOT NULL,
+                    row TEXT NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS rows_folder ON rows (folder_id)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS parts (folder_id TEXT PRIMARY KEY, n INTEGER NOT NULL DEFAULT 0)"
+            )
+
+    def add(self, folder_id: str, row: Dict[str, Any]):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO rows (folder_id, row) VALUES (?, ?)", (folder_id, json.dumps(row, default=str))
+            )
+
+    def pending(self, folder_id: str) -> List[Tuple[int, str]]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, row FROM rows WHERE folder_id = ? ORDER BY id", (folder_id,)
+            ).fetchall()
+
+    def pending_folders(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._db.execute("SELECT DISTINCT folder_id FROM rows").fetchall()]
+
+    def remove(self, row_ids: List[int]):
+        with self._lock:
+            self._db.executemany("DELETE FROM rows WHERE id = ?", [(i,) for i in row_ids])
+
+    def count_part(self, folder_id: str) -> int:
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO parts (folder_id, n) VALUES (?, 1) ON CONFLICT(folder_id) DO UPDATE SET n = n + 1",
+                (folder_id,)
+            )
+            return self._db.execute("SELECT n FROM parts WHERE folder_id = ?", (folder_id,)).fetchone()[0]
+
+    def reset_parts(self, folder_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM parts WHERE folder_id = ?", (folder_id,))
+
+@st.cache_resource(show_spinner=False)
+def get_manifest_outbox() -> ManifestOutbox:
+    return ManifestOutbox(MANIFEST_DB_PATH)
+
+@st.cache_resource(show_spinner=False)
+def get_manifest_lock() -> threading.Lock:
+    return threading.Lock()
+
+def record_upload(
+    job: Dict[str, Any],
+    created: Dict[str, Any],
+    derivatives: List[Dict[str, Any]],
+    folder_id: str,
+):
+    # Queues the job's manifest row; jobs without a "record" are not listed.
+    record = job.get("record")
+    if record is None:
+        return
+    row = dict(
+        record,
+        filename=job["filename"],
+        mimetype=job["mimetype"],
+        size=job.get("size"),
+        drive_file_id=created["id"],
+        duplicate_of=created.get("duplicate_of"),
+        derivatives=[{"px": d["px"], "name": d["name"], "drive_file_id": d["id"]} for d in derivatives],
+        uploaded_at=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    )
+    get_manifest_outbox().add(folder_id, row)
+
+def manifest_part_name() -> str:
+    return f"manifest-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{uuid.uuid4().hex[:8]}.jsonl"
+
+def is_manifest_name(name: str) -> bool:
+    return MANIFEST_PART_RE.fullmatch(name) is not None
+
+@timed("flush_manifest")
+def flush_manifest(folder_id: str, service=None) -> int:
+    # Writes the folder's pending rows as one new manifest part: a single
+    # create, however many rows are pending. A row can appear twice if the
+    # process dies between the create and clearing the outbox; readers key
+    # rows by drive_file_id. Returns rows written.
+    if service is None:
+        service = get_drive_service()
+    outbox = get_manifest_outbox()
+    with get_manifest_lock():
+        pending = outbox.pending(folder_id)
+        if not pending:
+            return 0
+        content = ("\n".join(row for _, row in pending) + "\n").encode("utf-8")
+        service.files().create(
+            body={"name": manifest_part_name(), "parents": [folder_id], "mimeType": MANIFEST_MIME},
+            media_body=MediaIoBaseUpload(io.BytesIO(content), mimetype=MANIFEST_MIME),
+            fields="id",
+            supportsAllDrives=True
+        ).execute(num_retries=UPLOAD_MAX_RETRIES)
+        outbox.remove([row_id for row_id, _ in pending])
+        if outbox.count_part(folder_id) >= MANIFEST_COMPACT_PARTS:
+            try:
+                compact_manifest(folder_id, service)
+                outbox.reset_parts(folder_id)
+            except Exception as e:
+                manifest_log.warning("Manifest compaction for folder %s failed: %s", folder_id, e)
+        return len(pending)
+
+@timed("compact_manifest")
+def compact_manifest(folder_id: str, service=None) -> int:
+    # Merges the folder's manifest files into one new MANIFEST_NAME (rows
+    # repeated across files are written once), then trashes the files it
+    # read. Files are only trashed once their rows are in the new file, so
+    # a concurrent flush or compaction can leave a duplicate, never a gap.
+    # Returns the number of files merged.
+    if service is None:
+        service = get_drive_service()
+    found = service.files().list(
+        q=f"'{folder_id}' in parents and name contains 'manifest' and trashed=false",
+        spaces="drive", fields="files(id,name)", orderBy="createdTime", pageSize=1000,
+        **drive_list_kwargs(get_parent_drive_id(service))
+    ).execute(num_retries=UPLOAD_MAX_RETRIES).get("files", [])
+    files = [f for f in found if is_manifest_name(f["name"])]
+    if len(files) < 2:
+        return 0
+
+    lines: Dict[bytes, None] = {}
+    for f in files:
+        content = service.files().get_media(fileId=f["id"], supportsAllDrives=True).execute(
+            num_retries=UPLOAD_MAX_RETRIES
+        )
+        lines.update((line, None) for line in content.splitlines() if line.strip())
+    content = b"".join(line + b"\n" for line in lines)
+    service.files().create(
+        body={"name": MANIFEST_NAME, "parents": [folder_id], "mimeType": MANIFEST_MIME},
+        media_body=MediaIoBaseUpload(io.BytesIO(content), mimetype=MANIFEST_MIME),
+        fields="id",
+        supportsAllDrives=True
+    ).execute(num_retries=UPLOAD_MAX_RETRIES)
+    trash = [
+        service.files().update(fileId=f["id"], body={"trashed": True}, fields="id", supportsAllDrives=True)
+        for f in files
+    ]
+    for _, err in execute_batch(trash, service):
+        # Already trashed by a concurrent compaction.
+        if err is not None and not is_not_found_error(err):
+            raise err
+    return len(files)
+
+def flush_pending_manifests(service=None):
+    # Best effort: rows that fail to flush stay in the outbox for next time.
+    for folder_id in get_manifest_outbox().pending_folders():
+        try:
+            flush_manifest(folder_id, service)
+        except Exception as e:
+            manifest_log.warning("Manifest flush for folder %s failed: %s", folder_id, e)
+
+# -------------------------
+# Catalog
+# -------------------------
+catalog_log = logging.getLogger("weed_collector.catalog")
+
+# make_filename() output: turf_grass_weed_height_YYYYMMDD_HHMMSS[_extras].ext.
+# Grass and weed slugs may themselves contain "_", so they only split
+# cleanly when there is exactly one "_" between them; the manifest has the
+# exact values.
+CAPTURE_NAME_RE = re.compile(
+    r"^(?P<turf>[A-Za-z0-9\-]+)_(?P<species>.+)_(?P<height>H1m|H50cm|H20cm)_"
+    r"(?P<ts>\d{8}_\d{6})(?P<extra>_[^.]*)?\.[A-Za-z0-9]+$"
+)
+DERIVATIVE_SUFFIX_RE = re.compile(r"_(\d+px)$")
+
+def catalog_slug(value: Optional[str], turf: bool = False) -> Optional[str]:
+    # Catalog fields use the filename slugs, so names and manifests agree.
+    if value is None:
+        return None
+    return slugify(value.replace(" ", "") if turf else value)
+
+def parse_capture_name(name: str) -> Optional[Dict[str, Any]]:
+    m = CAPTURE_NAME_RE.match(name)
+    if not m:
+        return None
+    species = m.group("species")
+    grass, weed = species.split("_") if species.count("_") == 1 else (None, None)
+    variant = DERIVATIVE_SUFFIX_RE.search(m.group("extra") or "")
+    return {
+        "turf_setting": m.group("turf"),
+        "grass_type": grass,
+        "weed_name": weed,
+        "species": species,
+        "height_tag": m.group("height"),
+        "set_timestamp": m.group("ts"),
+        "variant": variant.group(1) if variant else None,
+    }
+
+class CaptureCatalog:
+    # SQLite catalog of every capture under PARENT_FOLDER_ID. Rows come from
+    # filenames, overridden by manifest rows where the date folder has one.
+    # "folders" maps ZIP and date folder IDs so changes can be placed.
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS folders (
+                    folder_id TEXT PRIMARY KEY,
+                    parent_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    kind TEXT NOT NULL
+                )
+            """)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS captures (
+                    file_id TEXT PRIMARY KEY,
+                    folder_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    zipcode TEXT,
+                    date_str TEXT,
+                    turf_setting TEXT COLLATE NOCASE,
+                    grass_type TEXT COLLATE NOCASE,
+                    weed_name TEXT COLLATE NOCASE,
+                    species TEXT COLLATE NOCASE,
+                    height_tag TEXT,
+                    set_timestamp TEXT,
+                    variant TEXT,
+                    original_name TEXT,
+                    mimetype TEXT,
+                    size INTEGER,
+                    created_time TEXT,
+                    source TEXT NOT NULL,
+                    sha256 TEXT
+                )
+            """)
+            columns = {row["name"] for row in self._db.execute("PRAGMA table_info(captures)")}
+            if "sha256" not in columns:
+                self._db.execute("ALTER TABLE captures ADD COLUMN sha256 TEXT")
+            for columns in (
+                "zipcode, date_str",
+                "date_str",
+                "weed_name, turf_setting, height_tag, date_str",
+                "turf_setting, height_tag, date_str",
+                "height_tag, date_str",
+                "folder_id",
+            ):
+                index_name = "captures_" + columns.replace(", ", "_")
+                self._db.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON captures ({columns})")
+            self._db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+
+    def get_state(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def set_state(self, key: str, value: str):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+
+    def folder(self, folder_id: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM folders WHERE folder_id = ?", (folder_id,)).fetchone()
+        return dict(row) if row else None
+
+    def put_folder(self, folder_id: str, parent_id: str, name: str, kind: str):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO folders (folder_id, parent_id, name, kind) VALUES (?, ?, ?, ?)",
+                (folder_id, parent_id, name, kind)
+            )
+            # Renamed folders carry their captures' ZIP / date along.
+            if kind == "zip":
+                self._db.execute(
+                    "UPDATE captures SET zipcode = ? WHERE folder_id IN "
+                    "(SELECT folder_id FROM folders WHERE parent_id = ?)",
+                    (name, folder_id)
+                )
+            elif kind == "date":
+                self._db.execute("UPDATE captures SET date_str = ? WHERE folder_id = ?", (name, folder_id))
+
+    def remove(self, file_id: str):
+        # A removed folder takes everything below it along.
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM captures WHERE file_id = ?", (file_id,))
+            self._db.execute(
+                "DELETE FROM captures WHERE folder_id = ? OR folder_id IN "
+                "(SELECT folder_id FROM folders WHERE parent_id = ?)",
+                (file_id, file_id)
+            )
+            self._db.execute("DELETE FROM folders WHERE folder_id = ? OR parent_id = ?", (file_id, file_id))
+            self._db.execute("COMMIT")
+
+    def put_capture(self, row: Dict[str, Any]):
+        # Manifest rows are exact; a filename-derived row never replaces one.
+        columns = list(row)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c != "file_id")
+        guard = " WHERE captures.source != 'manifest'" if row["source"] != "manifest" else ""
+        with self._lock:
+            self._db.execute(
+                f"INSERT INTO captures ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT(file_id) DO UPDATE SET {updates}{guard}",
+                [row[c] for c in columns]
+            )
+
+    def reset(self):
+        with self._lock:
+            for table in ("folders", "captures", "state"):
+                self._db.execute(f"DELETE FROM {table}")
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM captures").fetchone()[0]
+
+    def query(
+        self,
+        zipcode: Optional[str] = None,
+        year: Optional[int] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        weed: Optional[str] = None,
+        grass: Optional[str] = None,
+        turf: Optional[str] = None,
+        height: Optional[str] = None,
+        include_variants: bool = False,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        # Dates are YYYYMMDD, inclusive. Weed and grass also match captures
+        # whose filename couldn't be split, by the end / start of "species".
+        where, args = [], []
+        if zipcode:
+            where.append("zipcode = ?")
+            args.append(zipcode)
+        if year:
+            date_from, date_to = max(date_from or "", f"{year}0101"), min(date_to or "99999999", f"{year}1231")
+        if date_from:
+            where.append("date_str >= ?")
+            args.append(date_from)
+        if date_to:
+            where.append("date_str <= ?")
+            args.append(date_to)
+        if weed:
+            slug = catalog_slug(weed)
+            where.append("(weed_name = ? OR (weed_name IS NULL AND species LIKE ? ESCAPE '\\'))")
+            args += [slug, "%\\_" + slug.replace("_", "\\_")]
+        if grass:
+            slug = catalog_slug(grass)
+            where.append("(grass_type = ? OR (grass_type IS NULL AND species LIKE ? ESCAPE '\\'))")
+            args += [slug, slug.replace("_", "\\_") + "\\_%"]
+        if turf:
+            where.append("turf_setting = ?")
+            args.append(catalog_slug(turf, turf=True))
+        if height:
+            where.append("height_tag = ?")
+            args.append(HEIGHT_MAP.get(height, height))
+        if not include_variants:
+            where.append("variant IS NULL")
+        sql = "SELECT * FROM captures"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY date_str, set_timestamp, height_tag"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, args).fetchall()]
+
+@st.cache_resource(show_spinner=False)
+def get_catalog() -> CaptureCatalog:
+    catalog = CaptureCatalog(CATALOG_PATH)
+    if CATALOG_SYNC_SEC > 0:
+        threading.Thread(target=catalog_sync_loop, args=(catalog,), name="catalog-sync", daemon=True).start()
+    return catalog
+
+def catalog_file_row(f: Dict[str, Any], folder: Dict[str, str], catalog: CaptureCatalog) -> Optional[Dict[str, Any]]:
+    parsed = parse_capture_name(f["name"])
+    if parsed is None:
+        return None
+    zip_folder = catalog.folder(folder["parent_id"])
+    return dict(
+        parsed,
+        file_id=f["id"],
+        folder_id=folder["folder_id"],
+        name=f["name"],
+        zipcode=zip_folder["name"] if zip_folder else None,
+        date_str=folder["name"],
+        mimetype=f.get("mimeType"),
+        size=int(f["size"]) if f.get("size") else None,
+        created_time=f.get("createdTime"),
+        sha256=f.get("sha256Checksum"),
+        source="filename",
+    )
+
+def load_manifest_into_catalog(manifest_id: str, folder: Dict[str, str], catalog: CaptureCatalog, service):
+    content = service.files().get_media(fileId=manifest_id, supportsAllDrives=True).execute()
+    for line in content.splitlines():
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if not entry.get("drive_file_id"):
+            continue
+        # A skipped duplicate points at the original's file, whose own row
+        # already describes it; a linked duplicate keeps its shortcut's ID.
+        if entry.get("duplicate_of") == entry["drive_file_id"]:
+            continue
+        base = {
+            "folder_id": folder["folder_id"],
+            "zipcode": entry.get("zipcode"),
+            "date_str": folder["name"],
+            "turf_setting": catalog_slug(entry.get("turf_setting"), turf=True),
+            "grass_type": catalog_slug(entry.get("grass_type")),
+            "weed_name": catalog_slug(entry.get("weed_name")),
+            "height_tag": entry.get("height_tag"),
+            "set_timestamp": entry.get("set_timestamp"),
+            "original_name": entry.get("original_name"),
+            "source": "manifest",
+        }
+        base["species"] = f"{base['grass_type']}_{base['weed_name']}"
+        catalog.put_capture(dict(
+            base, file_id=entry["drive_file_id"], name=entry.get("filename"), variant=None,
+            mimetype=entry.get("mimetype"), size=entry.get("size"),
+        ))
+        for d in entry.get("derivatives") or []:
+            catalog.put_capture(dict(
+                base, file_id=d["drive_file_id"], name=d["name"], variant=f"{d['px']}px",
+                mimetype="image/jpeg", size=None,
+            ))
+
+CATALOG_FILE_FIELDS = "id,name,mimeType,parents,trashed,size,createdTime,sha256Checksum"
+
+def apply_catalog_change(f: Dict[str, Any], catalog: CaptureCatalog, service):
+    # Places one changed file or folder; anything outside the
+    # PARENT/ZIP/date layout is dropped from the catalog.
+    if f.get("trashed"):
+        catalog.remove(f["id"])
+        return
+    parent_id = (f.get("parents") or [None])[0]
+    if f.get("mimeType") == FOLDER_MIME:
+        if parent_id == PARENT_FOLDER_ID:
+            catalog.put_folder(f["id"], parent_id, f["name"], "zip")
+            return
+        parent = catalog.folder(parent_id) if parent_id else None
+        if parent and parent["kind"] == "zip":
+            catalog.put_folder(f["id"], parent_id, f["name"], "date")
+            return
+        catalog.remove(f["id"])
+        return
+
+    folder = catalog.folder(parent_id) if parent_id else None
+    if folder is None or folder["kind"] != "date":
+        catalog.remove(f["id"])
+    elif is_manifest_name(f["name"]):
+        load_manifest_into_catalog(f["id"], folder, catalog, service)
+    else:
+        row = catalog_file_row(f, folder, catalog)
+        if row is not None:
+            catalog.put_capture(row)
+
+def bootstrap_catalog(catalog: CaptureCatalog, service) -> int:
+    # One full walk of PARENT/ZIP/date; afterwards only changes are read.
+    catalog.reset()
+    for zip_folder in list_children(PARENT_FOLDER_ID, service, folders_only=True):
+        catalog.put_folder(zip_folder["id"], PARENT_FOLDER_ID, zip_folder["name"], "zip")
+        for date_folder in list_children(zip_folder["id"], service, folders_only=True):
+            catalog.put_folder(date_folder["id"], zip_folder["id"], date_folder["name"], "date")
+            for f in list_children(date_folder["id"], service, fields=CATALOG_FILE_FIELDS):
+                apply_catalog_change(f, catalog, service)
+    return catalog.count()
+
+@timed("sync_catalog")
+def sync_catalog(service=None) -> Dict[str, Any]:
+    # First run: take a changes page token, then walk the tree once. Later
+    # runs read the Drive changes feed from the stored token.
+    if service is None:
+        service = get_drive_service()
+    catalog = get_catalog()
+    drive_id = get_parent_drive_id(service)
+    drive_kwargs = {"driveId": drive_id} if drive_id else {}
+    with catalog.sync_lock:
+        token = catalog.get_state("page_token")
+        if token is None:
+            start = service.changes().getStartPageToken(supportsAllDrives=True, **drive_kwargs).execute()
+            count = bootstrap_catalog(catalog, service)
+            catalog.set_state("page_token", start["startPageToken"])
+            catalog.set_state("synced_at", datetime.now(timezone.utc).isoformat(timespec="seconds"))
+            return {"mode": "bootstrap", "captures": count}
+
+        changes = 0
+        while True:
+            res = service.changes().list(
+                pageToken=token,
+                spaces="drive",
+                pageSize=1000,
+                fields=f"nextPageToken,newStartPageToken,changes(fileId,removed,file({CATALOG_FILE_FIELDS}))",
+                includeItemsFromAllDrives=True,
+                supportsAllDrives=True,
+                **drive_kwargs
+            ).execute()
+            items = res.get("changes", [])
+            # Folders first, so files created in a new folder on the same
+            # page can be placed.
+            items.sort(key=lambda c: (c.get("file") or {}).get("mimeType") != FOLDER_MIME)
+            for change in items:
+                if change.get("removed") or not change.get("file"):
+                    catalog.remove(change["fileId"])
+                else:
+                    apply_catalog_change(change["file"], catalog, service)
+            changes += len(items)
+            token = res.get("nextPageToken") or res.get("newStartPageToken")
+            # Stored per page, so an interrupted sync resumes where it stopped.
+            catalog.set_state("page_token", token)
+            if "newStartPageToken" in res:
+                break
+        catalog.set_state("synced_at", datetime.now(timezone.utc).isoformat(timespec="seconds"))
+        return {"mode": "changes", "changes": changes, "captures": catalog.count()}
+
+def catalog_sync_loop(catalog: CaptureCatalog):
+    service = None
+    while True:
+        try:
+            if service is None:
+                service = build_drive_service(get_drive_credentials())
+            sync_catalog(service)
+        except Exception as e:
+            catalog_log.warning("Catalog sync failed: %s", e)
+        time.sleep(CATALOG_SYNC_SEC)
+
+# -------------------------
+# Upload spool
+# -------------------------
+spool_log = logging.getLogger("weed_collector.spool")
+
+class UploadSpool:
+    # SQLite job table plus one payload file per job under SPOOL_DIR.
+    # Rows survive restarts. A job's backend is NULL for the configured
+    # storage backend or "mirror" for a copy to STORAGE_MIRROR. A job being
+    # uploaded holds a lease that the owning process renews (renew_leases);
+    # a job whose lease has expired (its process died) is claimed again like
+    # a pending one.
+    def __init__(self, db_path: str, payload_dir: str, lease_sec: float = SPOOL_LEASE_SEC):
+        os.makedirs(payload_dir, exist_ok=True)
+        self.payload_dir = payload_dir
+        self.lease_sec = lease_sec
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self.wakeup = threading.Event()
+        # Other processes may hold the write lock for a claim; wait for it.
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    set_id TEXT NOT NULL,
+                    zipcode TEXT NOT NULL,
+                    tz_name TEXT NOT NULL,
+                    date_str TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    mimetype TEXT NOT NULL,
+                    payload_path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    drive_file_id TEXT,
+                    priority INTEGER NOT NULL DEFAULT 1,
+                    record TEXT,
+                    progress TEXT,
+                    backend TEXT,
+                    lease_owner TEXT,
+                    lease_until REAL NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            # Queues created before job priorities, manifest records, leases,
+            # upload progress and mirror jobs existed. Their "uploading" rows
+            # get lease_until 0, i.e. expired.
+            columns = {row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")}
+            if "priority" not in columns:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT {PRIORITY_BULK}")
+            if "record" not in columns:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN record TEXT")
+            if "lease_owner" not in columns:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN lease_owner TEXT")
+                self._db.execute("ALTER TABLE jobs ADD COLUMN lease_until REAL NOT NULL DEFAULT 0")
+            if "progress" not in columns:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN progress TEXT")
+            if "backend" not in columns:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN backend TEXT")
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, next_attempt_at)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_set ON jobs (set_id)")
+        self.prune()
+
+    def enqueue(
+        self,
+        jobs: List[Dict[str, Any]],
+        zipcode: str,
+        tz_name: str,
+        date_str: str,
+        priority: int = PRIORITY_BULK,
+        backend: Optional[str] = None,
+    ) -> str:
+        # Payloads are fully on disk before the rows are committed, so a
+        # queued job always has its bytes. Workers take interactive jobs
+        # before bulk ones.
+        set_id = uuid.uuid4().hex
+        rows = []
+        for job in jobs:
+            payload_path = os.path.join(self.payload_dir, f"{set_id}_{len(rows)}.bin")
+            tmp_path = f"{payload_path}.tmp"
+            stream, size = open_upload_source(job["source"])
+            with open(tmp_path, "wb") as fh:
+                shutil.copyfileobj(stream, fh, UPLOAD_READ_BLOCK)
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmp_path, payload_path)
+            now = time.time()
+            record = job.get("record")
+            if record is not None:
+                record = json.dumps(dict(record, zipcode=zipcode, tz_name=tz_name, date_str=date_str), default=str)
+            rows.append((
+                set_id, zipcode, tz_name, date_str, job["filename"], job["mimetype"],
+                payload_path, size, priority, record, backend, now, now,
+            ))
+
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT INTO jobs (set_id, zipcode, tz_name, date_str, filename, mimetype, "
+                "payload_path, size, priority, record, backend, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._db.execute("COMMIT")
+        self.wakeup.set()
+        return set_id
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        # BEGIN IMMEDIATE takes SQLite's write lock before the SELECT, so two
+        # processes can't claim the same row.
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT * FROM jobs WHERE (status = 'pending' AND next_attempt_at <= ?) "
+                    "OR (status = 'uploading' AND lease_until < ?) ORDER BY priority, id LIMIT 1",
+                    (now, now)
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'uploading', attempts = attempts + 1, lease_owner = ?, "
+                        "lease_until = ?, updated_at = ? WHERE id = ?",
+                        (self.owner, now + self.lease_sec, now, row["id"])
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = dict(row)
+        job["attempts"] += 1
+        return job
+
+    def renew_leases(self):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE status = 'uploading' AND lease_owner = ?",
+                (time.time() + self.lease_sec, self.owner)
+            )
+
+    def save_progress(self, job_id: int, progress: Optional[Dict[str, Any]]):
+        # What a job already has in Drive ({"original", "derivatives"}), so a
+        # retry picks up after it instead of uploading it again.
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ? AND lease_owner = ?",
+                (json.dumps(progress) if progress is not None else None, time.time(), job_id, self.owner)
+            )
+
+    def _finish(self, job_id: int, sql: str, args: Tuple[Any, ...]) -> bool:
+        # Applies a final update to a job this process still holds. False if
+        # the lease ran out and another process has taken the job over.
+        with self._lock:
+            cur = self._db.execute(
+                f"UPDATE jobs SET {sql}, lease_owner = NULL, lease_until = 0, updated_at = ? "
+                "WHERE id = ? AND status = 'uploading' AND lease_owner = ?",
+                args + (time.time(), job_id, self.owner)
+            )
+        return cur.rowcount == 1
+
+    def mark_done(self, job_id: int, drive_file_id: Optional[str], payload_path: str):
+        if not self._finish(job_id, "status = 'done', drive_file_id = ?, last_error = NULL", (drive_file_id,)):
+            return
+        try:
+            os.remove(payload_path)
+        except OSError:
+            pass
+
+    def mark_retry(self, job_id: int, error: str, delay: float):
+        self._finish(
+            job_id, "status = 'pending', last_error = ?, next_attempt_at = ?", (error, time.time() + delay)
+        )
+
+    def mark_failed(self, job_id: int, error: str):
+        self._finish(job_id, "status = 'failed', last_error = ?", (error,))
+
+    def prune(self):
+        # Drops done jobs after SPOOL_KEEP_DONE_SEC and failed ones, with
+        # their payloads, after SPOOL_KEEP_FAILED_SEC.
+        now = time.time()
+        with self._lock:
+            expired = self._db.execute(
+                "SELECT id, payload_path FROM jobs WHERE (status = 'done' AND updated_at < ?) "
+                "OR (status = 'failed' AND updated_at < ?)",
+                (now - SPOOL_KEEP_DONE_SEC, now - SPOOL_KEEP_FAILED_SEC)
+            ).fetchall()
+            self._db.executemany("DELETE FROM jobs WHERE id = ?", [(row["id"],) for row in expired])
+        for row in expired:
+            try:
+                os.remove(row["payload_path"])
+            except OSError:
+                pass
+
+    def retry_failed(self) -> int:
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0, next_attempt_at = 0, updated_at = ? "
+                "WHERE status = 'failed'",
+                (time.time(),)
+            )
+        self.wakeup.set()
+        return cur.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = {"pending": 0, "uploading": 0, "done": 0, "failed": 0}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+    def outstanding(self, backend: Optional[str] = None, since: float = 0) -> int:
+        # Pending or uploading jobs for backend queued at or after since.
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'uploading') "
+                "AND backend IS ? AND created_at >= ?",
+                (backend, since)
+            ).fetchone()
+        return row[0]
+
+    def set_status(self, set_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT filename, status, attempts, last_error FROM jobs WHERE set_id = ? ORDER BY id",
+                (set_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+def spooled_job_dict(job: Dict[str, Any], fh: BinaryIO) -> Dict[str, Any]:
+    # A claimed spool row as an upload job reading from its open payload.
+    return {
+        "source": fh, "size": job["size"], "mimetype": job["mimetype"], "filename": job["filename"],
+        "record": json.loads(job["record"]) if job["record"] else None,
+    }
+
+def upload_spooled_job(job: Dict[str, Any], backend: StorageBackend) -> Dict[str, Any]:
+    # Non-Drive backends: one job through the backend's own upload loop. Its
+    # manifest row is held and written with the others when the spool idles.
+    with open(job["payload_path"], "rb") as fh:
+        (_, err), = backend.upload_jobs(
+            [spooled_job_dict(job, fh)], job["zipcode"], job["tz_name"], job["date_str"], max_workers=1,
+            hold_manifest=True,
+        )
+    if err is not None:
+        raise err
+    return {"id": f"{job['zipcode']}/{job['date_str']}/{job['filename']}"}
+
+def upload_spooled_drive_job(spool: UploadSpool, job: Dict[str, Any], service) -> Dict[str, Any]:
+    # One claimed job against Drive: original, derivatives, manifest row.
+    with drive_priority(job["priority"]):
+        _, date_folder_id, _ = ensure_zip_date_folder(
+            job["zipcode"], job["tz_name"], date_str=job["date_str"], service=service
+        )
+        # A retry skips what an earlier attempt already uploaded.
+        progress = json.loads(job["progress"]) if job["progress"] else {}
+        derivatives = progress.get("derivatives", [])
+
+        def keep(derivative: Dict[str, Any]):
+            derivatives.append(derivative)
+            spool.save_progress(job["id"], {"original": created, "derivatives": derivatives})
+
+        try:
+            created = progress.get("original")
+            if created is None:
+                with open(job["payload_path"], "rb") as fh:
+                    created = upload_bytes_to_drive(
+                        fh, job["mimetype"], job["filename"], date_folder_id, service=service
+                    )
+                spool.save_progress(job["id"], {"original": created, "derivatives": derivatives})
+            done = {d["px"] for d in derivatives}
+            upload_derivatives(
+                job["payload_path"], job["filename"], date_folder_id, service=service,
+                sizes=tuple(px for px in DERIVATIVE_SIZES if px not in done), on_uploaded=keep,
+            )
+        except HttpError as e:
+            if is_not_found_error(e):
+                # The folder is gone, and what was uploaded with it.
+                get_folder_cache().invalidate_id(date_folder_id)
+                spool.save_progress(job["id"], None)
+            raise
+    if job["record"]:
+        record_upload(dict(job, record=json.loads(job["record"])), created, derivatives, date_folder_id)
+    return created
+
+_spool_local = threading.local()
+
+def spool_drive_service():
+    # Worker threads have no Streamlit session; each builds its own client.
+    if getattr(_spool_local, "service", None) is None:
+        _spool_local.service = build_drive_service(get_drive_credentials())
+    return _spool_local.service
+
+def run_spool_job(spool: UploadSpool, job: Dict[str, Any]):
+    # Uploads one claimed job and marks it done, pending again or failed.
+    try:
+        if job["backend"] == "mirror":
+            mirror = get_mirror_backend()
+            if mirror is None:
+                raise RuntimeError("Mirror job queued, but STORAGE_MIRROR is not set.")
+            created = upload_spooled_job(job, mirror)
+        else:
+            backend = get_storage_backend()
+            if isinstance(backend, DriveStorage):
+                created = upload_spooled_drive_job(spool, job, spool_drive_service())
+            else:
+                created = upload_spooled_job(job, backend)
+            if get_mirror_backend() is not None:
+                # The copy is a job of its own, taken after the queued uploads.
+                with open(job["payload_path"], "rb") as fh:
+                    spool.enqueue(
+                        [spooled_job_dict(job, fh)], job["zipcode"], job["tz_name"], job["date_str"],
+                        PRIORITY_BULK, backend="mirror",
+                    )
+        spool.mark_done(job["id"], created.get("id"), job["payload_path"])
+    except Exception as e:
+        retryable = is_transient_error(e) or is_not_found_error(e)
+        if retryable and job["attempts"] < SPOOL_MAX_ATTEMPTS:
+            spool.mark_retry(job["id"], str(e), backoff_delay(job["attempts"], base=2.0, cap=300.0))
+        else:
+            spool.mark_failed(job["id"], str(e))
+
+def flush_spool_manifests():
+    # Manifest rows of finished spool jobs: Drive's wait in the outbox,
+    # file-tree backends hold theirs.
+    if get_manifest_outbox().pending_folders():
+        flush_pending_manifests(spool_drive_service())
+    for backend in (get_storage_backend(), get_mirror_backend()):
+        if backend is not None:
+            backend.flush_manifests()
+
+def spool_worker_loop(spool: UploadSpool):
+    # Nothing may end the thread: a failed iteration (SQLite busy, no Drive
+    # credentials yet, ...) is logged and retried after a backoff.
+    failures = 0
+    while True:
+        try:
+            job = spool.claim_next()
+            if job is None:
+                # Idle: write out manifest rows from the jobs just finished.
+                flush_spool_manifests()
+                spool.wakeup.wait(timeout=2.0)
+                spool.wakeup.clear()
+            else:
+                run_spool_job(spool, job)
+            failures = 0
+        except Exception as e:
+            failures += 1
+            spool_log.warning("Spool worker iteration failed: %s", e)
+            time.sleep(backoff_delay(failures, base=2.0, cap=60.0))
+
+def spool_lease_loop(spool: UploadSpool):
+    # Keeps this process's leases alive while its workers upload, and prunes
+    # old jobs about once an hour.
+    last_prune = time.monotonic()
+    while True:
+        time.sleep(spool.lease_sec / 4)
+        try:
+            spool.renew_leases()
+            if time.monotonic() - last_prune > 3600:
+                spool.prune()
+                last_prune = time.monotonic()
+        except Exception as e:
+            spool_log.warning("Spool lease renewal failed: %s", e)
+
+# One spool and one set of worker threads per server process; they keep
+# draining the queue after the submitting session has gone away.
+@st.cache_resource(show_spinner=False)
+def get_upload_spool() -> UploadSpool:
+    spool = UploadSpool(SPOOL_DB_PATH, SPOOL_DIR)
+    threading.Thread(target=spool_lease_loop, args=(spool,), name="upload-spool-lease", daemon=True).start()
+    for i in range(SPOOL_WORKERS):
+        threading.Thread(
+            target=spool_worker_loop, args=(spool,), name=f"upload-spool-{i}", daemon=True
+        ).start()
+    return spool
+
+# -------------------------
+# Capture store
+# -------------------------
+class CaptureStore:
+    # Handle -> image bytes, backed by one file per capture. A file's mtime is
+    # its last use; sweep() drops files idle longer than idle_ttl_sec.
+    def __init__(self, directory: str, memory_budget: int, idle_ttl_sec: int):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self.idle_ttl_sec = idle_ttl_sec
+        self._lock = threading.Lock()
+        self._hot: "OrderedDict[str, bytes]" = OrderedDict()
+        self._hot_bytes = 0
+        self._last_sweep = 0.0
+        self.sweep()
+
+    def _path(self, handle: str) -> str:
+        return os.path.join(self.directory, f"{handle}.bin")
+
+    def _remember(self, handle: str, data: bytes):
+        if len(data) > self.memory_budget:
+            return
+        self._hot[handle] = data
+        self._hot_bytes += len(data)
+        while self._hot_bytes > self.memory_budget:
+            _, evicted = self._hot.popitem(last=False)
+            self._hot_bytes -= len(evicted)
+
+    def _forget(self, handle: str):
+        data = self._hot.pop(handle, None)
+        if data is not None:
+            self._hot_bytes -= len(data)
+
+    def put(self, data: bytes) -> str:
+        handle = uuid.uuid4().hex
+        tmp_path = f"{self._path(handle)}.tmp"
+        with open(tmp_path, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp_path, self._path(handle))
+        with self._lock:
+            self._remember(handle, data)
+        if time.time() - self._last_sweep > 60:
+            self.sweep()
+        return handle
+
+    def get(self, handle: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._hot.get(handle)
+            if data is not None:
+                self._hot.move_to_end(handle)
+        if data is None:
+            try:
+                with open(self._path(handle), "rb") as fh:
+                    data = fh.read()
+            except OSError:
+                return None
+            with self._lock:
+                self._remember(handle, data)
+        self.touch(handle)
+        return data
+
+    def touch(self, handle: str):
+        try:
+            os.utime(self._path(handle))
+        except OSError:
+            pass
+
+    def delete(self, handle: str):
+        with self._lock:
+            self._forget(handle)
+        try:
+            os.remove(self._path(handle))
+        except OSError:
+            pass
+
+    def sweep(self):
+        self._last_sweep = time.time()
+        cutoff = self._last_sweep - self.idle_ttl_sec
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    with self._lock:
+                        self._forget(entry.name.split(".", 1)[0])
+            except OSError:
+                pass
+
+@st.cache_resource(show_spinner=False)
+def get_capture_store() -> CaptureStore:
+    return CaptureStore(CAPTURE_DIR, CAPTURE_MEMORY_BUDGET, CAPTURE_IDLE_TTL_SEC)
+
+# -------------------------
+# Upload jobs
+# -------------------------
+def build_set_jobs(
+    sets: List[List[Any]],
+    set_timestamps: List[str],
+    turf_setting: str,
+    grass_type: str,
+    weed_name: str,
+) -> List[Dict[str, Any]]:
+    # Each set lists its files in 1 m / 50 cm / 20 cm order. Jobs reference
+    # the uploaded files themselves; their bytes are only read while
+    # uploading or spooling. "date_str" is the set's date folder.
+    jobs = []
+    for group, set_ts in zip(sets, set_timestamps):
+        for (_, height_tag), f in zip(HEIGHTS, group):
+            mimetype = f.type or "application/octet-stream"
+
+            filename = make_filename(
+                turf_setting=turf_setting,
+                grass_type=grass_type,
+                weed_name=weed_name,
+                height_tag=height_tag,
+                mimetype=mimetype,
+                set_timestamp=set_ts,
+                original_name=f.name,
+                meta=None,
+            )
+            jobs.append({
+                "source": f, "size": f.size, "mimetype": mimetype,
+                "filename": filename, "date_str": set_ts.split("_")[0],
+                "record": make_manifest_record(
+                    turf_setting, grass_type, weed_name, height_tag, set_ts, original_name=f.name
+                ),
+            })
+    return jobs
+
+def build_batch_jobs(
+    files: List[Any],
+    turf_setting: str,
+    grass_type: str,
+    weed_name: str,
+    base_dt: datetime,
+) -> List[Dict[str, Any]]:
+    # 3N batch: files come in 1 m / 50 cm / 20 cm order per set, and set s
+    # is stamped base_dt + s seconds.
+    sets = [files[i:i + 3] for i in range(0, len(files) // 3 * 3, 3)]
+    set_timestamps = [
+        (base_dt + timedelta(seconds=s)).strftime("%Y%m%d_%H%M%S") for s in range(len(sets))
+    ]
+    return build_set_jobs(sets, set_timestamps, turf_setting, grass_type, weed_name)
+
+def probe_capture_times(files: List[Any], cache: Optional[Dict[Any, Optional[datetime]]] = None) -> List[Optional[datetime]]:
+    # EXIF capture time per file from a header-only probe; cache (keyed by
+    # upload ID and size) saves re-probing a camera roll on every rerun.
+    cache = {} if cache is None else cache
+    times = []
+    for f in files:
+        key = (getattr(f, "file_id", None) or f.name, f.size)
+        if key not in cache:
+            meta = probe_image_metadata(f)
+            cache[key] = meta["captured_at"] if meta else None
+        times.append(cache[key])
+    return times
+
+def group_sets_by_capture_time(
+    files: List[Any],
+    captured: List[Optional[datetime]],
+    gap_sec: float = SET_GAP_SEC,
+) -> Tuple[List[List[Any]], List[datetime], List[List[Any]], List[Any]]:
+    # Returns (sets, set_times, incomplete_bursts, undated_files). Dated
+    # files are sorted by (capture time, name) and split into bursts at gaps
+    # longer than gap_sec; a burst of 3k shots becomes k sets in shot order,
+    # any other burst is left for the user to sort out.
+    dated = sorted(
+        ((t, f) for t, f in zip(captured, files) if t is not None),
+        key=lambda item: (item[0], item[1].name),
+    )
+    undated = [f for t, f in zip(captured, files) if t is None]
+
+    bursts: List[List[Tuple[datetime, Any]]] = []
+    for item in dated:
+        if bursts and (item[0] - bursts[-1][-1][0]).total_seconds() <= gap_sec:
+            bursts[-1].append(item)
+        else:
+            bursts.append([item])
+
+    sets, set_times, incomplete = [], [], []
+    for burst in bursts:
+        if len(burst) % 3:
+            incomplete.append([f for _, f in burst])
+            continue
+        for i in range(0, len(burst), 3):
+            sets.append([f for _, f in burst[i:i + 3]])
+            set_times.append(burst[i][0])
+    return sets, set_times, incomplete, undated
+
+def unique_set_timestamps(set_times: List[datetime]) -> List[str]:
+    # Set timestamps are whole seconds and part of every filename; two sets
+    # shot within the same second get consecutive seconds instead.
+    stamps = []
+    previous = None
+    for t in set_times:
+        t = t.replace(microsecond=0)
+        if previous is not None and t <= previous:
+            t = previous + timedelta(seconds=1)
+        stamps.append(t.strftime("%Y%m%d_%H%M%S"))
+        previous = t
+    return stamps
+
+# -------------------------
+# Local ingest
+# -------------------------
+class LocalPhoto(io.RawIOBase):
+    # A photo on disk with the surface the upload jobs expect from Streamlit's
+    # UploadedFile (name, type, size, seekable reads). The file is opened on
+    # first use and release() closes it again until the next read.
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.file_id = os.path.abspath(path)
+        self.size = os.path.getsize(path)
+        ext = os.path.splitext(path)[1].lower()
+        self.type = "image/heic" if ext in (".heic", ".heif") else (
+            mimetypes.guess_type(path)[0] or "application/octet-stream"
+        )
+        self._fh: Optional[BinaryIO] = None
+
+    def _file(self) -> BinaryIO:
+        if self._fh is None:
+            self._fh = open(self.path, "rb", buffering=0)
+        return self._fh
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._file().tell()
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._file().seek(offset, whence)
+
+    def readinto(self, buffer) -> int:
+        return self._file().readinto(buffer)
+
+    def release(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+def list_local_photos(directory: str, recursive: bool = False) -> List[LocalPhoto]:
+    # Image files by name, which is shot order for camera-numbered files.
+    # Hidden files (e.g. macOS "._" sidecars) are left out.
+    paths = []
+    for root, dirs, names in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        paths += [
+            os.path.join(root, name) for name in names
+            if not name.startswith(".") and name.lower().endswith(IMAGE_EXTENSIONS)
+        ]
+        if not recursive:
+            break
+    return [LocalPhoto(p) for p in sorted(paths, key=lambda p: (os.path.basename(p), p))]
+
+def plan_local_ingest(
+    photos: List[LocalPhoto],
+    turf_setting: str,
+    grass_type: str,
+    weed_name: str,
+    tz_name: str,
+    group_by_exif: bool = True,
+) -> Tuple[List[Dict[str, Any]], List[List[LocalPhoto]], List[LocalPhoto]]:
+    # Same grouping and filenames as the batch tab. Returns (jobs,
+    # incomplete_bursts, undated_files); in file order mode the leftover
+    # photos after the last full set come back as one incomplete burst.
+    if group_by_exif:
+        captured = probe_capture_times(photos)
+        for photo in photos:
+            photo.release()
+        sets, set_times, incomplete, undated = group_sets_by_capture_time(photos, captured)
+        jobs = build_set_jobs(sets, unique_set_timestamps(set_times), turf_setting, grass_type, weed_name)
+        return jobs, incomplete, undated
+
+    leftover = photos[len(photos) // 3 * 3:]
+    jobs = build_batch_jobs(photos, turf_setting, grass_type, weed_name, datetime.now(ZoneInfo(tz_name)))
+    return jobs, [leftover] if leftover else [], []
+
+def ingest_jobs(
+    jobs: List[Dict[str, Any]],
+    zipcode: str,
+    tz_name: str,
+    max_workers: int = UPLOAD_WORKERS,
+    batch_files: int = INGEST_BATCH_FILES,
+    on_batch: Optional[Callable[[str, List[Tuple[str, Optional[Exception]]]], None]] = None,
+    progress: Optional[UploadProgress] = None,
+) -> List[Tuple[str, Optional[Exception]]]:
+    # Uploads to the storage backend directly (only mirror copies go
+    # through the spool) at bulk priority, date folder by date folder, in
+    # passes of batch_files; on_batch(date_str, results) runs after each
+    # pass. Once progress is cancelled, the passes left are skipped.
+    jobs_by_date: Dict[str, List[Dict[str, Any]]] = {}
+    for job in jobs:
+        jobs_by_date.setdefault(job["date_str"], []).append(job)
+
+    results: List[Tuple[str, Optional[Exception]]] = []
+    with drive_priority(PRIORITY_BULK):
+        for date_str, date_jobs in jobs_by_date.items():
+            for start in range(0, len(date_jobs), max(1, batch_files)):
+                batch = date_jobs[start:start + max(1, batch_files)]
+                if progress is not None and progress.cancelled:
+                    cancelled = UploadCancelled("Upload cancelled")
+                    for job in batch:
+                        progress.finish_file(job["filename"], cancelled)
+                    results += [(job["filename"], cancelled) for job in batch]
+                    continue
+                try:
+                    batch_results = upload_jobs_to_zip_date_folder(
+                        batch, zipcode, tz_name, date_str, max_workers=max_workers, progress=progress
+                    )
+                finally:
+                    for job in batch:
+                        if isinstance(job["source"], LocalPhoto):
+                            job["source"].release()
+                results += batch_results
+                if on_batch:
+                    on_batch(date_str, batch_results)
+    return results